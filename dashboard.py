@@ -1,5 +1,6 @@
 import base64
 import io
+import os
 
 import numpy as np
 import pandas as pd
@@ -12,6 +13,7 @@ from requests import api
 from portfolio_analysis.api import apikey
 from portfolio_analysis.data import (
     get_all_company_tickers,
+    get_ticker_universe,
     get_balance_statement,
     get_cash_flow_statement,
     get_company_outlook,
@@ -25,6 +27,13 @@ from portfolio_analysis.data import (
     get_stock_peers,
 )
 from portfolio_analysis.dcf import get_irr, get_dividend_ratio
+from portfolio_analysis.screen import load_screen_csv, load_screen_frame, memory_report, prepare_screen
+from portfolio_analysis.sink import ResultSink, run_dir
+from portfolio_analysis.store import get_store
+from portfolio_analysis.transport import ARROW_SUFFIX, GCSBackend, Mirror
+
+# Seconds a mirrored screen is served before the bucket is asked for a newer one
+MIRROR_MAX_AGE = 60
 
 # https://www.youtube.com/watch?v=0ESc1bh3eIg&ab_channel=PartTimeLarry
 
@@ -63,8 +72,8 @@ def run_analysis(company_names, exchange, apikey):
         data = blob.download_as_string()
         irr_df = pd.read_csv(io.BytesIO(data))
     except FileNotFoundError:
-        failed_companies = pd.DataFrame()
-        irr_df = pd.DataFrame()
+        irr_sink = ResultSink(run_dir(f"irr_{month}_{exchange}"))
+        failed_sink = ResultSink(run_dir(f"irr_{month}_{exchange}_failed"))
         for index, company in company_names[
             company_names.exchange == exchange
         ].iterrows():
@@ -80,37 +89,66 @@ def run_analysis(company_names, exchange, apikey):
                     company_data["CFR"],
                 )
             except KeyError as e:
-                failed_companies = failed_companies.append(company, ignore_index=True)
+                failed_sink.append(company)
                 print(e)
                 continue
-            irr_df = irr_df.append(irr, ignore_index=True)
-        failed_companies.to_csv(
-            f"./excels/{exchange}_{month}_failed.csv",
-            index=False,
-        )
-        irr_df.to_csv(
-            f"./excels/{exchange}_{month}.csv",
-            index=False,
-        )
+            irr_sink.append(irr)
+        failed_companies = failed_sink.to_frame()
+        irr_df = irr_sink.to_frame()
+        failed_companies["exchange"] = exchange
+        irr_df["exchange"] = exchange
+        get_store().write_screen(f"irr_{month}_failed", failed_companies)
+        get_store().write_screen(f"irr_{month}", irr_df)
+        irr_sink.clear()
+        failed_sink.clear()
 
     return irr_df
 
 # https://discuss.streamlit.io/t/secrets-management-unhashable-in-st-cache/15409/3
 # https://docs.streamlit.io/library/advanced-features/caching
 @st.cache(hash_funcs={"_thread.RLock": lambda _: None, "builtins.weakref": lambda _: None}, allow_output_mutation=True)
-def get_data_from_cloud(filename):
-    bucket_name = "robostock"
+def get_mirror():
+    """On-disk mirror of the bucket, shared by every session and process on the host."""
     credentials = service_account.Credentials.from_service_account_info(
         st.secrets["gcp_service_account"]
     )
     storage_client = storage.Client(credentials=credentials)
+    return Mirror(GCSBackend("robostock", client=storage_client), max_age=MIRROR_MAX_AGE)
+
+
+def screen_version(filename):
+    """Mirrored object and version of a screen, the .arrow copy if one was published."""
+    mirror = get_mirror()
+    # Published with transport.publish, name.arrow next to name.csv
+    name = os.path.splitext(filename)[0] + ARROW_SUFFIX
+    try:
+        return name, mirror.version(name)
+    except FileNotFoundError:
+        return filename, mirror.version(filename)
 
-    source_blob_name = filename
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(source_blob_name)
-    data = blob.download_as_string()
-    irr_df = pd.read_csv(io.BytesIO(data))
-    return irr_df
+
+# Keyed by version, so a new publish is a new entry rather than waiting out a ttl
+@st.cache(max_entries=8, hash_funcs={"_thread.RLock": lambda _: None, "builtins.weakref": lambda _: None}, allow_output_mutation=True)
+def read_screen(name, version):
+    mirror = get_mirror()
+    if name.endswith(ARROW_SUFFIX):
+        return load_screen_frame(mirror.read_frame(name))
+    with open(mirror.path(name), "rb") as f:
+        return load_screen_csv(f)
+
+
+def get_data_from_cloud(filename):
+    return read_screen(*screen_version(filename))
+
+
+@st.cache(max_entries=8, hash_funcs={"_thread.RLock": lambda _: None, "builtins.weakref": lambda _: None}, allow_output_mutation=True)
+def prepared_screen(name, version):
+    return prepare_screen(read_screen(name, version))
+
+
+def get_screen(filename):
+    """Ranked, compact screen shared by every session; filter it, don't modify it."""
+    return prepared_screen(*screen_version(filename))
 
 
 # https://www.datapine.com/blog/financial-graphs-and-charts-examples/
@@ -190,21 +228,13 @@ def run_dashboard():
         # exchanges = company_names.exchange.unique()
         try:
             if option == "Stock Screener":
-                irr_df_cache = get_data_from_cloud(filename="AllCompanies_December.csv")
+                irr_df = get_screen(filename="AllCompanies_December.csv")
             elif option == "Magic Formula Companies":
-                irr_df_cache = get_data_from_cloud(filename="mf_company_analysis.csv")
+                irr_df = get_screen(filename="mf_company_analysis.csv")
         except Exception as e:
             st.write(e)
-        irr_df = irr_df_cache.copy()
-        remove_unnamed_columns = [col for col in irr_df.columns if col[:7] != "Unnamed"]
-        irr_df = irr_df[remove_unnamed_columns]
-        irr_df.replace([np.inf, -np.inf], np.nan, inplace=True)
-        irr_df = irr_df.sort_values("ROC", ascending=False)
-        irr_df["ROC_rank"] = [x for x in range(1, len(irr_df) + 1)]
-        irr_df = irr_df.sort_values("EarningsYield", ascending=False)
-        irr_df["EarningsYield_rank"] = [x for x in range(1, len(irr_df) + 1)]
-        irr_df["Total_rank"] = irr_df["ROC_rank"] + irr_df["EarningsYield_rank"]
-        irr_df = irr_df.sort_values("Total_rank")
+        with st.sidebar.expander("Screen memory"):
+            st.dataframe(memory_report(irr_df))
         mcap_filter = st.sidebar.number_input(
             "Filter for MarketCap in billion$", min_value=0.0, max_value=100.0
         )
@@ -220,10 +250,6 @@ def run_dashboard():
             "Filter for P/E", min_value=0.0, max_value=100.0
         )
         st.sidebar.write("Min P/E", pe_filter)
-        # Replace NA PEs with 404
-        irr_df["PE"] = irr_df["PE"].fillna(404)
-        irr_df["MCap"] = irr_df["MCap"].fillna(404)
-        irr_df["ROC"] = irr_df["ROC"].fillna(404)
         # irr_df = irr_df.merge(company_names[["symbol", "exchange"]], on="symbol")
         exchanges = list(irr_df["exchange"].unique())
         exchanges.insert(0, "None")
@@ -236,13 +262,6 @@ def run_dashboard():
         cols = st.sidebar.multiselect(
             "Exclude Sectors", irr_df.sector.unique(), default=[sector for sector in exclude_sectors if sector in irr_df.sector.unique()]
         )
-        # Rearrange columns
-        column_order = ["symbol","name","price","npv_regression","npv_mean","dividend_ratio","ROC","EarningsYield","revenue_trend","revenue_change", "PE","eps_base"]
-        for column in irr_df.columns:
-            if column not in column_order:
-                column_order += [f"{column}"]
-        irr_df = irr_df[column_order]
-        irr_df["sector"] = irr_df["sector"].fillna("Nan")
         all_sectors = list(irr_df.sector.unique())
         all_sectors.sort()
         all_sectors.insert(0, "ALL")
@@ -260,7 +279,8 @@ def run_dashboard():
                 & (irr_df.sector == sector_dropdown)
             ]
         
-        filtered_df["revenue_flag"] = filtered_df.revenue_change.apply()
+        # Revenue grew 3 years running, from the vectorised revenue_change series
+        filtered_df = filtered_df.assign(revenue_flag=filtered_df.revenue_growth_years >= 3)
             
         dividend_only = st.checkbox('Dividend Stocks Only')
         declining_revenue = st.checkbox('Declining revenue')
@@ -373,11 +393,12 @@ def run_dashboard():
             """
 
     elif option == "Stock DeepDive":
-        company_names = get_all_company_tickers(apikey)
+        universe = get_ticker_universe(apikey)
+        company_names = universe.frame
         ticker = st.sidebar.text_input("Enter a ticker to analyse", value="AAPL")
         
         st.subheader(ticker.upper())
-        company = company_names[company_names.symbol == ticker]
+        company = universe.rows([ticker])
         company
         company_data = get_single_company_data(ticker, apikey)
         for index, comp in company.iterrows():
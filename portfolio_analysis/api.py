@@ -1,2 +1,5 @@
-apikey = "a087840271e9941a62305609acde3ca4"
-fred_apikey = "44c5e0943e8ccc3c7080d8ae3090d45e"
+import os
+
+# Set FMP_APIKEY / FRED_APIKEY to use your own keys, any value works against the offline stand-in
+apikey = os.environ.get("FMP_APIKEY", "a087840271e9941a62305609acde3ca4")
+fred_apikey = os.environ.get("FRED_APIKEY", "44c5e0943e8ccc3c7080d8ae3090d45e")
@@ -0,0 +1,156 @@
+"""
+Whole-universe fundamentals from FMP's bulk CSV downloads.
+
+Each bulk file holds one statement type for every company for one year, so a
+full refresh is a request per statement per year plus one each for profiles
+and TTM ratios, instead of six requests per symbol. The CSVs are streamed in
+chunks straight off the socket, filtered to the wanted symbols and split into
+per-symbol frames typed with the same schemas as the per-symbol endpoints.
+"""
+
+import datetime
+
+import pandas as pd
+
+from portfolio_analysis.client import get_client
+from portfolio_analysis.schemas import CATEGORY, SCHEMAS, STR, decode_frame
+
+# company data key -> (bulk endpoint, schema)
+BULK_STATEMENTS = {
+    "IS": ("income-statement-bulk", "income"),
+    "BS": ("balance-sheet-statement-bulk", "balance"),
+    "CFS": ("cash-flow-statement-bulk", "cash-flow"),
+}
+BULK_PROFILES = "profile/all"
+BULK_RATIOS = "ratios-ttm-bulk"
+# Statement years pulled by default, dcf looks back at most this far
+BULK_YEARS = 10
+CSV_CHUNK_ROWS = 50000
+
+
+class BulkUnavailable(Exception):
+    """A bulk file came back as something other than CSV, e.g. FMP's json error on plans without bulk access."""
+
+
+def bulk_years(years=BULK_YEARS, today=None):
+    """
+    The current calendar year and the `years` completed ones before it, newest first.
+    The current year is included for fiscal years that end and get filed early in it.
+    """
+    today = today or datetime.date.today()
+    return [today.year - i for i in range(years + 1)]
+
+
+def read_bulk_csv(url, schema_name=None, symbols=None, chunksize=CSV_CHUNK_ROWS):
+    """
+    Stream a bulk CSV in chunks.
+    args:
+        schema_name: only keep columns in this schema (plus symbol), None keeps all
+        symbols: only keep rows for these symbols, None keeps all
+    yields:
+        DataFrame chunks
+    """
+    schema = SCHEMAS.get(schema_name, {})
+    # Read the string fields as strings, dcf slices dates and calendarYear
+    dtype = {field: str for field, kind in schema.items() if kind in (STR, CATEGORY)}
+    dtype["symbol"] = str
+    # Some bulk files capitalise their headers
+    names = {field.lower(): field for field in schema}
+    names["symbol"] = "symbol"
+
+    def usecols(column):
+        return not schema or column.lower() in names
+
+    response = get_client().get(url, stream=True)
+    try:
+        response.raise_for_status()
+        if "json" in response.headers.get("Content-Type", ""):
+            raise BulkUnavailable(f"{url.split('?')[0]} answered with json, not CSV")
+        response.raw.decode_content = True
+        try:
+            for chunk in pd.read_csv(response.raw, chunksize=chunksize, dtype=dtype, usecols=usecols):
+                chunk.columns = [names.get(column.lower(), column) for column in chunk.columns]
+                if "symbol" not in chunk.columns:
+                    raise BulkUnavailable(f"{url.split('?')[0]} has no symbol column")
+                if symbols is not None:
+                    chunk = chunk[chunk["symbol"].isin(symbols)]
+                if len(chunk):
+                    yield chunk
+        except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+            raise BulkUnavailable(f"{url.split('?')[0]} is not a CSV: {e}")
+    finally:
+        response.close()
+
+
+def split_by_symbol(chunks, schema_name, sort_by="date"):
+    """
+    Group streamed chunks into one typed frame per symbol.
+    returns:
+        {symbol: DataFrame}, newest first when sort_by is date
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return {}
+    frame = pd.concat(chunks, ignore_index=True)
+    if sort_by in frame.columns:
+        frame = frame.sort_values(["symbol", sort_by], ascending=[True, False], kind="mergesort")
+    return {
+        symbol: decode_frame(group.reset_index(drop=True), schema_name)
+        for symbol, group in frame.groupby("symbol", sort=False)
+    }
+
+
+def statement_url(base_url, statement, year, period="annual", apikey=""):
+    endpoint, _ = BULK_STATEMENTS[statement]
+    return f"{base_url}/api/v4/{endpoint}?year={year}&period={period}&apikey={apikey}"
+
+
+def load_bulk_statement(base_url, statement, symbols=None, years=None, period="annual", apikey=""):
+    """
+    One statement type for many symbols, a bulk request per year.
+    args:
+        statement: IS, BS or CFS
+        years: calendar years, defaults to bulk_years()
+    returns:
+        {symbol: typed DataFrame}
+    raises:
+        BulkUnavailable or requests.HTTPError if any completed year's file can't
+        be read, a statement missing some years would pass as covered
+    """
+    _, schema_name = BULK_STATEMENTS[statement]
+    chunks = []
+    this_year = datetime.date.today().year
+    for year in years or bulk_years():
+        url = statement_url(base_url, statement, year, period=period, apikey=apikey)
+        try:
+            chunks += list(read_bulk_csv(url, schema_name, symbols=symbols))
+        except BulkUnavailable:
+            # The current year's file may not exist until its first filings are in
+            if year < this_year:
+                raise
+    return split_by_symbol(chunks, schema_name)
+
+
+def load_bulk_profiles(base_url, symbols=None, apikey=""):
+    """
+    Profiles for every company, plus the market cap frame derived from them.
+    returns:
+        ({symbol: profile DataFrame}, {symbol: market cap DataFrame})
+    """
+    url = f"{base_url}/api/v4/{BULK_PROFILES}?apikey={apikey}"
+    profiles = split_by_symbol(read_bulk_csv(url, "profile", symbols=symbols), "profile", sort_by=None)
+    today = datetime.date.today().isoformat()
+    market_caps = {
+        symbol: decode_frame(
+            pd.DataFrame({"symbol": [symbol], "date": [today], "marketCap": profile["mktCap"].iloc[:1].to_numpy()}),
+            "market-cap",
+        )
+        for symbol, profile in profiles.items()
+    }
+    return profiles, market_caps
+
+
+def load_bulk_ratios(base_url, symbols=None, apikey=""):
+    """TTM ratios for every company, {symbol: DataFrame}."""
+    url = f"{base_url}/api/v4/{BULK_RATIOS}?apikey={apikey}"
+    return split_by_symbol(read_bulk_csv(url, "ratios", symbols=symbols), "ratios", sort_by=None)
@@ -0,0 +1,316 @@
+"""
+Two tier cache for financialmodelingprep.com responses.
+
+An in-process LRU sits in front of an sqlite file on disk. Entries are keyed by
+the request url with the apikey stripped, and expire per endpoint family:
+prices after a few minutes, profiles after a day and statements once the next
+fiscal period is due to be filed. Expired entries are still served for a grace
+window while a background thread refreshes them.
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from portfolio_analysis import jsonlib
+from portfolio_analysis.endpoints import (
+    PRICE_FAMILIES,
+    STATEMENT_FAMILIES,
+    endpoint_family,
+    strip_apikey,
+)
+from portfolio_analysis.telemetry import get_telemetry
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+DEFAULT_TTL = HOUR
+PRICE_TTL = 5 * MINUTE
+PROFILE_TTL = DAY
+# Companies usually file within ~60 days of their period end
+FILING_LAG = 60 * DAY
+PERIOD_LENGTH = {"FY": 365 * DAY, "Q1": 91 * DAY, "Q2": 91 * DAY, "Q3": 91 * DAY, "Q4": 91 * DAY}
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "portfolio_analysis"
+)
+# Durable state (store, ledger, snapshots, ...) lives apart from the cache,
+# so clearing the cache or turning it off doesn't lose any of it
+DEFAULT_DATA_DIR = os.path.join(
+    os.path.expanduser("~"), ".local", "share", "portfolio_analysis"
+)
+
+
+def cache_dir(*parts):
+    """
+    Path under $PORTFOLIO_ANALYSIS_CACHE for files that can be fetched again.
+    The default directory is used when the response cache is "off".
+    """
+    root = os.environ.get("PORTFOLIO_ANALYSIS_CACHE", DEFAULT_CACHE_DIR)
+    if root == "off":
+        root = DEFAULT_CACHE_DIR
+    return os.path.join(root, *parts)
+
+
+def data_dir(*parts):
+    """
+    Path under $PORTFOLIO_ANALYSIS_DATA (default ~/.local/share/portfolio_analysis)
+    for state that can't be fetched again: the store, ledger, snapshots and run outputs.
+    """
+    root = os.environ.get("PORTFOLIO_ANALYSIS_DATA", DEFAULT_DATA_DIR)
+    return os.path.join(root, *parts)
+
+
+def statement_expiry(payload, now):
+    """
+    Work out when a statement payload can next change.
+    args:
+        payload: parsed json list of periods, most recent first
+        now: current unix time
+    returns:
+        unix time at which the next period is expected to be filed
+    """
+    if not isinstance(payload, list) or len(payload) == 0:
+        return now + DAY
+    latest = payload[0]
+    try:
+        period_end = datetime.datetime.strptime(latest["date"][:10], "%Y-%m-%d")
+    except (KeyError, TypeError, ValueError):
+        return now + DAY
+    length = PERIOD_LENGTH.get(latest.get("period"), 365 * DAY)
+    due = period_end.timestamp() + length + FILING_LAG
+    # Once a filing is overdue keep checking daily
+    return max(due, now + DAY)
+
+
+def expiry_for(url, payload, now):
+    """
+    returns:
+        (expires_at, stale_until) for a response
+    """
+    family = endpoint_family(url)
+    if family in PRICE_FAMILIES:
+        ttl = PRICE_TTL
+        if "from=" in url and "to=" in url:
+            # Closed historical ranges don't move
+            ttl = DAY
+        return now + ttl, now + 2 * ttl
+    if family in STATEMENT_FAMILIES:
+        expires_at = statement_expiry(payload, now)
+        return expires_at, expires_at + 7 * DAY
+    if family in ("profile", "market-capitalization", "ratios-ttm", "stock/list"):
+        return now + PROFILE_TTL, now + 2 * PROFILE_TTL
+    return now + DEFAULT_TTL, now + 2 * DEFAULT_TTL
+
+
+def is_cacheable(payload):
+    """FMP reports bad keys and limits as a 200 with an error dict."""
+    return not (isinstance(payload, dict) and "Error Message" in payload)
+
+
+class ResponseCache:
+    """
+    LRU memory tier in front of a size bounded sqlite store.
+    args:
+        path: sqlite file, None for a memory only cache
+        max_entries: entries kept in the memory tier
+        max_bytes: compressed bytes kept on disk before evicting
+    """
+
+    def __init__(self, path=None, max_entries=512, max_bytes=512 * 1024 ** 2):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._refreshing = set()
+        self.counters = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "evictions": 0,
+        }
+        self._db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    payload BLOB,
+                    size INTEGER,
+                    expires_at REAL,
+                    stale_until REAL,
+                    last_access REAL
+                )
+                """
+            )
+            self._db.commit()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        """Copy of the hit/miss counters plus tier sizes."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+                stats["disk_entries"], stats["disk_bytes"] = row
+        return stats
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key], "memory_hits"
+            if self._db is None:
+                return None, None
+            row = self._db.execute(
+                "SELECT payload, expires_at, stale_until FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None, None
+            self._db.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            entry = (jsonlib.loads(zlib.decompress(row[0])), row[1], row[2])
+            self._remember(key, entry)
+            return entry, "disk_hits"
+
+    def put(self, url, payload, now=None):
+        """Store a parsed response for url."""
+        if not is_cacheable(payload):
+            return
+        now = time.time() if now is None else now
+        key = strip_apikey(url)
+        expires_at, stale_until = expiry_for(url, payload, now)
+        with self._lock:
+            self._remember(key, (payload, expires_at, stale_until))
+            if self._db is None:
+                return
+            blob = zlib.compress(jsonlib.dumps(payload))
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, blob, len(blob), expires_at, stale_until, now),
+            )
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used rows until we're 10% under the limit
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ):
+            victims.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._db.commit()
+        self.counters["evictions"] += len(victims)
+
+    def _revalidate(self, url, key, fetch):
+        try:
+            self.put(url, fetch(url))
+            self._count("revalidations")
+        except Exception as e:
+            print(f"Background refresh of {key} failed with error: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_fetch(self, url, fetch):
+        """
+        Return the cached response for url, fetching it on a miss.
+        args:
+            url: fmp url, apikey included
+            fetch: callable url -> parsed json, used on a miss or to revalidate
+        returns:
+            parsed json
+        """
+        key = strip_apikey(url)
+        entry, tier = self._lookup(key)
+        now = time.time()
+        if entry is not None:
+            payload, expires_at, stale_until = entry
+            if now < expires_at:
+                self._count("hits")
+                self._count(tier)
+                get_telemetry().count("cache", family=endpoint_family(url), result=tier.rstrip("s"))
+                return payload
+            if now < stale_until:
+                self._count("stale_hits")
+                get_telemetry().count("cache", family=endpoint_family(url), result="stale_hit")
+                with self._lock:
+                    start = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start:
+                    threading.Thread(
+                        target=self._revalidate, args=(url, key, fetch), daemon=True
+                    ).start()
+                return payload
+        self._count("misses")
+        get_telemetry().count("cache", family=endpoint_family(url), result="miss")
+        payload = fetch(url)
+        self.put(url, payload, now=now)
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    The process wide cache used by data.py. Lives in $PORTFOLIO_ANALYSIS_CACHE
+    (default ~/.cache/portfolio_analysis); set it to "off" for memory only.
+    """
+    global _cache
+    if _cache is None:
+        cache_dir = os.environ.get("PORTFOLIO_ANALYSIS_CACHE", DEFAULT_CACHE_DIR)
+        if cache_dir == "off":
+            _cache = ResponseCache(path=None)
+        else:
+            _cache = ResponseCache(path=os.path.join(cache_dir, "responses.sqlite"))
+    return _cache
+
+
+def set_cache(cache):
+    """Swap the process wide cache, e.g. for a throwaway ResponseCache()."""
+    global _cache
+    _cache = cache
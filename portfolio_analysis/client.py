@@ -0,0 +1,201 @@
+"""
+Shared HTTP client for financialmodelingprep.com.
+
+One pooled keep-alive session for the whole process, with per-endpoint
+connect/read timeouts, jittered retries on 5xx and connection errors, and
+hedged requests: if a call runs past the endpoint's observed p95 latency a
+duplicate is sent and whichever answers first wins. Every attempt takes a
+token from the quota scheduler first, in the caller's priority lane.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent import futures
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from portfolio_analysis import jsonlib
+from portfolio_analysis.endpoints import endpoint_family
+from portfolio_analysis.scheduler import current_lane, get_scheduler
+from portfolio_analysis.telemetry import get_telemetry
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 30)
+TIMEOUTS = {
+    "stock/list": (3.05, 120),
+    "financial-statement-full-as-reported": (3.05, 120),
+    "historical-price-full": (3.05, 60),
+    "income-statement-bulk": (3.05, 300),
+    "balance-sheet-statement-bulk": (3.05, 300),
+    "cash-flow-statement-bulk": (3.05, 300),
+    "ratios-ttm-bulk": (3.05, 300),
+    "profile/all": (3.05, 300),
+}
+
+# Need this many samples before trusting the p95
+MIN_HEDGE_SAMPLES = 20
+MIN_HEDGE_DELAY = 0.5
+
+
+class FMPClient:
+    """
+    args:
+        pool_size: keep-alive connections per host
+        retries: extra attempts after a 5xx or connection error
+        backoff: base seconds for the jittered exponential backoff
+        hedge: send a duplicate request once a call passes the endpoint p95
+    """
+
+    def __init__(self, pool_size=32, retries=3, backoff=0.5, hedge=True):
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=pool_size * 2, thread_name_prefix="fmp-hedge"
+        )
+        self.counters = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def timeout(self, family):
+        return TIMEOUTS.get(family, DEFAULT_TIMEOUT)
+
+    def p95(self, family):
+        """Observed p95 latency for an endpoint family, None until warmed up."""
+        with self._lock:
+            samples = list(self._latencies.get(family, ()))
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return None
+        samples.sort()
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def _record(self, family, seconds):
+        with self._lock:
+            if family not in self._latencies:
+                self._latencies[family] = deque(maxlen=256)
+            self._latencies[family].append(seconds)
+
+    def _timed_get(self, url, family, lane, stream=False):
+        get_scheduler().acquire(lane)
+        self._count("requests")
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=self.timeout(family), stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            get_telemetry().count("requests", family=family, status=type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - start
+        telemetry = get_telemetry()
+        telemetry.count("requests", family=family, status=response.status_code)
+        telemetry.observe("latency_seconds", elapsed, family=family)
+        # Streamed bodies haven't been read yet, count what the server announced
+        size = response.headers.get("Content-Length") if stream else len(response.content)
+        if size is not None:
+            telemetry.count("response_bytes", int(size), family=family)
+        if response.status_code == 429:
+            get_scheduler().throttled(response.headers.get("Retry-After"))
+        elif response.status_code < 500:
+            self._record(family, elapsed)
+        return response
+
+    def _hedged_get(self, url, family, lane):
+        threshold = self.p95(family) if self.hedge else None
+        if threshold is None:
+            return self._timed_get(url, family, lane)
+        primary = self._executor.submit(self._timed_get, url, family, lane)
+        try:
+            return primary.result(timeout=max(threshold, MIN_HEDGE_DELAY))
+        except futures.TimeoutError:
+            pass
+        self._count("hedges")
+        get_telemetry().count("hedges", family=family)
+        hedged = self._executor.submit(self._timed_get, url, family, lane)
+        pending = {primary, hedged}
+        while True:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        self._count("hedge_wins")
+                    return future.result()
+            if not pending:
+                return primary.result()
+
+    def _sleep_before_retry(self, attempt):
+        # full jitter: anywhere between 0 and the exponential cap
+        time.sleep(random.uniform(0, min(10, self.backoff * 2 ** attempt)))
+
+    def get(self, url, stream=False):
+        """
+        GET a url with retries. Streaming requests are never hedged.
+        returns:
+            requests.Response with status < 500
+        raises:
+            requests.RequestException once the retries run out
+        """
+        family = endpoint_family(url)
+        lane = current_lane()
+        throttled = False
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self._count("retries")
+                get_telemetry().count("retries", family=family)
+                # after a 429 the scheduler already holds us back
+                if not throttled:
+                    self._sleep_before_retry(attempt - 1)
+            try:
+                if stream:
+                    response = self._timed_get(url, family, lane, stream=True)
+                else:
+                    response = self._hedged_get(url, family, lane)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                throttled = False
+                continue
+            throttled = response.status_code == 429
+            if response.status_code < 500 and not throttled:
+                return response
+            # An unread streamed body holds its pooled connection until closed
+            response.close()
+            error = requests.HTTPError(
+                f"{response.status_code} from {family}", response=response
+            )
+        raise error
+
+    def get_json(self, url):
+        """GET a url, return parsed json."""
+        content = self.get(url).content
+        start = time.perf_counter()
+        payload = jsonlib.loads(content)
+        get_telemetry().observe("parse_seconds", time.perf_counter() - start, family=endpoint_family(url))
+        return payload
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process wide client used by data.py."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FMPClient()
+    return _client
+
+
+def set_client(client):
+    global _client
+    _client = client
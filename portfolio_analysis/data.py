@@ -4,27 +4,89 @@ to gather company financials.
 NOTE: Some code taken directly from their documentation. See: https://financialmodelingprep.com/developer/docs/. 
 """
 
+import bisect
+import datetime
 import json
+import os
+from concurrent import futures
+from urllib.parse import urlsplit
 from urllib.request import urlopen
 
 import pandas as pd
-import requests
 
+from portfolio_analysis.bulk import BULK_STATEMENTS, load_bulk_profiles, load_bulk_ratios, load_bulk_statement
+from portfolio_analysis.cache import get_cache
+from portfolio_analysis.client import get_client
+from portfolio_analysis.endpoints import strip_apikey
+from portfolio_analysis.history import REFRESH_LIMIT, filing_due, filing_lag_days, merge_periods
+from portfolio_analysis.scheduler import request_priority
+from portfolio_analysis.schemas import decode_records
+from portfolio_analysis.singleflight import get_single_flight
+from portfolio_analysis.sparse import SparseStatements, SparseWriter
+from portfolio_analysis.streaming import iter_records, stream_frame
+from portfolio_analysis.universe import STOCK_LIST_FIELDS, load_universe, previous_universe
 
-def get_api_url(requested_data, ticker, period, apikey):
+# Point at a local stand-in (see standin.py) with $FMP_BASE_URL or set_base_url()
+DEFAULT_BASE_URL = "https://financialmodelingprep.com"
+BASE_URL = os.environ.get("FMP_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+
+
+def set_base_url(base_url=DEFAULT_BASE_URL):
+    """
+    Send every request in this module to base_url instead of FMP.
+    e.g. set_base_url("http://127.0.0.1:8765")
+    """
+    global BASE_URL
+    BASE_URL = base_url.rstrip("/")
+
+
+def get_api_url(requested_data, ticker, period, apikey, limit=None):
     if period == "annual":
-        url = "https://financialmodelingprep.com/api/v3/{requested_data}/{ticker}?limit=400&apikey={apikey}".format(
-            requested_data=requested_data, ticker=ticker, apikey=apikey
+        url = BASE_URL + "/api/v3/{requested_data}/{ticker}?limit={limit}&apikey={apikey}".format(
+            requested_data=requested_data, ticker=ticker, limit=limit or 400, apikey=apikey
         )
     elif period == "quarter":
-        url = "https://financialmodelingprep.com/api/v3/{requested_data}/{ticker}?period=quarter&apikey={apikey}".format(
+        url = BASE_URL + "/api/v3/{requested_data}/{ticker}?period=quarter&apikey={apikey}".format(
             requested_data=requested_data, ticker=ticker, apikey=apikey
         )
+        if limit is not None:
+            url += f"&limit={limit}"
     else:
         raise ValueError("invalid period " + str(period))
     return url
 
 
+def download_json(url):
+    """
+    Fetch url straight from the network, bypassing the cache.
+    """
+    return get_client().get_json(url)
+
+
+def fetch_json(url):
+    """
+    Fetch url through the response cache, return parsed json.
+    Concurrent calls for the same url share one lookup and one download.
+    args:
+        url: the url to fetch.
+
+    returns:
+        parsed json
+    """
+    return get_single_flight().do(
+        strip_apikey(url), lambda: get_cache().get_or_fetch(url, download_json)
+    )
+
+
+async def fetch_json_async(url):
+    """
+    fetch_json for asyncio code, coalesced with threaded callers of the same url.
+    """
+    return await get_single_flight().do_async(
+        strip_apikey(url), lambda: get_cache().get_or_fetch(url, download_json)
+    )
+
+
 def get_jsonparsed_data(url):
     """
     Fetch url, return parsed json.
@@ -34,10 +96,23 @@ def get_jsonparsed_data(url):
     returns:
         parsed json
     """
-    df = pd.json_normalize(requests.get(url).json())
+    df = pd.json_normalize(fetch_json(url))
     return df
 
 
+def get_typed_data(url, schema_name):
+    """
+    Fetch url, decode it with one of the schemas in schemas.py.
+    args:
+        url: the url to fetch.
+        schema_name: income, balance, cash-flow, profile, market-cap or ratios
+
+    returns:
+        typed DataFrame
+    """
+    return decode_records(fetch_json(url), schema_name)
+
+
 def get_EV_statement(ticker, period="annual", apikey=""):
     """
     Fetch EV statement, with details like total shares outstanding, from FMP.com
@@ -61,7 +136,7 @@ def get_income_statement(ticker, period="annual", apikey=""):
         parsed company's income statement
     """
     url = get_api_url("/income-statement", ticker=ticker, period=period, apikey=apikey)
-    return get_jsonparsed_data(url)
+    return get_typed_data(url, "income")
 
 
 def get_company_profile(ticker, period="annual", apikey=""):
@@ -74,7 +149,7 @@ def get_company_profile(ticker, period="annual", apikey=""):
         parsed company's income statement
     """
     url = get_api_url("profile", ticker=ticker, period=period, apikey=apikey)
-    return get_jsonparsed_data(url)
+    return get_typed_data(url, "profile")
 
 
 def get_cashflow_statement(ticker, period="annual", apikey=""):
@@ -104,7 +179,7 @@ def get_balance_statement(ticker, period="annual", apikey=""):
     url = get_api_url(
         "balance-sheet-statement", ticker=ticker, period=period, apikey=apikey
     )
-    return get_jsonparsed_data(url)
+    return get_typed_data(url, "balance")
 
 
 def get_stock_price(ticker, apikey=""):
@@ -116,73 +191,163 @@ def get_stock_price(ticker, apikey=""):
     returns:
         {'symbol': ticker, 'price': price}
     """
-    url = "https://financialmodelingprep.com/api/v3/stock/real-time-price/{ticker}?apikey={apikey}".format(
+    url = BASE_URL + "/api/v3/stock/real-time-price/{ticker}?apikey={apikey}".format(
         ticker=ticker, apikey=apikey
     )
     return get_jsonparsed_data(url)
 
 
+# Symbols per request on the endpoints that take comma separated lists
+QUOTE_BATCH_SIZE = 500
+PROFILE_BATCH_SIZE = 100
+
+
+def get_batch_data(endpoint, tickers, batch_size, apikey="", concurrency=4):
+    """
+    Fetch a comma separated list endpoint (quote, profile) for many tickers.
+    Tickers are deduplicated, sorted so chunks line up with the cache, split
+    into chunks of batch_size and the chunks are fetched concurrently.
+    args:
+        endpoint: e.g. "quote" or "profile"
+        tickers: a list of tickers
+    returns:
+        DataFrame indexed by symbol
+    """
+    tickers = sorted(set(tickers))
+    chunks = [tickers[i : i + batch_size] for i in range(0, len(tickers), batch_size)]
+    urls = [
+        f"{BASE_URL}/api/v3/{endpoint}/{','.join(chunk)}?apikey={apikey}"
+        for chunk in chunks
+    ]
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        payloads = list(executor.map(fetch_json, urls))
+    records = [record for payload in payloads if isinstance(payload, list) for record in payload]
+    if len(records) == 0:
+        return pd.DataFrame(index=pd.Index([], name="symbol"))
+    return pd.DataFrame.from_records(records).set_index("symbol")
+
+
 def get_batch_stock_prices(tickers, apikey=""):
     """
-    Fetch the stock prices for a list of tickers.
+    Fetch the stock quotes for a list of tickers, QUOTE_BATCH_SIZE per request.
     args:
         tickers: a list of  tickers........
 
     returns:
-        dict of {'ticker':  price}
+        DataFrame of quotes indexed by symbol, e.g. prices.loc["AAPL", "price"]
     """
-    prices = {}
-    for ticker in tickers:
-        prices[ticker] = get_stock_price(ticker=ticker, apikey=apikey)["price"]
+    return get_batch_data("quote", tickers, QUOTE_BATCH_SIZE, apikey=apikey)
 
-    return prices
+
+def get_batch_company_profiles(tickers, apikey=""):
+    """
+    Fetch company profiles for a list of tickers, PROFILE_BATCH_SIZE per request.
+    returns:
+        DataFrame of profiles indexed by symbol
+    """
+    return get_batch_data("profile", tickers, PROFILE_BATCH_SIZE, apikey=apikey)
+
+
+# Calendar days to look back for the last trading day before a requested date
+PRICE_LOOKBACK_DAYS = 10
+
+
+def build_price_index(historical):
+    """
+    Sort FMP historical bars into an as-of index.
+    args:
+        historical: list of {'date': 'YYYY-MM-DD', 'close': ...} in any order
+    returns:
+        (dates, closes) ascending by date
+    """
+    bars = sorted((bar["date"][:10], bar["close"]) for bar in historical)
+    return [date for date, _ in bars], [close for _, close in bars]
+
+
+def price_as_of(price_index, date, lookback_days=PRICE_LOOKBACK_DAYS):
+    """
+    Close on the last trading day on or before date, None if there was none
+    within lookback_days.
+    """
+    dates, closes = price_index
+    position = bisect.bisect_right(dates, date[:10]) - 1
+    if position < 0:
+        return None
+    earliest = datetime.date.fromisoformat(date[:10]) - datetime.timedelta(days=lookback_days)
+    if dates[position] < earliest.isoformat():
+        return None
+    return closes[position]
 
 
 def get_historical_share_prices(ticker, dates, apikey=""):
     """
     Fetch the stock price for a ticker at the dates listed.
+    One request covers every date; each date gets the close of the last
+    trading day on or before it (e.g. for earnings releases on a weekend).
     args:
         ticker: a ticker.
         dates: a list of dates from which to fetch close price.
     returns:
         {'date': price, ...}
     """
+    if len(dates) == 0:
+        return {}
+    date_start = datetime.date.fromisoformat(min(dates)[:10]) - datetime.timedelta(days=PRICE_LOOKBACK_DAYS)
+    date_end = max(dates)[:10]
+    url = f"{BASE_URL}/api/v3/historical-price-full/{ticker}?from={date_start.isoformat()}&to={date_end}&apikey={apikey}"
+    payload = fetch_json(url)
+    price_index = build_price_index(payload.get("historical", []) if isinstance(payload, dict) else [])
+
     prices = {}
     for date in dates:
-        date_start, date_end = date[0:8] + str(int(date[8:]) - 2), date
-        url = "https://financialmodelingprep.com/api/v3/historical-price-full/{ticker}?from={date_start}&to={date_end}&apikey={apikey}".format(
-            ticker=ticker, date_start=date_start, date_end=date_end, apikey=apikey
-        )
-        try:
-            prices[date_end] = get_jsonparsed_data(url)["historical"][0]["close"]
-        except IndexError:
-            #  RIP nested try catch, so many issues with dates just try a bunch and get within range of earnings release
-            try:
-                prices[date_start] = get_jsonparsed_data(url)["historical"][0]["close"]
-            except IndexError:
-                print(date + " ", get_jsonparsed_data(url))
+        price = price_as_of(price_index, date)
+        if price is None:
+            print(f"No price for {ticker} on or before {date}")
+        else:
+            prices[date] = price
 
     return prices
 
 
+def get_ticker_universe(apikey="", refresh=False):
+    """
+    Indexed snapshot of all company tickers, refreshed once a day.
+    returns:
+        universe.TickerUniverse
+    """
+    url = f"{BASE_URL}/api/v3/stock/list?apikey={apikey}"
+    # The snapshot is the cache here, no point keeping the raw list twice
+    return load_universe(
+        lambda: stream_frame(url, "item", fields=STOCK_LIST_FIELDS),
+        source=urlsplit(BASE_URL).netloc,
+        refresh=refresh,
+    )
+
+
+def get_previous_ticker_universe():
+    """
+    The universe snapshot replaced by the latest daily refresh, None if there is none.
+    """
+    return previous_universe(urlsplit(BASE_URL).netloc)
+
+
 def get_all_company_tickers(apikey="", exchange=None):
     """
-    Fetch all companys tickers
+    Fetch all companys tickers, sorted by exchange then symbol
     """
-    url = f"https://financialmodelingprep.com/api/v3/stock/list?apikey={apikey}"
-    all_company_tickers = pd.json_normalize(requests.get(url).json())
+    universe = get_ticker_universe(apikey)
     if exchange is None:
-        return all_company_tickers
+        return universe.frame
     else:
-        return all_company_tickers[all_company_tickers.exchange == exchange]
+        return universe.for_exchange(exchange)
 
 
 def get_sp500_tickers(apikey=""):
     """
     Fetch all companys tickers
     """
-    url = f"https://financialmodelingprep.com/api/v3/sp500_constituent?apikey={apikey}"
-    sp500_tickers = pd.json_normalize(requests.get(url).json())
+    url = f"{BASE_URL}/api/v3/sp500_constituent?apikey={apikey}"
+    sp500_tickers = pd.json_normalize(fetch_json(url))
     return sp500_tickers
 
 
@@ -190,8 +355,8 @@ def get_insider_trading(symbol, apikey=""):
     """
     Fetch insiderstrades
     """
-    url = f"https://financialmodelingprep.com/api/v4/insider-trading?symbol={symbol}&limit=100&apikey={apikey}"
-    insider_trades = pd.json_normalize(requests.get(url).json())
+    url = f"{BASE_URL}/api/v4/insider-trading?symbol={symbol}&limit=100&apikey={apikey}"
+    insider_trades = pd.json_normalize(fetch_json(url))
     return insider_trades
 
 
@@ -200,10 +365,10 @@ def get_cash_flow_statement(symbol, period="annual",apikey=""):
     get cash flow statement
     """
     if period == "annual":
-        url = f"https://financialmodelingprep.com/api/v3/cash-flow-statement/{symbol}?apikey={apikey}"
+        url = f"{BASE_URL}/api/v3/cash-flow-statement/{symbol}?apikey={apikey}"
     else:
-        url = f"https://financialmodelingprep.com/api/v3/cash-flow-statement/{symbol}?period=quarter&apikey={apikey}"
-    cashflow = pd.json_normalize(requests.get(url).json())
+        url = f"{BASE_URL}/api/v3/cash-flow-statement/{symbol}?period=quarter&apikey={apikey}"
+    cashflow = get_typed_data(url, "cash-flow")
     return cashflow
 
 
@@ -213,13 +378,13 @@ def get_financial_ratios(symbol, period="annual", apikey=""):
     """
     if period == "annual":
         url = (
-            f"https://financialmodelingprep.com/api/v3/ratios-ttm/{symbol}?apikey={apikey}"
+            f"{BASE_URL}/api/v3/ratios-ttm/{symbol}?apikey={apikey}"
         )
     else:
         url = (
-            f"https://financialmodelingprep.com/api/v3/ratios-ttm/{symbol}?period=quarter&apikey={apikey}"
+            f"{BASE_URL}/api/v3/ratios-ttm/{symbol}?period=quarter&apikey={apikey}"
         )
-    financial_ratio = pd.json_normalize(requests.get(url).json())
+    financial_ratio = get_typed_data(url, "ratios")
     return financial_ratio
 
 
@@ -228,94 +393,323 @@ def get_market_cap(symbol, period="annual", apikey=""):
     market_cap
     """
     if period == "annual":
-        url = f"https://financialmodelingprep.com/api/v3/market-capitalization/{symbol}?apikey={apikey}"
+        url = f"{BASE_URL}/api/v3/market-capitalization/{symbol}?apikey={apikey}"
     else:
-        url = f"https://financialmodelingprep.com/api/v3/market-capitalization/{symbol}?period=quarter&apikey={apikey}"
-    financial_ratio = pd.json_normalize(requests.get(url).json())
+        url = f"{BASE_URL}/api/v3/market-capitalization/{symbol}?period=quarter&apikey={apikey}"
+    financial_ratio = get_typed_data(url, "market-cap")
     return financial_ratio
 
 
 def get_company_outlook(symbol, apikey="", bucket="ratios"):
-    url = f"https://financialmodelingprep.com/api/v4/company-outlook?symbol={symbol}&apikey={apikey}"
-    company_outlook = requests.get(url).json()
+    url = f"{BASE_URL}/api/v4/company-outlook?symbol={symbol}&apikey={apikey}"
+    company_outlook = fetch_json(url)
     return pd.json_normalize(company_outlook[bucket])
 
 
 def get_stock_news(symbol, apikey=""):
-    url = f"https://financialmodelingprep.comapi/v3/stock_news?tickers={symbol}&limit=50&apikey={apikey}"
-    stock_news = pd.json_normalize(requests.get(url).json())
+    url = f"{BASE_URL}/api/v3/stock_news?tickers={symbol}&limit=50&apikey={apikey}"
+    stock_news = pd.json_normalize(fetch_json(url))
     return stock_news
 
 
 def get_social_sentiment(symbol, apikey=""):
-    url = f"https://financialmodelingprep.com/api/v4/social-sentiment?symbol={symbol}&apikey={apikey}"
-    social_sentiment = pd.json_normalize(requests.get(url).json())
+    url = f"{BASE_URL}/api/v4/social-sentiment?symbol={symbol}&apikey={apikey}"
+    social_sentiment = pd.json_normalize(fetch_json(url))
     return social_sentiment
 
 
 def get_stock_peers(symbol, apikey=""):
-    url = f"https://financialmodelingprep.com/api/v4/stock_peers?symbol={symbol}&apikey={apikey}"
-    stock_peers = pd.json_normalize(requests.get(url).json())
+    url = f"{BASE_URL}/api/v4/stock_peers?symbol={symbol}&apikey={apikey}"
+    stock_peers = pd.json_normalize(fetch_json(url))
     return stock_peers
 
 def get_tickers_with_financials(apikey=""):
-    url = f"https://financialmodelingprep.com/api/v3/financial-statement-symbol-lists?apikey={apikey}"
-    tickers = requests.get(url).json()
+    url = f"{BASE_URL}/api/v3/financial-statement-symbol-lists?apikey={apikey}"
+    tickers = fetch_json(url)
     return tickers
 
 def industry_sector_performance(apikey=""):
-    url = f"https://financialmodelingprep.com/api/v3/historical-sectors-performance?apikey={apikey}"
-    industry_sector_performance = requests.get(url).json()
+    url = f"{BASE_URL}/api/v3/historical-sectors-performance?apikey={apikey}"
+    industry_sector_performance = fetch_json(url)
     return pd.json_normalize(industry_sector_performance)
 # https://opendata.gov.je/dataset/average-earnings-index/resource/ae19c45b-91c7-4636-9c4a-10f939e767e5
 
-def historical_daily_price(symbol, apikey=""):
-    url = f"https://financialmodelingprep.com/api/v3/historical-price-full/{symbol}?apikey={apikey}"
-    historical_daily_price = requests.get(url).json()
-    return pd.json_normalize(historical_daily_price["historical"])
+def historical_daily_price(symbol, apikey="", fields=None):
+    """
+    Full daily price history, streamed off the socket.
+    args:
+        fields: columns to keep, e.g. ["date", "adjClose"], None keeps all
+    """
+    url = f"{BASE_URL}/api/v3/historical-price-full/{symbol}?apikey={apikey}"
+    return stream_frame(url, "historical.item", fields=fields)
+
+def full_financial_statement(symbol, apikey="", fields=None):
+    """
+    As reported statements, one row per period, streamed off the socket.
+    args:
+        fields: tags to keep, None keeps every tag reported
+    """
+    url = f"{BASE_URL}/api/v3/financial-statement-full-as-reported/{symbol}?apikey={apikey}"
+    # The as-reported payload is a top level list, not a "historical" key
+    return stream_frame(url, "item", fields=fields)
 
-def full_financial_statement(symbol, apikey=""):
-    url = f"https://financialmodelingprep.com/api/v3/financial-statement-full-as-reported/{symbol}?apikey={apikey}"
-    print(url)
-    historical_daily_price = requests.get(url).json()
-    return pd.json_normalize(historical_daily_price["historical"])
+def save_as_reported_statements(symbols, apikey="", path=None, lane="bulk"):
+    """
+    As reported statements for many symbols in sparse form, see sparse.py.
+    Each payload is streamed straight into the tag/value arrays, so no dense
+    frame is built for any company. The symbols are merged into what is
+    already stored at path: other companies, and ones whose fetch failed or
+    came back empty, keep their stored statements.
+    args:
+        path: file prefix, defaults to sparse.default_sparse_path()
+    returns:
+        SparseStatements, memory-mapped
+    """
+    base = SparseStatements.open(path)
+    writer = SparseWriter(path, base=base)
+    fetched = set()
+    with request_priority(lane):
+        for symbol in dict.fromkeys(symbols):
+            url = f"{BASE_URL}/api/v3/financial-statement-full-as-reported/{symbol}?apikey={apikey}"
+            try:
+                if writer.add(symbol, iter_records(url, "item")):
+                    fetched.add(symbol)
+            except Exception as e:
+                print(f"Fetching {symbol} failed with error: {e}")
+    if base is not None:
+        for symbol in base.symbols:
+            if symbol not in fetched:
+                writer.keep(symbol)
+    return writer.close()
 
 def historical_prices(symbol, days=5, apikey=""):
-    url = f"https://financialmodelingprep.com/api/v3/historical-price-full/{symbol}?timeseries={days}&apikey={apikey}"
-    print(url)
-    historical_prices = requests.get(url).json()
+    url = f"{BASE_URL}/api/v3/historical-price-full/{symbol}?timeseries={days}&apikey={apikey}"
+    historical_prices = fetch_json(url)
     return pd.json_normalize(historical_prices)
 
-def get_single_company_data(symbol, apikey, period='annual', money_only=False):
-    if period == 'annual':
-        if money_only:
-            IS = get_income_statement(symbol, period="annual", apikey=apikey)
-            BS = get_balance_statement(symbol, apikey=apikey)
-        else:
-            IS = get_income_statement(symbol, period="annual", apikey=apikey)
-            profile = get_company_profile(symbol, apikey=apikey)
-            BS = get_balance_statement(symbol, apikey=apikey)
-            MC = get_market_cap(symbol=symbol, apikey=apikey)
-            CFR = get_financial_ratios(symbol=symbol, apikey=apikey)
-            CFS = get_cash_flow_statement(symbol=symbol, apikey=apikey)
-            # HP = historical_daily_price(symbol=symbol, apikey=apikey)
-            # FFS = full_financial_statement(symbol=symbol, apikey=apikey)
-    elif period == 'quarter':
-        IS = get_income_statement(symbol, period="quarter", apikey=apikey)
-        profile = get_company_profile(symbol, period="quarter", apikey=apikey)
-        BS = get_balance_statement(symbol, period="quarter", apikey=apikey)
-        MC = get_market_cap(symbol=symbol, period="quarter", apikey=apikey)
-        CFR = get_financial_ratios(symbol=symbol,period="quarter", apikey=apikey)
-        CFS = get_cash_flow_statement(symbol=symbol,period="quarter", apikey=apikey)
-        # HP = historical_daily_price(symbol=symbol, apikey=apikey)
-    else:
+# statement endpoint -> schema, for the statements refresh_statement can update
+REFRESHABLE_STATEMENTS = {
+    "income-statement": "income",
+    "balance-sheet-statement": "balance",
+    "cash-flow-statement": "cash-flow",
+}
+
+
+def refresh_statement(symbol, statement, history, period="annual", apikey="", limit=REFRESH_LIMIT):
+    """
+    Bring a stored statement up to date with as few bytes as possible.
+    Symbols without history get the full limit=400 download. Otherwise nothing
+    is requested until a newer filing could exist, and then only the newest
+    `limit` periods are fetched and merged into the stored history.
+    args:
+        statement: one of REFRESHABLE_STATEMENTS
+        history: StatementHistory
+    returns:
+        typed DataFrame of the full merged history, newest first
+    """
+    stored = history.load(symbol, statement, period)
+    if stored and not filing_due(stored[0], period, lag_days=filing_lag_days(stored)):
+        return decode_records(stored, REFRESHABLE_STATEMENTS[statement])
+
+    url = get_api_url(statement, ticker=symbol, period=period, apikey=apikey, limit=limit if stored else None)
+    fetched = fetch_json(url)
+    if isinstance(fetched, list):
+        stored = merge_periods(stored, fetched)
+        history.save(symbol, statement, period, stored)
+    return decode_records(stored, REFRESHABLE_STATEMENTS[statement])
+
+
+# company data key -> statement name in StatementHistory
+HISTORY_STATEMENTS = {"IS": "income-statement", "BS": "balance-sheet-statement", "CFS": "cash-flow-statement"}
+
+
+def company_data_fetchers(period="annual", money_only=False, history=None):
+    """
+    The statements that make up a company data dict.
+    args:
+        period: annual or quarter
+        money_only: only fetch the income statement and balance sheet
+        history: StatementHistory to refresh IS, BS and CFS incrementally
+    returns:
+        {key: fetcher(symbol, apikey)} in the order they are fetched
+    """
+    fetchers = {
+        "IS": lambda symbol, apikey: get_income_statement(symbol, period=period, apikey=apikey),
+        "profile": lambda symbol, apikey: get_company_profile(symbol, period=period, apikey=apikey),
+        "BS": lambda symbol, apikey: get_balance_statement(symbol, period=period, apikey=apikey),
+        "MC": lambda symbol, apikey: get_market_cap(symbol=symbol, period=period, apikey=apikey),
+        "CFR": lambda symbol, apikey: get_financial_ratios(symbol=symbol, period=period, apikey=apikey),
+        "CFS": lambda symbol, apikey: get_cash_flow_statement(symbol=symbol, period=period, apikey=apikey),
+        # "HP": lambda symbol, apikey: historical_daily_price(symbol=symbol, apikey=apikey),
+        # "FFS": lambda symbol, apikey: full_financial_statement(symbol=symbol, apikey=apikey),
+    }
+    if history is not None:
+        for key, statement in HISTORY_STATEMENTS.items():
+            fetchers[key] = lambda symbol, apikey, statement=statement: refresh_statement(
+                symbol, statement, history, period=period, apikey=apikey
+            )
+    if money_only and period == "annual":
+        return {key: fetchers[key] for key in ["IS", "BS"]}
+    return fetchers
+
+
+def get_single_company_data(symbol, apikey, period='annual', money_only=False, history=None):
+    if period not in ("annual", "quarter"):
         print("Invalid Period")
         return
 
-    if money_only:
-        return {"IS": IS, "BS": BS}
-    else:
-        return {"IS": IS, "profile": profile, "BS": BS, "MC": MC, "CFR": CFR, "CFS": CFS}
+    fetchers = company_data_fetchers(period=period, money_only=money_only, history=history)
+    return {key: fetch(symbol, apikey) for key, fetch in fetchers.items()}
+
+
+def get_many_company_data(symbols, apikey, period="annual", money_only=False, concurrency=8, lane="bulk", history=None, on_error=None):
+    """
+    Fetch the company data dict for many symbols at once.
+    All endpoints for all symbols are fanned out over a thread pool of
+    `concurrency` workers, with at most 2 * concurrency symbols in flight.
+    args:
+        symbols: iterable of tickers
+        concurrency: number of requests in flight
+        lane: scheduler priority lane, bulk so interactive lookups go first
+        history: StatementHistory to refresh statements incrementally
+        on_error: called with (symbol, exception) when a symbol fails, e.g. JobLedger.fail
+    yields:
+        (symbol, company data dict) as each symbol completes, in completion order.
+        The dict is None if any of the symbol's requests failed.
+    """
+    if period not in ("annual", "quarter"):
+        print("Invalid Period")
+        return
+
+    fetchers = company_data_fetchers(period=period, money_only=money_only, history=history)
+
+    def run(fetch, symbol):
+        with request_priority(lane):
+            return fetch(symbol, apikey)
+
+    yield from _fetch_symbols(((symbol, fetchers) for symbol in symbols), run, concurrency, on_error)
+
+
+def _fetch_symbols(jobs, run, concurrency, on_error=None):
+    """
+    Run each symbol's fetches on a thread pool, at most 2 * concurrency symbols in flight.
+    args:
+        jobs: iterable of (symbol, {key: fetch})
+        run: called as run(fetch, symbol) on a worker thread
+    yields:
+        (symbol, {key: result}) in completion order, None instead of the dict
+        if any of the symbol's fetches failed
+    """
+    jobs = iter(jobs)
+    in_flight = {}  # symbol -> {key: future}
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def submit_next():
+            job = next(jobs, None)
+            if job is None:
+                return False
+            symbol, fetchers = job
+            in_flight[symbol] = {
+                key: executor.submit(run, fetch, symbol)
+                for key, fetch in fetchers.items()
+            }
+            return True
+
+        while len(in_flight) < 2 * concurrency and submit_next():
+            pass
+        while in_flight:
+            pending = [f for fs in in_flight.values() for f in fs.values() if not f.done()]
+            if pending:
+                futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for symbol in [s for s, fs in in_flight.items() if all(f.done() for f in fs.values())]:
+                results = in_flight.pop(symbol)
+                try:
+                    cd = {key: future.result() for key, future in results.items()}
+                except Exception as e:
+                    print(f"Fetching {symbol} failed with error: {e}")
+                    if on_error is not None:
+                        on_error(symbol, e)
+                    cd = None
+                submit_next()
+                yield symbol, cd
+
+
+def get_bulk_company_data(symbols, apikey, period="annual", money_only=False, years=None, concurrency=8, lane="bulk", history=None, on_error=None):
+    """
+    Company data dicts for a whole universe from FMP's bulk downloads.
+    IS, BS and CFS come from one bulk file per statement per year, profile
+    and MC from the profile dump and CFR from the TTM ratios dump, so a full
+    refresh is a few dozen requests. Symbols the bulk files don't cover fall
+    back to per-symbol requests for just the missing keys.
+    args:
+        symbols: iterable of tickers
+        years: statement years, defaults to bulk.bulk_years(): this year and the BULK_YEARS before it
+        concurrency: requests in flight for the per-symbol fallback
+        history: StatementHistory used by the per-symbol fallback; the periods
+            read from the bulk files are merged into it too, so the planner sees them
+        on_error: called with (symbol, exception) when a fallback fails
+    yields:
+        (symbol, company data dict), symbols fully covered by the bulk files
+        first, then the fallbacks in completion order with at most
+        2 * concurrency symbols in flight. The dict is None if a fallback request failed.
+    """
+    if period not in ("annual", "quarter"):
+        print("Invalid Period")
+        return
+
+    symbols = list(symbols)
+    wanted = set(symbols)
+    fetchers = company_data_fetchers(period=period, money_only=money_only, history=history)
+    bulk = {}
+
+    def load(keys, loader):
+        # A bulk file that can't be read covers nothing, its keys go to the per-symbol fallback
+        try:
+            result = loader()
+        except Exception as e:
+            print(f"Bulk {'/'.join(keys)} unavailable, fetching per symbol: {e}")
+            return
+        if len(keys) == 1:
+            result = (result,)
+        bulk.update(zip(keys, result))
+
+    with request_priority(lane):
+        for key in BULK_STATEMENTS:
+            if key in fetchers:
+                load([key], lambda: load_bulk_statement(BASE_URL, key, wanted, years=years, period=period, apikey=apikey))
+        if "profile" in fetchers or "MC" in fetchers:
+            load(["profile", "MC"], lambda: load_bulk_profiles(BASE_URL, wanted, apikey=apikey))
+        if "CFR" in fetchers:
+            load(["CFR"], lambda: load_bulk_ratios(BASE_URL, wanted, apikey=apikey))
+
+    if history is not None:
+        for key, statement in HISTORY_STATEMENTS.items():
+            for symbol, frame in bulk.get(key, {}).items():
+                history.merge_frame(symbol, statement, period, frame)
+
+    gaps = {}
+    for symbol in symbols:
+        cd = {key: bulk[key].get(symbol) for key in fetchers if key in bulk}
+        missing = [key for key in fetchers if cd.get(key) is None or len(cd[key]) == 0]
+        if missing:
+            gaps[symbol] = (cd, missing)
+        else:
+            yield symbol, {key: cd[key] for key in fetchers}
+
+    def run(fetch, symbol):
+        with request_priority(lane):
+            return fetch(symbol, apikey)
+
+    # Only the missing endpoints are fetched, symbols come back as they complete
+    jobs = ((symbol, {key: fetchers[key] for key in missing}) for symbol, (cd, missing) in gaps.items())
+    for symbol, fetched in _fetch_symbols(jobs, run, concurrency, on_error):
+        cd, _ = gaps[symbol]
+        if fetched is None:
+            yield symbol, None
+            continue
+        cd.update(fetched)
+        yield symbol, {key: cd[key] for key in fetchers}
+
 
 def aggregate_to_quarter(df, agg=True, statistic="mean"):
     df["date"] = pd.to_datetime(df.date)
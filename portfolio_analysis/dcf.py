@@ -7,51 +7,11 @@ import pandas as pd
 from sklearn.linear_model import LinearRegression
 
 from portfolio_analysis.data import *
+from portfolio_analysis.schemas import BALANCE_SHEET_FIELDS
+from portfolio_analysis.sink import ResultSink, run_dir
+from portfolio_analysis.store import get_store
 
-columns = ['cashAndCashEquivalents',
-        'shortTermInvestments',
-        'cashAndShortTermInvestments',
-        'netReceivables',
-        'inventory',
-        'otherCurrentAssets',
-        'totalCurrentAssets',
-        'propertyPlantEquipmentNet',
-        'goodwill',
-        'intangibleAssets',
-        'goodwillAndIntangibleAssets',
-        'longTermInvestments',
-        'taxAssets',
-        'otherNonCurrentAssets',
-        'totalNonCurrentAssets',
-        'otherAssets',
-        'totalAssets',
-        'accountPayables',
-        'shortTermDebt',
-        'taxPayables',
-        'deferredRevenue',
-        'otherCurrentLiabilities',
-        'totalCurrentLiabilities',
-        'longTermDebt',
-        'deferredRevenueNonCurrent',
-        'deferredTaxLiabilitiesNonCurrent',
-        'otherNonCurrentLiabilities',
-        'totalNonCurrentLiabilities',
-        'otherLiabilities',
-        'capitalLeaseObligations',
-        'totalLiabilities',
-        'preferredStock',
-        'commonStock',
-        'retainedEarnings',
-        'accumulatedOtherComprehensiveIncomeLoss',
-        'othertotalStockholdersEquity',
-        'totalStockholdersEquity',
-        'totalLiabilitiesAndStockholdersEquity',
-        'minorityInterest',
-        'totalEquity',
-        'totalLiabilitiesAndTotalEquity',
-        'totalInvestments',
-        'totalDebt',
-        'netDebt']
+columns = list(BALANCE_SHEET_FIELDS)
 
 def DCF(
     ticker,
@@ -720,17 +680,19 @@ def get_irr_new(
 
 def run_analysis(company_names, exchange):
     month = pd.Timestamp.now().month_name()
-    try:
-        irr_df = pd.read_csv(f"excels/{exchange}_{month}.csv")
-    except FileNotFoundError:
-        irr_df = pd.DataFrame()
-    for index, company in company_names[company_names.exchange == exchange].iterrows():
-        symbol = company.loc["symbol"]
-        cd = get_single_company_data(symbol)
-        irr = get_irr(cd)
-        irr_df = irr_df.append(irr, ignore_index=True)
-
-    irr_df.to_csv(f"excels/{exchange}_{month}.csv")
+    store = get_store()
+    irr_df = store.read_screen(f"irr_{month}", exchanges=[exchange])
+    with ResultSink(run_dir(f"irr_{month}_{exchange}")) as sink:
+        for index, company in company_names[company_names.exchange == exchange].iterrows():
+            symbol = company.loc["symbol"]
+            cd = get_single_company_data(symbol)
+            irr = get_irr(cd)
+            sink.append(irr)
+
+    irr_df = pd.concat([irr_df, sink.to_frame()], ignore_index=True)
+    irr_df["exchange"] = exchange
+    store.write_screen(f"irr_{month}", irr_df)
+    sink.clear()
     return irr_df
 
 def get_npv(IS, price, cash_flow_metric, discount_rate):
@@ -815,6 +777,35 @@ def get_roc_earnings(IS, BS, MC):
         "QA_trend": QA,
         "EBIT": EBIT.iloc[0]}
 
+def get_roc_earnings_panel(panel, trend_years=5):
+    """
+    get_roc_earnings for every symbol of a panel.Panel at once.
+    args:
+        panel: panel.Panel
+        trend_years: like get_roc_earnings, .loc slices include the last label
+    returns:
+        DataFrame indexed by symbol with the latest MOP, QA, EBIT, ROC and
+        the ROC mean over the trend years
+    """
+    window = slice(0, trend_years + 1)
+
+    def field(name):
+        return panel.field(name)[:, window]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        MOP = field("operatingIncome") / field("revenue")
+        QA = (field("totalCurrentAssets") - field("inventory")) / field("totalCurrentLiabilities")
+        EBIT = field("revenue") - field("costOfRevenue") - field("operatingExpenses")
+        NetWorkingCapital = field("totalCurrentAssets") - field("totalCurrentLiabilities")
+        ROC = EBIT / (NetWorkingCapital + field("propertyPlantEquipmentNet"))
+        ROC[~np.isfinite(ROC)] = np.nan
+        ROC_mean = np.nanmean(ROC, axis=1)
+
+    return pd.DataFrame(
+        {"MOP": MOP[:, 0], "QA": QA[:, 0], "EBIT": EBIT[:, 0], "ROC": ROC[:, 0], "ROC_mean": ROC_mean},
+        index=pd.Index(panel.symbols, name="symbol"),
+    )
+
 def analyse_company_data(cd, cash_flow_metric='eps', discount_rate=0.05):
     IS = cd["IS"].sort_values('date', ascending=False)
     BS = cd["BS"].sort_values('date', ascending=False)
@@ -860,50 +851,7 @@ def analyse_single_company_data(company_data,  money_only=False):
     BS.loc[:, "year"] = BS["date"].apply(lambda x: pd.Timestamp(x).year)
     CFS.loc[:, "year"] = CFS["date"].apply(lambda x: pd.Timestamp(x).year)
 
-    columns = ['cashAndCashEquivalents',
-        'shortTermInvestments',
-        'cashAndShortTermInvestments',
-        'netReceivables',
-        'inventory',
-        'otherCurrentAssets',
-        'totalCurrentAssets',
-        'propertyPlantEquipmentNet',
-        'goodwill',
-        'intangibleAssets',
-        'goodwillAndIntangibleAssets',
-        'longTermInvestments',
-        'taxAssets',
-        'otherNonCurrentAssets',
-        'totalNonCurrentAssets',
-        'otherAssets',
-        'totalAssets',
-        'accountPayables',
-        'shortTermDebt',
-        'taxPayables',
-        'deferredRevenue',
-        'otherCurrentLiabilities',
-        'totalCurrentLiabilities',
-        'longTermDebt',
-        'deferredRevenueNonCurrent',
-        'deferredTaxLiabilitiesNonCurrent',
-        'otherNonCurrentLiabilities',
-        'totalNonCurrentLiabilities',
-        'otherLiabilities',
-        'capitalLeaseObligations',
-        'totalLiabilities',
-        'preferredStock',
-        'commonStock',
-        'retainedEarnings',
-        'accumulatedOtherComprehensiveIncomeLoss',
-        'othertotalStockholdersEquity',
-        'totalStockholdersEquity',
-        'totalLiabilitiesAndStockholdersEquity',
-        'minorityInterest',
-        'totalEquity',
-        'totalLiabilitiesAndTotalEquity',
-        'totalInvestments',
-        'totalDebt',
-        'netDebt']
+    columns = list(BALANCE_SHEET_FIELDS)
 
     columns += ['year', 'QA']
 
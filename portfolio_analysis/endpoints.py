@@ -0,0 +1,85 @@
+"""
+Helpers for reasoning about financialmodelingprep.com urls built in data.py.
+"""
+
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Endpoint families that do not carry a ticker in the url path. Everything
+# else is assumed to end in /{ticker}.
+SYMBOL_FREE_FAMILIES = [
+    "stock/list",
+    "sp500_constituent",
+    "financial-statement-symbol-lists",
+    "historical-sectors-performance",
+    "insider-trading",
+    "company-outlook",
+    "social-sentiment",
+    "stock_peers",
+    "stock_news",
+]
+
+# Bulk downloads, one CSV for every company
+BULK_FAMILIES = [
+    "income-statement-bulk",
+    "balance-sheet-statement-bulk",
+    "cash-flow-statement-bulk",
+    "ratios-ttm-bulk",
+    "profile/all",
+]
+
+STATEMENT_FAMILIES = [
+    "income-statement",
+    "balance-sheet-statement",
+    "cash-flow-statement",
+    "financials/cash-flow-statement",
+    "enterprise-value",
+    "financial-statement-full-as-reported",
+]
+
+PRICE_FAMILIES = [
+    "quote",
+    "stock/real-time-price",
+    "historical-price-full",
+]
+
+_API_PREFIX = re.compile(r"^/?api/v\d+/")
+
+
+def request_key(url):
+    """
+    Path and query of a url without its apikey, query params sorted.
+    e.g. https://.../api/v3/income-statement/AAPL?limit=400&apikey=x -> /api/v3/income-statement/AAPL?limit=400
+    """
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "apikey"]
+    query.sort()
+    key = re.sub("/+", "/", parts.path)
+    if query:
+        key += "?" + urlencode(query, safe=",")
+    return key
+
+
+def strip_apikey(url):
+    """
+    Remove the apikey query parameter from a url.
+    args:
+        url: fmp url
+    returns:
+        url without its apikey, with the remaining query params sorted
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{request_key(url)}"
+
+
+def endpoint_family(url):
+    """
+    Name of the endpoint a url points at, without version prefix or ticker.
+    e.g. https://.../api/v3/income-statement/AAPL?limit=400 -> income-statement
+    """
+    path = _API_PREFIX.sub("", urlsplit(url).path.lstrip("/")).strip("/")
+    if path in SYMBOL_FREE_FAMILIES or path in BULK_FAMILIES:
+        return path
+    if "/" in path:
+        return path.rsplit("/", 1)[0]
+    return path
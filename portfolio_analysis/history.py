@@ -0,0 +1,123 @@
+"""
+Stored statement history per symbol, for incremental refreshes.
+
+Between two runs a company adds at most one annual or quarterly report, so
+instead of pulling limit=400 periods every time data.refresh_statement asks
+for the newest few, merges them into what is stored here and skips symbols
+whose next filing can't be out yet.
+"""
+
+import datetime
+import os
+
+from portfolio_analysis import jsonlib
+from portfolio_analysis.cache import data_dir
+
+# Periods requested when a symbol already has history stored
+REFRESH_LIMIT = 3
+# Earliest a filing shows up after its period end
+MIN_FILING_LAG_DAYS = 20
+PERIOD_DAYS = {"annual": 365, "quarter": 91}
+
+
+def merge_periods(stored, fetched):
+    """
+    Merge freshly fetched periods into stored ones.
+    Deduplicates by (date, period), fetched rows win, newest first.
+    """
+    merged = {(record["date"], record.get("period")): record for record in stored}
+    for record in fetched:
+        merged[(record["date"], record.get("period"))] = record
+    return sorted(merged.values(), key=lambda record: record["date"], reverse=True)
+
+
+def filing_lag_days(records, default=MIN_FILING_LAG_DAYS):
+    """
+    Median days between period end and filing over a symbol's stored records.
+    Never less than MIN_FILING_LAG_DAYS, `default` when no record has a fillingDate.
+    """
+    lags = []
+    for record in records:
+        try:
+            period_end = datetime.date.fromisoformat(record["date"][:10])
+            filed = datetime.date.fromisoformat(record["fillingDate"][:10])
+        except (KeyError, TypeError, ValueError):
+            continue
+        lags.append((filed - period_end).days)
+    if not lags:
+        return default
+    lags.sort()
+    return max(MIN_FILING_LAG_DAYS, lags[len(lags) // 2])
+
+
+def next_filing_date(latest, period="annual", lag_days=MIN_FILING_LAG_DAYS):
+    """Date the filing after `latest` is expected, None if latest has no usable date."""
+    try:
+        period_end = datetime.date.fromisoformat(latest["date"][:10])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return period_end + datetime.timedelta(days=PERIOD_DAYS[period] + lag_days)
+
+
+def filing_due(latest, period="annual", today=None, lag_days=MIN_FILING_LAG_DAYS):
+    """
+    Could a newer filing than `latest` exist yet?
+    args:
+        latest: most recent stored statement record
+        period: annual or quarter
+        lag_days: days after period end the filing is expected
+    returns:
+        True once the next period end plus lag_days has passed
+    """
+    today = today or datetime.date.today()
+    next_due = next_filing_date(latest, period, lag_days)
+    return next_due is None or today >= next_due
+
+
+class StatementHistory:
+    """
+    Raw statement records on disk, one json file per statement/period/symbol.
+    args:
+        root: directory, defaults to statements/ under the data dir
+    """
+
+    def __init__(self, root=None):
+        if root is None:
+            root = data_dir("statements")
+        self.root = root
+
+    def path_for(self, symbol, statement, period):
+        return os.path.join(self.root, statement, period, f"{symbol}.json")
+
+    def load(self, symbol, statement, period="annual"):
+        """Stored records, newest first, [] if none."""
+        path = self.path_for(symbol, statement, period)
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            return jsonlib.loads(f.read())
+
+    def save(self, symbol, statement, period, records):
+        path = self.path_for(symbol, statement, period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(jsonlib.dumps(records))
+        os.replace(tmp_path, path)
+
+    def merge(self, symbol, statement, period, records):
+        """Merge records into what is stored, e.g. periods that came from a bulk file."""
+        stored = self.load(symbol, statement, period)
+        merged = merge_periods(stored, records)
+        if merged != stored:
+            self.save(symbol, statement, period, merged)
+
+    def merge_frame(self, symbol, statement, period, frame):
+        """merge() for a typed statement DataFrame, missing values stored as null."""
+        frame = frame.astype(object).where(frame.notna(), None)
+        self.merge(symbol, statement, period, frame.to_dict("records"))
+
+    def latest(self, symbol, statement, period="annual"):
+        """Most recent stored record, None if nothing is stored."""
+        records = self.load(symbol, statement, period)
+        return records[0] if records else None
@@ -0,0 +1,182 @@
+"""
+Crash-safe per-symbol job ledger for crawl runs.
+
+Every symbol of a run has a row in an sqlite table (WAL mode, so a crash
+never loses a committed row) with its status, attempt count, last error class
+and timings. Finished and permanently failed symbols are also kept in memory
+so skip checks inside the crawl loop are set lookups. Symbols left "running"
+by a crash are simply run again; retry="transient" re-runs only failures that
+a second attempt could fix (timeouts, dropped connections, 429s and 5xx).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import requests
+
+from portfolio_analysis.cache import data_dir
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+MAX_ATTEMPTS = 3
+
+
+def is_transient(error):
+    """Could the same request succeed if tried again later?"""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+def default_ledger_path():
+    return data_dir("ledger.sqlite")
+
+
+class JobLedger:
+    """
+    args:
+        run: name of the run, e.g. "nyse-2024-05"; symbols are tracked per run
+        path: sqlite file, defaults to ledger.sqlite in the data dir
+    """
+
+    def __init__(self, run, path=None):
+        self.run = run
+        self.path = path or default_ledger_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                run TEXT,
+                symbol TEXT,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                error_class TEXT,
+                error TEXT,
+                transient INTEGER,
+                started_at REAL,
+                finished_at REAL,
+                seconds REAL,
+                PRIMARY KEY (run, symbol)
+            )
+            """
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._started = {}
+        self._done = set()
+        self._failed = {}  # symbol -> (transient, attempts)
+        for symbol, status, transient, attempts in self._db.execute(
+            "SELECT symbol, status, transient, attempts FROM jobs WHERE run = ?", (run,)
+        ):
+            if status == DONE:
+                self._done.add(symbol)
+            elif status == FAILED:
+                self._failed[symbol] = (bool(transient), attempts)
+
+    def is_done(self, symbol):
+        return symbol in self._done
+
+    def should_run(self, symbol, retry="transient", max_attempts=MAX_ATTEMPTS):
+        """
+        args:
+            retry: which failed symbols to run again, "none", "transient" or "all"
+            max_attempts: attempts after which a symbol is left alone
+        """
+        if symbol in self._done:
+            return False
+        if symbol not in self._failed:
+            return True
+        transient, attempts = self._failed[symbol]
+        if attempts >= max_attempts or retry == "none":
+            return False
+        return retry == "all" or transient
+
+    def pending(self, symbols, retry="transient", max_attempts=MAX_ATTEMPTS):
+        """The symbols still to run, in the order given."""
+        return [symbol for symbol in symbols if self.should_run(symbol, retry, max_attempts)]
+
+    def _begin(self, symbol, now):
+        # Every start counts as an attempt, whether or not a row exists yet
+        self._db.execute(
+            """
+            INSERT INTO jobs (run, symbol, status, attempts, started_at) VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (run, symbol) DO UPDATE SET
+                status = excluded.status, attempts = attempts + 1, started_at = excluded.started_at
+            """,
+            (self.run, symbol, RUNNING, now),
+        )
+
+    def start(self, symbol):
+        now = time.time()
+        with self._lock:
+            self._started[symbol] = now
+            self._begin(symbol, now)
+            self._db.commit()
+
+    def succeed(self, symbol):
+        self._finish(symbol, DONE)
+        self._done.add(symbol)
+        self._failed.pop(symbol, None)
+
+    def fail(self, symbol, error):
+        """Record a failure, error being the exception that caused it."""
+        transient = is_transient(error)
+        attempts = self._finish(symbol, FAILED, error, transient)
+        self._failed[symbol] = (transient, attempts)
+
+    def _finish(self, symbol, status, error=None, transient=None):
+        now = time.time()
+        with self._lock:
+            started = self._started.pop(symbol, None)
+            if started is None:
+                # fail() without start(), e.g. the fetch failed before analysis began
+                self._begin(symbol, now)
+                started = now
+            self._db.execute(
+                """
+                UPDATE jobs SET status = ?, error_class = ?, error = ?, transient = ?,
+                    finished_at = ?, seconds = ?
+                WHERE run = ? AND symbol = ?
+                """,
+                (
+                    status,
+                    type(error).__name__ if error is not None else None,
+                    str(error)[:500] if error is not None else None,
+                    None if transient is None else int(transient),
+                    now,
+                    now - started,
+                    self.run,
+                    symbol,
+                ),
+            )
+            self._db.commit()
+            return self._db.execute(
+                "SELECT attempts FROM jobs WHERE run = ? AND symbol = ?", (self.run, symbol)
+            ).fetchone()[0]
+
+    def jobs(self):
+        """Every row of this run as a DataFrame."""
+        with self._lock:
+            return pd.read_sql_query("SELECT * FROM jobs WHERE run = ?", self._db, params=(self.run,))
+
+    def stats(self):
+        """Symbols per status, and failures per error class."""
+        with self._lock:
+            by_status = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE run = ? GROUP BY status", (self.run,)
+            ))
+            by_error = dict(self._db.execute(
+                "SELECT error_class, COUNT(*) FROM jobs WHERE run = ? AND status = ? GROUP BY error_class",
+                (self.run, FAILED),
+            ))
+        return {"status": by_status, "errors": by_error}
@@ -0,0 +1,185 @@
+"""
+Long-format yearly company metrics in an embedded duckdb database.
+
+analyse_single_company_data gives one row per fiscal year per company.
+long_metrics() turns the columns we screen on into (symbol, year, metric,
+value) rows, and MetricsDB keeps them for the whole universe in one columnar
+duckdb file, so questions like "ROC above 15% in each of the last 5 years"
+are one SQL query instead of another crawl.
+"""
+
+import os
+
+import duckdb
+import pandas as pd
+
+from portfolio_analysis.cache import data_dir
+
+METRICS = [
+    "revenue",
+    "revenue_change",
+    "ROC",
+    "ROE",
+    "EBIT",
+    "dividendsPaid",
+    "dividend_payout_ratio",
+    "gross_margin",
+]
+COMPARISONS = (">", ">=", "<", "<=")
+# metric -> column prefix in the old change_df, e.g. ROC for 2021 was roc_2021
+CHANGE_COLUMNS = {
+    "revenue": "revenue",
+    "revenue_change": "revenue_change",
+    "ROC": "roc",
+    "dividendsPaid": "dividendsPaid",
+    "dividend_payout_ratio": "dividend_ratio",
+    "gross_margin": "gross_margin",
+}
+
+
+def long_metrics(analysis, metrics=METRICS):
+    """
+    Yearly metrics of one company as long rows.
+    args:
+        analysis: output of dcf.analyse_single_company_data
+    returns:
+        DataFrame of year, metric, value, missing values dropped
+    """
+    analysis = analysis.sort_values("year").drop_duplicates("year", keep="last")
+    analysis = analysis.assign(
+        revenue_change=analysis["revenue"].pct_change(),
+        gross_margin=(analysis["revenue"] - analysis["costOfRevenue"]) / analysis["revenue"],
+    )
+    present = [metric for metric in metrics if metric in analysis.columns]
+    df = analysis.melt(id_vars="year", value_vars=present, var_name="metric", value_name="value")
+    df["value"] = pd.to_numeric(df["value"], errors="coerce")
+    df = df[df["value"].notna() & ~df["value"].isin([float("inf"), float("-inf")])]
+    return df.astype({"year": "int16"}).reset_index(drop=True)
+
+
+def default_metrics_path():
+    return data_dir("metrics.duckdb")
+
+
+class MetricsDB:
+    """
+    args:
+        path: duckdb file, ":memory:" for a throwaway database
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_metrics_path()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.con = duckdb.connect(self.path)
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metrics (
+                symbol VARCHAR,
+                year SMALLINT,
+                metric VARCHAR,
+                value DOUBLE
+            )
+            """
+        )
+
+    def write(self, frame):
+        """
+        Replace the rows of every symbol in frame.
+        args:
+            frame: symbol, year, metric, value rows, e.g. from long_metrics
+        """
+        if frame is None or len(frame) == 0:
+            return
+        self.con.register("incoming", frame[["symbol", "year", "metric", "value"]])
+        try:
+            self.con.execute("BEGIN TRANSACTION")
+            self.con.execute("DELETE FROM metrics WHERE symbol IN (SELECT DISTINCT symbol FROM incoming)")
+            self.con.execute(
+                "INSERT INTO metrics SELECT symbol, CAST(year AS SMALLINT), metric, CAST(value AS DOUBLE) FROM incoming"
+            )
+            self.con.execute("COMMIT")
+        except Exception:
+            self.con.execute("ROLLBACK")
+            raise
+        finally:
+            self.con.unregister("incoming")
+
+    def query(self, sql, params=None):
+        """Run any SQL against the metrics table, returns a DataFrame."""
+        return self.con.execute(sql, params or []).fetchdf()
+
+    def history(self, symbol, metrics=None):
+        """One company's metrics, a row per year and a column per metric."""
+        df = self.query("SELECT year, metric, value FROM metrics WHERE symbol = ?", [symbol])
+        if metrics:
+            df = df[df["metric"].isin(metrics)]
+        return df.pivot(index="year", columns="metric", values="value").sort_index()
+
+    def consistent(self, metric, threshold, years=5, comparison=">"):
+        """
+        Symbols whose metric passed the threshold in each of their latest
+        `years` reported years, e.g. consistent("ROC", 0.15, years=5).
+        returns:
+            DataFrame of symbol, latest_year, worst, mean
+        """
+        if comparison not in COMPARISONS:
+            raise ValueError(f"comparison must be one of {COMPARISONS}")
+        worst = "min" if comparison.startswith(">") else "max"
+        return self.query(
+            f"""
+            WITH ranked AS (
+                SELECT symbol, year, value,
+                    row_number() OVER (PARTITION BY symbol ORDER BY year DESC) AS recent
+                FROM metrics
+                WHERE metric = ?
+            )
+            SELECT symbol, max(year) AS latest_year, {worst}(value) AS worst, avg(value) AS mean
+            FROM ranked
+            WHERE recent <= ?
+            GROUP BY symbol
+            HAVING count(*) = ? AND bool_and(value {comparison} ?)
+            ORDER BY mean DESC
+            """,
+            [metric, years, years, threshold],
+        )
+
+    def wide(self, metrics=CHANGE_COLUMNS, years=None):
+        """
+        The old change_df layout, a row per symbol with revenue_2022, roc_2021, ...
+        Columns keep the change_df names (see CHANGE_COLUMNS), newest year first;
+        other metrics are named after themselves, e.g. EBIT_2021.
+        args:
+            years: years to include, all of them by default
+        """
+        metrics = list(metrics)
+        df = self.query(
+            f"SELECT * FROM metrics WHERE metric IN ({', '.join('?' for _ in metrics)})", metrics
+        )
+        if years is not None:
+            df = df[df["year"].isin(years)]
+        df = df.pivot_table(index="symbol", columns=["year", "metric"], values="value", aggfunc="last")
+        order = {metric: i for i, metric in enumerate(metrics)}
+        columns = sorted(df.columns, key=lambda column: (-column[0], order[column[1]]))
+        df = df[columns]
+        df.columns = [f"{CHANGE_COLUMNS.get(metric, metric)}_{year}" for year, metric in columns]
+        return df.reset_index()
+
+    def close(self):
+        self.con.close()
+
+
+_metrics_db = None
+
+
+def get_metrics_db():
+    """The process wide database, metrics.duckdb in $PORTFOLIO_ANALYSIS_DATA."""
+    global _metrics_db
+    if _metrics_db is None:
+        _metrics_db = MetricsDB()
+    return _metrics_db
+
+
+def set_metrics_db(metrics_db):
+    global _metrics_db
+    _metrics_db = metrics_db
@@ -0,0 +1,167 @@
+"""
+Dense symbols x fiscal periods x fields panel of statement numbers.
+
+The balance sheet, income statement and cash flow fields of a whole universe
+are packed into one float64 array in a .npy file, period 0 being each
+symbol's latest report like row 0 of the per-company frames in dcf.py. A
+json sidecar holds the symbol and field index maps. Panel.open() memory-maps
+the file read only, so analysis code and worker processes share the pages
+instead of each building DataFrames per company.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from portfolio_analysis.cache import data_dir
+from portfolio_analysis.schemas import BALANCE_SHEET_FIELDS, CASH_FLOW_FIELDS, INCOME_STATEMENT_FIELDS
+
+# dcf.columns first, then whatever the income and cash flow statements add
+PANEL_FIELDS = list(dict.fromkeys(BALANCE_SHEET_FIELDS + INCOME_STATEMENT_FIELDS + CASH_FLOW_FIELDS))
+PANEL_PERIODS = 10
+
+
+def default_panel_path():
+    return data_dir("panel", "fundamentals")
+
+
+def merge_statements(IS, BS, CFS):
+    """
+    One row per (symbol, date) with the fields of all three statements.
+    Fields reported twice (netIncome, inventory, ...) are taken from the first
+    statement that has them, in IS, BS, CFS order.
+    """
+    merged = None
+    for frame in (IS, BS, CFS):
+        if frame is None or len(frame) == 0 or "date" not in frame.columns:
+            continue
+        keep = ["symbol", "date"] + [
+            column for column in frame.columns
+            if column in PANEL_FIELDS and (merged is None or column not in merged.columns)
+        ]
+        frame = frame.loc[:, [column for column in keep if column in frame.columns]]
+        if merged is None:
+            merged = frame
+        else:
+            merged = merged.merge(frame, on=["symbol", "date"], how="outer")
+    if merged is None:
+        return pd.DataFrame(columns=["symbol", "date"])
+    return merged
+
+
+def frame_from_company_data(company_data):
+    """Long frame for Panel.build from {symbol: company data dict}."""
+    frames = []
+    for symbol, cd in company_data.items():
+        statements = []
+        for key in ("IS", "BS", "CFS"):
+            frame = cd.get(key)
+            if frame is not None and len(frame) > 0 and "symbol" not in frame.columns:
+                frame = frame.assign(symbol=symbol)
+            statements.append(frame)
+        frames.append(merge_statements(*statements))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["symbol", "date"])
+
+
+def frame_from_store(store, exchanges=None):
+    """Long frame for Panel.build from the raw statements in a FundamentalsStore."""
+    statements = [
+        store.read_raw(key, exchanges=exchanges, columns=["symbol", "date"] + PANEL_FIELDS)
+        for key in ("IS", "BS", "CFS")
+    ]
+    return merge_statements(*statements)
+
+
+class Panel:
+    """
+    args:
+        values: float array, symbols x periods x fields
+        years: int array, symbols x periods, fiscal year of each period, 0 if missing
+        symbols: symbol per row
+        fields: field per column
+    """
+
+    def __init__(self, values, years, symbols, fields):
+        self.values = values
+        self.years = years
+        self.symbols = list(symbols)
+        self.fields = list(fields)
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.field_index = {field: i for i, field in enumerate(self.fields)}
+
+    @classmethod
+    def build(cls, path, frame, periods=PANEL_PERIODS, fields=PANEL_FIELDS):
+        """
+        Write a panel file from a long frame (symbol, date, fields...) and open it.
+        Keeps each symbol's newest `periods` reports.
+        """
+        fields = list(fields)
+        frame = frame.dropna(subset=["symbol", "date"])
+        frame = frame.sort_values(["symbol", "date"], ascending=[True, False], kind="mergesort")
+        frame = frame.drop_duplicates(["symbol", "date"])
+        period = frame.groupby("symbol", sort=False).cumcount().to_numpy()
+        frame = frame[period < periods]
+        period = period[period < periods]
+        symbols = pd.Categorical(frame["symbol"])
+        rows = symbols.codes
+        shape = (len(symbols.categories), periods, len(fields))
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        values = np.lib.format.open_memmap(path + ".npy.tmp", mode="w+", dtype=np.float64, shape=shape)
+        values[:] = np.nan
+        data = frame.reindex(columns=fields)
+        values[rows, period, :] = data.apply(pd.to_numeric, errors="coerce").to_numpy(np.float64)
+        values.flush()
+        del values
+
+        years = np.lib.format.open_memmap(path + ".years.npy.tmp", mode="w+", dtype=np.int16, shape=shape[:2])
+        years[:] = 0
+        years[rows, period] = pd.to_numeric(frame["date"].astype(str).str[:4], errors="coerce").fillna(0).to_numpy(np.int16)
+        years.flush()
+        del years
+
+        with open(path + ".json.tmp", "w") as f:
+            json.dump({"symbols": list(symbols.categories), "fields": fields, "periods": periods}, f)
+        for suffix in (".npy", ".years.npy", ".json"):
+            os.replace(path + suffix + ".tmp", path + suffix)
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path=None):
+        """Memory-map a built panel read only, None if it was never built."""
+        path = path or default_panel_path()
+        if not os.path.exists(path + ".json"):
+            return None
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        values = np.load(path + ".npy", mmap_mode="r")
+        years = np.load(path + ".years.npy", mmap_mode="r")
+        return cls(values, years, meta["symbols"], meta["fields"])
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.symbol_index
+
+    def get(self, symbol, field, period=0):
+        """One number, NaN if it wasn't reported."""
+        return float(self.values[self.symbol_index[symbol], period, self.field_index[field]])
+
+    def field(self, field):
+        """symbols x periods view of one field, no copy."""
+        return self.values[:, :, self.field_index[field]]
+
+    def company(self, symbol):
+        """periods x fields view of one symbol, no copy."""
+        return self.values[self.symbol_index[symbol]]
+
+    def frame(self, symbol, fields=None):
+        """One symbol as a DataFrame shaped like its statements, newest first."""
+        row = self.symbol_index[symbol]
+        columns = [self.field_index[field] for field in fields] if fields else slice(None)
+        df = pd.DataFrame(self.values[row][:, columns], columns=fields or self.fields)
+        df.insert(0, "calendarYear", self.years[row])
+        return df[df["calendarYear"] > 0].reset_index(drop=True)
@@ -0,0 +1,83 @@
+"""
+Work list for a crawl rerun: only the symbols whose analysis could have changed.
+
+A symbol is worth re-running when a new filing is likely out (its last stored
+statement period plus the company's own typical filing lag has passed), when
+it was listed since the previous universe snapshot or never analysed, or when
+its price has moved enough to change the valuation. Symbols that disappeared
+from the universe are reported as delisted so their old results can be dropped.
+"""
+
+import datetime
+
+import pandas as pd
+
+from portfolio_analysis.history import filing_lag_days, next_filing_date
+
+# Relative price move that makes a stored valuation stale
+PRICE_CHANGE = 0.1
+# Statement whose filing dates drive the plan
+PLAN_STATEMENT = "income-statement"
+
+REASONS = ["new_listing", "not_analysed", "no_history", "filing_due", "price_moved", "delisted"]
+
+
+def plan_refresh(
+    universe,
+    history,
+    symbols=None,
+    previous=None,
+    done_prices=None,
+    period="annual",
+    today=None,
+    price_change=PRICE_CHANGE,
+):
+    """
+    args:
+        universe: current universe.TickerUniverse
+        history: StatementHistory with the stored statements
+        symbols: symbols in scope, defaults to the whole universe
+        previous: the previous TickerUniverse snapshot, to find new listings
+        done_prices: Series symbol -> price at which each symbol was last analysed
+        price_change: relative move against done_prices that triggers a rerun
+    returns:
+        DataFrame of symbol, reason, next_filing; one row per symbol to (re)process
+    """
+    today = today or datetime.date.today()
+    symbols = list(universe.frame["symbol"] if symbols is None else symbols)
+    done_prices = {} if done_prices is None else dict(zip(done_prices.index, done_prices))
+    current_prices = {}
+    if "price" in universe.frame.columns:
+        current_prices = dict(zip(universe.frame["symbol"], universe.frame["price"]))
+
+    rows = []
+    for symbol in symbols:
+        records = history.load(symbol, PLAN_STATEMENT, period)
+        next_filing = next_filing_date(records[0], period, filing_lag_days(records)) if records else None
+        if previous is not None and symbol not in previous.symbol_rows:
+            reason = "new_listing"
+        elif symbol not in done_prices:
+            reason = "not_analysed"
+        elif not records:
+            reason = "no_history"
+        elif next_filing is None or today >= next_filing:
+            reason = "filing_due"
+        elif _price_moved(done_prices[symbol], current_prices.get(symbol), price_change):
+            reason = "price_moved"
+        else:
+            continue
+        rows.append((symbol, reason, next_filing))
+
+    for symbol in done_prices:
+        if symbol not in universe.symbol_rows:
+            rows.append((symbol, "delisted", None))
+
+    work = pd.DataFrame(rows, columns=["symbol", "reason", "next_filing"])
+    work["reason"] = pd.Categorical(work["reason"], categories=REASONS)
+    return work
+
+
+def _price_moved(then, now, price_change):
+    if then is None or now is None or pd.isna(then) or pd.isna(now) or then == 0:
+        return False
+    return abs(now / then - 1) >= price_change
@@ -0,0 +1,142 @@
+"""
+Ragged numeric arrays for the list-valued columns of get_irr's output.
+
+eps_list, dividend_trend, commonstock_repurchased_trend, revenue_trend and
+revenue_change hold a short series per symbol, newest first. Kept as python
+lists in object cells they are stringified to CSV and can't be computed on,
+so RaggedArray stores a whole column as one float64 `values` buffer plus int64
+`offsets` (row i is values[offsets[i]:offsets[i + 1]]), the same layout as an
+arrow list array, so trend filters over the universe become array
+operations. On disk the columns are parquet list columns, see
+store.read_screen_arrays.
+"""
+
+import numpy as np
+
+RAGGED_COLUMNS = [
+    "eps_list",
+    "dividend_trend",
+    "commonstock_repurchased_trend",
+    "revenue_trend",
+    "revenue_change",
+]
+
+
+def parse_cell(cell):
+    """
+    A list cell as a list of floats: lists and arrays as they are, strings
+    written by to_csv ("[1.0, nan, 2.0]") parsed, missing or scalar cells empty.
+    """
+    if cell is None:
+        return []
+    if isinstance(cell, str):
+        text = cell.strip().strip("[]")
+        values = []
+        for item in text.replace("\n", " ").split(","):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                values.append(float(item))
+            except ValueError:
+                values.append(np.nan)
+        return values
+    if isinstance(cell, (list, tuple, np.ndarray)):
+        return [np.nan if value is None else float(value) for value in cell]
+    # NaN written for companies without the series
+    return []
+
+
+class RaggedArray:
+    """
+    args:
+        offsets: int64 array of len(rows) + 1, starting at 0
+        values: float64 array of all rows back to back
+    """
+
+    def __init__(self, offsets, values):
+        self.offsets = offsets
+        self.values = values
+
+    @classmethod
+    def from_cells(cls, cells):
+        """From a column of list cells, see parse_cell."""
+        rows = [parse_cell(cell) for cell in cells]
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        values = np.fromiter((value for row in rows for value in row), dtype=np.float64, count=int(offsets[-1]))
+        return cls(offsets, values)
+
+    @classmethod
+    def from_arrow(cls, array):
+        """From an arrow (large) list array of doubles, sharing its buffers when it can."""
+        if hasattr(array, "combine_chunks"):
+            array = array.combine_chunks()
+        offsets = np.asarray(array.offsets, dtype=np.int64)
+        values = array.flatten().to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+        # flatten() already drops anything before the first offset
+        return cls(offsets - offsets[0], values)
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        return pa.LargeListArray.from_arrays(pa.array(self.offsets), pa.array(self.values))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def row(self, i):
+        """Row i as a view into values."""
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def to_lists(self):
+        return [self.row(i).tolist() for i in range(len(self))]
+
+    def head(self, k):
+        """
+        The first k values of every row as a len x k matrix, NaN padded.
+        Rows are newest first, so column 0 is the latest value.
+        """
+        positions = np.arange(k)
+        present = positions < self.lengths[:, None]
+        out = np.full((len(self), k), np.nan)
+        out[present] = self.values[(self.offsets[:-1, None] + positions)[present]]
+        return out
+
+
+def leading_run(array, predicate, max_years=None):
+    """
+    How many of each row's first values in a row satisfy predicate.
+    e.g. leading_run(revenue_change, lambda v: v > 0) counts the years of
+    uninterrupted revenue growth up to the latest report.
+    """
+    k = max_years if max_years is not None else int(array.lengths.max(initial=0))
+    if k == 0:
+        return np.zeros(len(array), dtype=np.int64)
+    window = array.head(k)
+    with np.errstate(invalid="ignore"):
+        ok = predicate(window) & ~np.isnan(window)
+    return np.where(ok.all(axis=1), k, ok.argmin(axis=1))
+
+
+def increasing(array, years):
+    """True where each of the latest `years` values is above the one before it."""
+    window = array.head(years + 1)
+    with np.errstate(invalid="ignore"):
+        return (window[:, :-1] > window[:, 1:]).all(axis=1)
+
+
+def split_ragged(df, columns=RAGGED_COLUMNS):
+    """
+    Take the list-valued columns out of a frame.
+    returns:
+        (frame without them, {column: RaggedArray})
+    """
+    present = [column for column in columns if column in df.columns]
+    arrays = {column: RaggedArray.from_cells(df[column]) for column in present}
+    return df.drop(columns=present), arrays
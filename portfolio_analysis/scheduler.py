@@ -0,0 +1,232 @@
+"""
+Token bucket scheduler for the FMP per-minute request quota.
+
+Every request made by client.py takes a token first. Requests are queued in
+priority lanes: interactive lookups (the default, e.g. the dashboard) always
+go ahead of bulk crawl traffic, and bulk traffic is never allowed to drain the
+bucket below a reserve kept for interactive use. The bucket state can live in
+an sqlite file so the dashboard and run_script.py share one quota. A 429
+pauses the whole bucket for Retry-After seconds.
+"""
+
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+from portfolio_analysis.cache import DEFAULT_CACHE_DIR
+from portfolio_analysis.telemetry import get_telemetry
+
+LANES = {"interactive": 0, "bulk": 1}
+DEFAULT_QUOTA_PER_MINUTE = 300
+# Share of the bucket bulk traffic leaves untouched for interactive lookups
+BULK_RESERVE = 0.2
+
+_lane = contextvars.ContextVar("fmp_lane", default="interactive")
+
+
+def current_lane():
+    return _lane.get()
+
+
+@contextlib.contextmanager
+def request_priority(lane):
+    """
+    Run the requests made inside the block in a given lane.
+    e.g.
+        with request_priority("bulk"):
+            get_single_company_data(symbol, apikey)
+    """
+    if lane not in LANES:
+        raise ValueError("invalid lane " + str(lane))
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class _MemoryBucket:
+    def __init__(self, capacity):
+        self.state = {"tokens": capacity, "updated": time.time(), "paused_until": 0.0}
+
+    @contextlib.contextmanager
+    def transaction(self):
+        yield self.state
+
+
+class _SqliteBucket:
+    """Bucket state shared between processes through an sqlite row."""
+
+    def __init__(self, path, capacity):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY, tokens REAL, updated REAL, paused_until REAL)"
+        )
+        self._db.execute(
+            "INSERT OR IGNORE INTO bucket VALUES (1, ?, ?, 0)", (capacity, time.time())
+        )
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, updated, paused_until = self._db.execute(
+                "SELECT tokens, updated, paused_until FROM bucket WHERE id = 1"
+            ).fetchone()
+            state = {"tokens": tokens, "updated": updated, "paused_until": paused_until}
+            yield state
+            self._db.execute(
+                "UPDATE bucket SET tokens = ?, updated = ?, paused_until = ? WHERE id = 1",
+                (state["tokens"], state["updated"], state["paused_until"]),
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+
+class QuotaScheduler:
+    """
+    args:
+        per_minute: requests allowed per minute by the FMP plan
+        path: sqlite file to share the bucket across processes, None for in-process only
+    """
+
+    def __init__(self, per_minute=DEFAULT_QUOTA_PER_MINUTE, path=None):
+        # Refill at 90% of the quota and cap bursts at the other 10%, so no
+        # 60 second window can exceed per_minute.
+        self.per_minute = per_minute
+        self.rate = per_minute * 0.9 / 60
+        self.capacity = max(1.0, per_minute * 0.1)
+        if path is None:
+            self._bucket = _MemoryBucket(self.capacity)
+        else:
+            self._bucket = _SqliteBucket(path, self.capacity)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._strikes = 0
+        self.counters = {
+            "granted_interactive": 0,
+            "granted_bulk": 0,
+            "throttled": 0,
+            "wait_seconds": 0.0,
+        }
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(self.capacity, state["tokens"] + elapsed * self.rate)
+        state["updated"] = now
+
+    def _try_take(self, lane):
+        """Take a token if the lane may, otherwise return seconds to wait."""
+        floor = self.capacity * BULK_RESERVE if lane == "bulk" else 0.0
+        with self._bucket.transaction() as state:
+            now = time.time()
+            self._refill(state, now)
+            if now < state["paused_until"]:
+                return state["paused_until"] - now
+            if state["tokens"] - 1 < floor:
+                return (floor + 1 - state["tokens"]) / self.rate
+            state["tokens"] -= 1
+            return 0.0
+
+    def acquire(self, lane=None):
+        """Block until a request in `lane` may be sent."""
+        lane = lane or current_lane()
+        ticket = (LANES[lane], next(self._seq))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    if self._queue[0] == ticket:
+                        wait = self._try_take(lane)
+                        if wait == 0:
+                            heapq.heappop(self._queue)
+                            waited = time.monotonic() - start
+                            self.counters[f"granted_{lane}"] += 1
+                            self.counters["wait_seconds"] += waited
+                            get_telemetry().count("quota_tokens", lane=lane)
+                            get_telemetry().observe("quota_wait_seconds", waited, lane=lane)
+                            self._cond.notify_all()
+                            return
+                        # A process sharing the bucket may free tokens sooner
+                        self._cond.wait(timeout=min(wait, 1.0))
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                raise
+
+    def throttled(self, retry_after=None):
+        """
+        Record a 429. Pauses every lane for Retry-After seconds, or an
+        exponential backoff if the header is missing or not a number.
+        """
+        try:
+            pause = float(retry_after)
+            self._strikes = 0
+        except (TypeError, ValueError):
+            self._strikes += 1
+            pause = min(60.0, 2.0 ** self._strikes)
+        with self._cond:
+            self.counters["throttled"] += 1
+            get_telemetry().count("throttled")
+            with self._bucket.transaction() as state:
+                state["tokens"] = 0.0
+                state["paused_until"] = max(state["paused_until"], time.time() + pause)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Queue depth per lane and current quota headroom."""
+        with self._cond:
+            with self._bucket.transaction() as state:
+                now = time.time()
+                self._refill(state, now)
+                headroom = state["tokens"]
+                paused_for = max(0.0, state["paused_until"] - now)
+            stats = dict(self.counters)
+            for lane, priority in LANES.items():
+                stats[f"queue_{lane}"] = sum(1 for p, _ in self._queue if p == priority)
+        stats["headroom"] = int(headroom)
+        stats["paused_for"] = paused_for
+        stats["per_minute"] = self.per_minute
+        return stats
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    The process wide scheduler. The quota comes from $FMP_QUOTA_PER_MINUTE and
+    the bucket is shared through the cache directory unless caching is off.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            per_minute = int(
+                os.environ.get("FMP_QUOTA_PER_MINUTE", DEFAULT_QUOTA_PER_MINUTE)
+            )
+            cache_dir = os.environ.get("PORTFOLIO_ANALYSIS_CACHE", DEFAULT_CACHE_DIR)
+            path = None if cache_dir == "off" else os.path.join(cache_dir, "quota.sqlite")
+            _scheduler = QuotaScheduler(per_minute=per_minute, path=path)
+    return _scheduler
+
+
+def set_scheduler(scheduler):
+    global _scheduler
+    _scheduler = scheduler
@@ -0,0 +1,367 @@
+"""
+Field schemas for the FMP payloads the analysis code depends on.
+
+decode_records() turns a parsed payload straight into typed columns instead of
+letting pd.json_normalize infer dtypes row by row: numbers become float64
+(int64 when no value is missing), repeated strings become categoricals and
+dates stay as strings because dcf.py slices them. Fields missing from a
+schema are kept out of the frame and recorded in `side_channel`.
+"""
+
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+FLOAT = "float"
+INT = "int"
+CATEGORY = "category"
+STR = "str"
+BOOL = "bool"
+
+STATEMENT_META = {
+    "date": STR,
+    "symbol": CATEGORY,
+    "reportedCurrency": CATEGORY,
+    "cik": STR,
+    "fillingDate": STR,
+    "acceptedDate": STR,
+    "calendarYear": STR,
+    "period": CATEGORY,
+    "link": STR,
+    "finalLink": STR,
+}
+
+INCOME_STATEMENT_FIELDS = [
+    "revenue",
+    "costOfRevenue",
+    "grossProfit",
+    "grossProfitRatio",
+    "researchAndDevelopmentExpenses",
+    "generalAndAdministrativeExpenses",
+    "sellingAndMarketingExpenses",
+    "sellingGeneralAndAdministrativeExpenses",
+    "otherExpenses",
+    "operatingExpenses",
+    "costAndExpenses",
+    "interestIncome",
+    "interestExpense",
+    "depreciationAndAmortization",
+    "ebitda",
+    "ebitdaratio",
+    "operatingIncome",
+    "operatingIncomeRatio",
+    "totalOtherIncomeExpensesNet",
+    "incomeBeforeTax",
+    "incomeBeforeTaxRatio",
+    "incomeTaxExpense",
+    "netIncome",
+    "netIncomeRatio",
+    "eps",
+    "epsdiluted",
+    "weightedAverageShsOut",
+    "weightedAverageShsOutDil",
+]
+
+BALANCE_SHEET_FIELDS = [
+    "cashAndCashEquivalents",
+    "shortTermInvestments",
+    "cashAndShortTermInvestments",
+    "netReceivables",
+    "inventory",
+    "otherCurrentAssets",
+    "totalCurrentAssets",
+    "propertyPlantEquipmentNet",
+    "goodwill",
+    "intangibleAssets",
+    "goodwillAndIntangibleAssets",
+    "longTermInvestments",
+    "taxAssets",
+    "otherNonCurrentAssets",
+    "totalNonCurrentAssets",
+    "otherAssets",
+    "totalAssets",
+    "accountPayables",
+    "shortTermDebt",
+    "taxPayables",
+    "deferredRevenue",
+    "otherCurrentLiabilities",
+    "totalCurrentLiabilities",
+    "longTermDebt",
+    "deferredRevenueNonCurrent",
+    "deferredTaxLiabilitiesNonCurrent",
+    "otherNonCurrentLiabilities",
+    "totalNonCurrentLiabilities",
+    "otherLiabilities",
+    "capitalLeaseObligations",
+    "totalLiabilities",
+    "preferredStock",
+    "commonStock",
+    "retainedEarnings",
+    "accumulatedOtherComprehensiveIncomeLoss",
+    "othertotalStockholdersEquity",
+    "totalStockholdersEquity",
+    "totalLiabilitiesAndStockholdersEquity",
+    "minorityInterest",
+    "totalEquity",
+    "totalLiabilitiesAndTotalEquity",
+    "totalInvestments",
+    "totalDebt",
+    "netDebt",
+]
+
+CASH_FLOW_FIELDS = [
+    "netIncome",
+    "depreciationAndAmortization",
+    "deferredIncomeTax",
+    "stockBasedCompensation",
+    "changeInWorkingCapital",
+    "accountsReceivables",
+    "inventory",
+    "accountsPayables",
+    "otherWorkingCapital",
+    "otherNonCashItems",
+    "netCashProvidedByOperatingActivites",
+    "investmentsInPropertyPlantAndEquipment",
+    "acquisitionsNet",
+    "purchasesOfInvestments",
+    "salesMaturitiesOfInvestments",
+    "otherInvestingActivites",
+    "netCashUsedForInvestingActivites",
+    "debtRepayment",
+    "commonStockIssued",
+    "commonStockRepurchased",
+    "dividendsPaid",
+    "otherFinancingActivites",
+    "netCashUsedProvidedByFinancingActivities",
+    "effectOfForexChangesOnCash",
+    "netChangeInCash",
+    "cashAtEndOfPeriod",
+    "cashAtBeginningOfPeriod",
+    "operatingCashFlow",
+    "capitalExpenditure",
+    "freeCashFlow",
+]
+
+RATIOS_TTM_FIELDS = [
+    "dividendYielTTM",
+    "dividendYielPercentageTTM",
+    "dividendYieldTTM",
+    "dividendPerShareTTM",
+    "peRatioTTM",
+    "pegRatioTTM",
+    "payoutRatioTTM",
+    "currentRatioTTM",
+    "quickRatioTTM",
+    "cashRatioTTM",
+    "daysOfSalesOutstandingTTM",
+    "daysOfInventoryOutstandingTTM",
+    "operatingCycleTTM",
+    "daysOfPayablesOutstandingTTM",
+    "cashConversionCycleTTM",
+    "grossProfitMarginTTM",
+    "operatingProfitMarginTTM",
+    "pretaxProfitMarginTTM",
+    "netProfitMarginTTM",
+    "effectiveTaxRateTTM",
+    "returnOnAssetsTTM",
+    "returnOnEquityTTM",
+    "returnOnCapitalEmployedTTM",
+    "netIncomePerEBTTTM",
+    "ebtPerEbitTTM",
+    "ebitPerRevenueTTM",
+    "debtRatioTTM",
+    "debtEquityRatioTTM",
+    "longTermDebtToCapitalizationTTM",
+    "totalDebtToCapitalizationTTM",
+    "interestCoverageTTM",
+    "cashFlowToDebtRatioTTM",
+    "companyEquityMultiplierTTM",
+    "receivablesTurnoverTTM",
+    "payablesTurnoverTTM",
+    "inventoryTurnoverTTM",
+    "fixedAssetTurnoverTTM",
+    "assetTurnoverTTM",
+    "operatingCashFlowPerShareTTM",
+    "freeCashFlowPerShareTTM",
+    "cashPerShareTTM",
+    "operatingCashFlowSalesRatioTTM",
+    "freeCashFlowOperatingCashFlowRatioTTM",
+    "cashFlowCoverageRatiosTTM",
+    "shortTermCoverageRatiosTTM",
+    "capitalExpenditureCoverageRatioTTM",
+    "dividendPaidAndCapexCoverageRatioTTM",
+    "priceBookValueRatioTTM",
+    "priceToBookRatioTTM",
+    "priceToSalesRatioTTM",
+    "priceEarningsRatioTTM",
+    "priceToFreeCashFlowsRatioTTM",
+    "priceToOperatingCashFlowsRatioTTM",
+    "priceCashFlowRatioTTM",
+    "priceEarningsToGrowthRatioTTM",
+    "priceSalesRatioTTM",
+    "enterpriseValueMultipleTTM",
+    "priceFairValueTTM",
+]
+
+SCHEMAS = {
+    "income": dict(STATEMENT_META, **{field: FLOAT for field in INCOME_STATEMENT_FIELDS}),
+    "balance": dict(STATEMENT_META, **{field: FLOAT for field in BALANCE_SHEET_FIELDS}),
+    "cash-flow": dict(STATEMENT_META, **{field: FLOAT for field in CASH_FLOW_FIELDS}),
+    "ratios": {field: FLOAT for field in RATIOS_TTM_FIELDS},
+    "market-cap": {"symbol": CATEGORY, "date": STR, "marketCap": INT},
+    "profile": {
+        "symbol": CATEGORY,
+        "price": FLOAT,
+        "beta": FLOAT,
+        "volAvg": INT,
+        "mktCap": INT,
+        "lastDiv": FLOAT,
+        "range": STR,
+        "changes": FLOAT,
+        "companyName": STR,
+        "currency": CATEGORY,
+        "cik": STR,
+        "isin": STR,
+        "cusip": STR,
+        "exchange": CATEGORY,
+        "exchangeShortName": CATEGORY,
+        "industry": CATEGORY,
+        "website": STR,
+        "description": STR,
+        "ceo": STR,
+        "sector": CATEGORY,
+        "country": CATEGORY,
+        "fullTimeEmployees": STR,
+        "phone": STR,
+        "address": STR,
+        "city": STR,
+        "state": STR,
+        "zip": STR,
+        "dcfDiff": FLOAT,
+        "dcf": FLOAT,
+        "image": STR,
+        "ipoDate": STR,
+        "defaultImage": BOOL,
+        "isEtf": BOOL,
+        "isActivelyTrading": BOOL,
+        "isAdr": BOOL,
+        "isFund": BOOL,
+    },
+}
+
+
+class SideChannel:
+    """
+    Where fields that aren't in a schema end up.
+    Counts every unknown (schema, field) seen and keeps the most recent
+    extras frame per (schema, symbol).
+    """
+
+    def __init__(self, max_frames=256):
+        self.max_frames = max_frames
+        self._counts = Counter()
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, schema_name, extras):
+        symbol = None
+        if "symbol" in extras.columns and len(extras) > 0:
+            symbol = extras["symbol"].iloc[0]
+        with self._lock:
+            for field in extras.columns:
+                if field != "symbol":
+                    self._counts[(schema_name, field)] += 1
+            self._frames[(schema_name, symbol)] = extras
+            self._frames.move_to_end((schema_name, symbol))
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+
+    def counts(self):
+        """DataFrame of schema, field, times_seen."""
+        with self._lock:
+            rows = [(schema, field, n) for (schema, field), n in self._counts.items()]
+        return pd.DataFrame(rows, columns=["schema", "field", "times_seen"])
+
+    def extras(self, schema_name, symbol=None):
+        """Unknown fields from the latest payload of a schema/symbol, None if none."""
+        with self._lock:
+            return self._frames.get((schema_name, symbol))
+
+
+side_channel = SideChannel()
+
+
+def _column(values, kind):
+    if kind == FLOAT:
+        try:
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(np.float64)
+    if kind == INT:
+        column = _column(values, FLOAT)
+        if np.isnan(column).any():
+            return column
+        return column.astype(np.int64)
+    if kind == CATEGORY:
+        return pd.Categorical(values)
+    if kind == BOOL:
+        if any(value is None for value in values):
+            return np.array(values, dtype=object)
+        return np.array(values, dtype=bool)
+    return np.array(values, dtype=object)
+
+
+def decode_records(payload, schema_name):
+    """
+    Decode a parsed FMP payload into a typed DataFrame.
+    args:
+        payload: list of records (a single record dict is treated as one row)
+        schema_name: key of SCHEMAS
+    returns:
+        DataFrame with one column per schema field, in schema order
+    """
+    schema = SCHEMAS[schema_name]
+    if isinstance(payload, dict):
+        if "Error Message" in payload:
+            return pd.json_normalize(payload)
+        payload = [payload]
+    records = payload or []
+
+    data = {
+        field: _column([record.get(field) for record in records], kind)
+        for field, kind in schema.items()
+    }
+    df = pd.DataFrame(data, index=pd.RangeIndex(len(records)))
+
+    unknown = []
+    seen = set(schema)
+    for record in records:
+        for field in record:
+            if field not in seen:
+                seen.add(field)
+                unknown.append(field)
+    if unknown:
+        key = ["symbol"] if "symbol" in schema else []
+        extras = pd.DataFrame.from_records(records, columns=key + unknown)
+        side_channel.record(schema_name, extras)
+    return df
+
+
+def decode_frame(frame, schema_name):
+    """
+    Type an already tabular payload (e.g. a bulk CSV chunk) like decode_records.
+    Columns outside the schema are dropped, missing ones are all null.
+    """
+    schema = SCHEMAS[schema_name]
+    n = len(frame)
+    data = {}
+    for field, kind in schema.items():
+        if field in frame.columns:
+            column = frame[field]
+            values = column.astype(object).where(column.notna(), None).tolist()
+        else:
+            values = [None] * n
+        data[field] = _column(values, kind)
+    return pd.DataFrame(data, index=pd.RangeIndex(n))
@@ -0,0 +1,129 @@
+"""
+Compact in-memory screener frames for the dashboard.
+
+Screen outputs come back from CSV as float64 and free-text object columns.
+Every Streamlit session holds on to the screen, so compact_frame() downcasts
+numbers to the smallest dtype that keeps their values, turns repeated strings
+(sector, industry, exchange, ...) into categoricals and leaves unique ones
+(symbol, name) alone. memory_report() shows what each column costs.
+"""
+
+import numpy as np
+import pandas as pd
+
+from portfolio_analysis.ragged import RaggedArray, leading_run
+
+# Share of distinct values below which a string column becomes categorical
+CATEGORICAL_THRESHOLD = 0.5
+# Relative error float32 may introduce before a column stays float64
+FLOAT32_RTOL = 1e-6
+# Stand-in for missing PE, MCap and ROC so they fail the minimum filters
+MISSING = 404
+SCREEN_COLUMN_ORDER = [
+    "symbol", "name", "price", "npv_regression", "npv_mean", "dividend_ratio", "ROC",
+    "EarningsYield", "revenue_trend", "revenue_change", "PE", "eps_base",
+]
+
+
+def _compact_numeric(values):
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return values
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return pd.to_numeric(values, downcast="integer")
+    finite = values[np.isfinite(values)]
+    if len(finite) == len(values) and len(finite) and (finite == finite.round()).all():
+        return pd.to_numeric(values, downcast="integer")
+    as32 = values.astype(np.float32)
+    if len(finite) == 0 or np.allclose(as32.to_numpy(np.float64), values.to_numpy(), rtol=FLOAT32_RTOL, equal_nan=True):
+        return as32
+    return values
+
+
+def _is_list_column(values):
+    # list cells of the arrow screens, see ragged.RAGGED_COLUMNS
+    first = values.dropna().head(1)
+    return len(first) == 1 and isinstance(first.iloc[0], (list, tuple, np.ndarray))
+
+
+def compact_frame(df, categorical_threshold=CATEGORICAL_THRESHOLD):
+    """
+    Smallest dtypes that keep the values.
+    returns:
+        new DataFrame, df is left as it was
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            columns[column] = _compact_numeric(values)
+        elif values.dtype == object and not _is_list_column(values) and values.nunique() <= categorical_threshold * len(values):
+            columns[column] = values.astype("category")
+        else:
+            columns[column] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def load_screen_csv(buffer):
+    """
+    Read a screen CSV into a compact frame.
+    Index columns saved by to_csv are dropped and infinities become NaN.
+    """
+    return load_screen_frame(pd.read_csv(buffer))
+
+
+def load_screen_frame(df):
+    """A screen read from CSV or arrow as a compact frame, see load_screen_csv."""
+    df = df.loc[:, ~df.columns.str.startswith("Unnamed")]
+    numeric = df.select_dtypes("number").columns
+    # assign rather than set on the .loc slice above, which may be a view
+    df = df.assign(**{column: df[column].replace([np.inf, -np.inf], np.nan) for column in numeric})
+    return compact_frame(df)
+
+
+def prepare_screen(df):
+    """
+    Rank and tidy a screen once, so sessions can filter it without copying.
+    Adds ROC_rank, EarningsYield_rank and Total_rank (highest first, missing
+    values last), orders by Total_rank, fills missing PE/MCap/ROC with MISSING
+    and sector with "Nan", and puts SCREEN_COLUMN_ORDER first.
+    revenue_growth_years counts the years of uninterrupted revenue growth up
+    to the latest report, from the revenue_change series (0 when there is none).
+    """
+    ranks = {
+        f"{column}_rank": df[column].rank(ascending=False, method="first", na_option="bottom").astype(np.int32)
+        for column in ("ROC", "EarningsYield")
+    }
+    df = df.assign(**ranks)
+    df["Total_rank"] = df["ROC_rank"] + df["EarningsYield_rank"]
+    if "revenue_change" in df.columns:
+        revenue_change = RaggedArray.from_cells(df["revenue_change"])
+        df["revenue_growth_years"] = leading_run(revenue_change, lambda change: change > 0).astype(np.int8)
+    else:
+        # Older screens have no revenue_change, count them as no growth rather than fail the filter
+        df["revenue_growth_years"] = np.int8(0)
+    df = df.sort_values("Total_rank", kind="mergesort")
+    for column in ("PE", "MCap", "ROC"):
+        df[column] = df[column].fillna(MISSING)
+    if isinstance(df["sector"].dtype, pd.CategoricalDtype):
+        if "Nan" not in df["sector"].cat.categories:
+            df["sector"] = df["sector"].cat.add_categories("Nan")
+    df["sector"] = df["sector"].fillna("Nan")
+    order = [column for column in SCREEN_COLUMN_ORDER if column in df.columns]
+    order += [column for column in df.columns if column not in order]
+    return df[order]
+
+
+def memory_report(df):
+    """
+    Bytes per column, largest first, with a total row.
+    returns:
+        DataFrame of column, dtype, bytes
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        "column": usage.index,
+        "dtype": [str(df[column].dtype) for column in usage.index],
+        "bytes": usage.to_numpy(),
+    }).sort_values("bytes", ascending=False, kind="mergesort")
+    total = pd.DataFrame({"column": ["total"], "dtype": [""], "bytes": [int(usage.sum())]})
+    return pd.concat([report, total], ignore_index=True)
@@ -0,0 +1,88 @@
+"""
+Single-flight registry: identical requests in flight at the same time share
+one call.
+
+Streamlit runs every dashboard session on its own thread, so several users on
+the same ticker would otherwise each miss the cache and hit FMP for the same
+url at once. The first caller for a key runs the fetch, everyone arriving
+while it is running waits on the same Future and gets the same parsed result,
+or the same exception. asyncio callers await the Future instead of blocking.
+"""
+
+import asyncio
+import threading
+from concurrent import futures
+
+
+class SingleFlight:
+    def __init__(self):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    def _begin(self, key):
+        """The Future for key and whether this caller has to run the call."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+                return future, False
+            future = futures.Future()
+            self._in_flight[key] = future
+            self.counters["calls"] += 1
+            return future, True
+
+    def _run(self, key, future, fn):
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """
+        Run fn() unless a call for key is already in flight, then wait for it.
+        args:
+            key: identity of the request, e.g. the url without its apikey
+            fn: zero argument callable
+        returns:
+            fn's result, shared by every caller that coalesced onto it
+        """
+        future, leader = self._begin(key)
+        if leader:
+            self._run(key, future, fn)
+        return future.result()
+
+    async def do_async(self, key, fn, executor=None):
+        """do() for asyncio tasks, fn runs on `executor` (the loop default if None)."""
+        future, leader = self._begin(key)
+        if leader:
+            asyncio.get_running_loop().run_in_executor(executor, self._run, key, future, fn)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self._in_flight)
+        return stats
+
+
+_single_flight = None
+
+
+def get_single_flight():
+    """The process wide registry used by data.fetch_json."""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
+
+
+def set_single_flight(single_flight):
+    global _single_flight
+    _single_flight = single_flight
@@ -0,0 +1,129 @@
+"""
+Append-only result sink for screening runs.
+
+Rows (dicts or Series) and small per-symbol tables are buffered until
+`batch_size` rows have accumulated, then written as one parquet part file, so
+memory stays flat however many symbols a run covers and a crash only loses
+the current batch. to_frame() concatenates the parts once at the end. Parts
+left by a crashed run are picked up again by the next ResultSink on the same
+directory; clear() removes them once the results are stored elsewhere.
+"""
+
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from portfolio_analysis.cache import data_dir
+from portfolio_analysis.store import uniform_types
+
+BATCH_SIZE = 500
+
+
+def run_dir(name):
+    """Directory for a named run's sink, under runs/ in the data dir."""
+    return data_dir("runs", name)
+
+
+class ResultSink:
+    """
+    args:
+        path: directory for the part files
+        batch_size: rows buffered before a part is written
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(path, exist_ok=True)
+        self._rows = []
+        self._frames = []
+        self._buffered = 0
+        parts = self._part_files()
+        self._parts = len(parts)
+        self._written = sum(pq.read_metadata(part).num_rows for part in parts)
+
+    def _part_files(self):
+        return sorted(
+            os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if name.startswith("part-") and name.endswith(".parquet")
+        )
+
+    def append(self, row):
+        """Add one result row, a dict or a Series."""
+        self._rows.append(dict(row))
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def append_frame(self, frame, **columns):
+        """
+        Add a table of rows, e.g. one symbol's metrics.
+        columns: constant columns to add, e.g. symbol="AAPL"
+        """
+        if frame is None or len(frame) == 0:
+            return
+        self._frames.append(frame.assign(**columns) if columns else frame)
+        self._buffered += len(frame)
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write whatever is buffered as the next part file."""
+        frames = list(self._frames)
+        if self._rows:
+            frames.append(pd.DataFrame(self._rows))
+        if not frames:
+            return
+        frame = uniform_types(pd.concat(frames, ignore_index=True))
+        path = os.path.join(self.path, f"part-{self._parts:05d}.parquet")
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self._rows, self._frames, self._buffered = [], [], 0
+        self._parts += 1
+        self._written += len(frame)
+
+    def __len__(self):
+        """Rows in the sink, written and buffered."""
+        return self._written + self._buffered
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def to_frame(self):
+        """Everything written so far, buffered rows included, as one DataFrame."""
+        self.flush()
+        parts = [pq.read_table(path).to_pandas() for path in self._part_files()]
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True)
+
+    def symbols(self):
+        """Symbols already in the sink, e.g. to skip them after a crash."""
+        symbols = set()
+        for path in self._part_files():
+            if "symbol" in pq.read_schema(path).names:
+                symbols.update(pq.read_table(path, columns=["symbol"]).column("symbol").to_pylist())
+        symbols.update(row.get("symbol") for row in self._rows)
+        for frame in self._frames:
+            if "symbol" in frame.columns:
+                symbols.update(frame["symbol"])
+        symbols.discard(None)
+        return symbols
+
+    def clear(self):
+        """Drop the buffer and every part file."""
+        self._rows, self._frames, self._buffered = [], [], 0
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self._parts = 0
+        self._written = 0
@@ -0,0 +1,283 @@
+"""
+Monthly screen outputs kept as a base snapshot plus per-run deltas.
+
+Most rows of a screen are the same from one run to the next, so commit()
+writes only what changed since the previous version: inserted rows in full,
+removed keys, and for updated rows just the columns that changed (a changed
+column whose new value is missing is stored as null and listed in _changed, so
+it is told apart from "unchanged"). Every CHECKPOINT_EVERY deltas, or when a
+delta touches more than COMPACT_SHARE of the rows, a full base is written
+instead, so reading any version applies a handful of small files at most.
+
+    v00000-base.parquet
+    v00001-delta.parquet
+    v00002-delta.parquet
+    manifest.json
+"""
+
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from portfolio_analysis.cache import data_dir
+from portfolio_analysis.store import uniform_types
+
+CHECKPOINT_EVERY = 6
+COMPACT_SHARE = 0.5
+MANIFEST = "manifest.json"
+OP = "_op"
+CHANGED = "_changed"
+
+
+def default_snapshot_dir(name):
+    return data_dir("snapshots", name)
+
+
+def _cell_text(cell):
+    if cell is None or (isinstance(cell, float) and np.isnan(cell)):
+        return None
+    if isinstance(cell, (list, tuple, np.ndarray)):
+        return repr([float(value) for value in cell])
+    return str(cell)
+
+
+def _same(old, new):
+    """Element wise equality with missing == missing, list cells compared by value."""
+    if old.dtype == object or new.dtype == object:
+        old, new = old.map(_cell_text), new.map(_cell_text)
+    return ((old == new) | (old.isna() & new.isna())).to_numpy()
+
+
+def diff(old, new, key="symbol"):
+    """
+    What changed between two versions of a table.
+    returns:
+        (inserted keys, removed keys, {key: [changed columns]})
+    """
+    old = old.drop_duplicates(key, keep="last").set_index(key)
+    new = new.drop_duplicates(key, keep="last").set_index(key)
+    inserted = new.index.difference(old.index, sort=False)
+    removed = old.index.difference(new.index, sort=False)
+    common = new.index.intersection(old.index, sort=False)
+    changed = {}
+    for column in new.columns:
+        if column in old.columns:
+            differs = ~_same(old.loc[common, column], new.loc[common, column])
+        else:
+            differs = new.loc[common, column].notna().to_numpy()
+        for symbol in common[differs]:
+            changed.setdefault(symbol, []).append(column)
+    return list(inserted), list(removed), changed
+
+
+class SnapshotLog:
+    """
+    args:
+        path: directory of the snapshot files
+        key: column identifying a row
+    """
+
+    def __init__(self, path, key="symbol"):
+        self.path = path
+        self.key = key
+        os.makedirs(path, exist_ok=True)
+        manifest = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                self.versions = json.load(f)["versions"]
+        else:
+            self.versions = []
+        self._latest = None  # (version, frame) of the last read or commit
+
+    def __len__(self):
+        return len(self.versions)
+
+    def _write(self, name, frame):
+        path = os.path.join(self.path, name)
+        table = pa.Table.from_pandas(frame.reset_index(drop=True), preserve_index=False)
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def _save_manifest(self):
+        path = os.path.join(self.path, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"key": self.key, "versions": self.versions}, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def _index(self, version):
+        """Position in self.versions of a version number, label or -1 style offset."""
+        if version is None:
+            version = -1
+        if isinstance(version, str):
+            for i, entry in enumerate(self.versions):
+                if entry["label"] == version:
+                    return i
+            raise KeyError(f"No snapshot labelled {version}")
+        index = version if version >= 0 else len(self.versions) + version
+        if not 0 <= index < len(self.versions):
+            raise KeyError(f"No snapshot version {version}")
+        return index
+
+    def commit(self, frame, label=None):
+        """
+        Record frame as the next version.
+        args:
+            label: name of the run, e.g. "2022-12"; defaults to today's date
+        returns:
+            the manifest entry, with inserted/updated/removed counts
+        """
+        frame = uniform_types(frame.drop_duplicates(self.key, keep="last").reset_index(drop=True))
+        version = len(self.versions)
+        entry = {
+            "version": version,
+            "label": label or datetime.date.today().isoformat(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "rows": len(frame),
+            "columns": list(frame.columns),
+        }
+        if self.versions:
+            previous = self.read()
+            inserted, removed, changed = diff(previous, frame, self.key)
+            entry.update(inserted=len(inserted), updated=len(changed), removed=len(removed))
+            since_base = version - self._base_index(version - 1)
+            touched = len(inserted) + len(changed) + len(removed)
+            if since_base < CHECKPOINT_EVERY and touched <= COMPACT_SHARE * max(len(frame), 1):
+                entry["kind"] = "delta"
+                entry["file"] = f"v{version:05d}-delta.parquet"
+                self._write(entry["file"], self._delta(frame, inserted, removed, changed))
+            else:
+                entry["kind"] = "base"
+        else:
+            entry.update(inserted=len(frame), updated=0, removed=0)
+            entry["kind"] = "base"
+        if entry["kind"] == "base":
+            entry["file"] = f"v{version:05d}-base.parquet"
+            self._write(entry["file"], frame)
+        self.versions.append(entry)
+        self._save_manifest()
+        self._latest = (version, frame)
+        return entry
+
+    def _delta(self, frame, inserted, removed, changed):
+        indexed = frame.set_index(self.key)
+        columns = list(indexed.columns)
+        parts = []
+        if inserted:
+            rows = indexed.loc[inserted].reset_index()
+            parts.append(rows.assign(**{OP: "insert", CHANGED: [columns] * len(rows)}))
+        if changed:
+            updated = list(changed)
+            rows = pd.DataFrame(index=pd.Index(updated, name=self.key), columns=columns, dtype=object)
+            pairs = pd.Series(changed).explode()
+            for column, symbols in pairs.groupby(pairs).groups.items():
+                rows.loc[symbols, column] = indexed.loc[symbols, column]
+            rows = rows.reset_index()
+            parts.append(rows.assign(**{OP: "update", CHANGED: [changed[symbol] for symbol in updated]}))
+        if removed:
+            parts.append(pd.DataFrame({self.key: removed, OP: "remove", CHANGED: [[] for _ in removed]}))
+        if not parts:
+            return pd.DataFrame({self.key: [], OP: [], CHANGED: []})
+        delta = pd.concat(parts, ignore_index=True).infer_objects()
+        # Null columns take their type from the base on read, everything else as in the store
+        return uniform_types(delta.drop(columns=[CHANGED])).assign(**{CHANGED: delta[CHANGED]})
+
+    def _base_index(self, index):
+        while self.versions[index]["kind"] != "base":
+            index -= 1
+        return index
+
+    def read_delta(self, version=None):
+        """The raw delta rows of one version, a base reads as all inserts."""
+        entry = self.versions[self._index(version)]
+        frame = pq.read_table(os.path.join(self.path, entry["file"])).to_pandas()
+        if entry["kind"] == "base":
+            frame = frame.assign(**{OP: "insert", CHANGED: [list(frame.columns)] * len(frame)})
+        return frame
+
+    def read(self, version=None):
+        """
+        The full table as of a version: the nearest base with the deltas after it applied.
+        args:
+            version: version number, label, or negative offset; latest by default
+        """
+        index = self._index(version)
+        if self._latest is not None and self._latest[0] == index:
+            return self._latest[1].copy()
+        start = self._base_index(index)
+        if self.versions[start].get("pruned"):
+            raise KeyError(f"Snapshot version {index} was pruned")
+        frame = pq.read_table(os.path.join(self.path, self.versions[start]["file"])).to_pandas()
+        frame = frame.set_index(self.key)
+        for entry in self.versions[start + 1:index + 1]:
+            frame = self._apply(frame, pq.read_table(os.path.join(self.path, entry["file"])).to_pandas())
+        frame = frame.reset_index().reindex(columns=self.versions[index]["columns"])
+        self._latest = (index, frame)
+        return frame.copy()
+
+    def _apply(self, frame, delta):
+        ops = delta[OP]
+        frame = frame.drop(index=delta.loc[ops == "remove", self.key], errors="ignore")
+        updates = delta[ops == "update"].set_index(self.key)
+        if len(updates):
+            pairs = updates[CHANGED].explode().dropna()
+            for column, symbols in pairs.groupby(pairs).groups.items():
+                if column not in frame.columns:
+                    frame[column] = None
+                if frame[column].dtype != object and updates[column].dtype == object:
+                    frame[column] = frame[column].astype(object)
+                frame.loc[symbols, column] = updates.loc[symbols, column]
+        inserts = delta[ops == "insert"].drop(columns=[OP, CHANGED]).set_index(self.key)
+        if len(inserts):
+            frame = pd.concat([frame, inserts.dropna(axis=1, how="all")])
+        return frame
+
+    def changes(self, since=None, version=None):
+        """
+        What changed between two versions, by default the latest against the one before.
+        returns:
+            DataFrame of key, change (inserted, removed or updated), column, old, new;
+            one row per changed column of updated rows
+        """
+        index = self._index(version)
+        since = index - 1 if since is None else self._index(since)
+        new = self.read(index)
+        if since < 0:
+            return pd.DataFrame({self.key: new[self.key], "change": "inserted", "column": None, "old": None, "new": None})
+        old = self.read(since)
+        inserted, removed, changed = diff(old, new, self.key)
+        old, new = old.set_index(self.key), new.set_index(self.key)
+        rows = [{self.key: symbol, "change": "inserted"} for symbol in inserted]
+        rows += [{self.key: symbol, "change": "removed"} for symbol in removed]
+        for symbol, columns in changed.items():
+            for column in columns:
+                rows.append({
+                    self.key: symbol,
+                    "change": "updated",
+                    "column": column,
+                    "old": old.at[symbol, column] if column in old.columns else None,
+                    "new": new.at[symbol, column],
+                })
+        return pd.DataFrame(rows, columns=[self.key, "change", "column", "old", "new"])
+
+    def summary(self):
+        """One row per version with its kind and inserted/updated/removed counts."""
+        columns = ["version", "label", "kind", "created", "rows", "inserted", "updated", "removed", "file"]
+        return pd.DataFrame(self.versions).reindex(columns=columns)
+
+    def prune(self, keep_bases=2):
+        """Delete the files of versions older than the last keep_bases bases."""
+        bases = [i for i, entry in enumerate(self.versions) if entry["kind"] == "base"]
+        if len(bases) <= keep_bases:
+            return
+        first = bases[-keep_bases]
+        for entry in self.versions[:first]:
+            path = os.path.join(self.path, entry["file"])
+            if os.path.exists(path):
+                os.remove(path)
+            entry["pruned"] = True
+        self._save_manifest()
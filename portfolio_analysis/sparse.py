@@ -0,0 +1,264 @@
+"""
+Sparse storage for as-reported financial statements.
+
+financial-statement-full-as-reported has hundreds of XBRL style tags per
+period, and any one company reports a small share of them, so a dense frame
+over a universe is mostly NaN. Here each tag gets an integer id in a tag
+dictionary and only reported values are kept, as CSR arrays:
+
+    symbol_offsets  symbol i owns periods symbol_offsets[i]:symbol_offsets[i + 1]
+    period_offsets  period j owns entries period_offsets[j]:period_offsets[j + 1]
+    tag_ids, values one entry per reported number, sorted by tag within a period
+
+The arrays are .npy files opened memory-mapped, with a json sidecar for the
+tag, symbol and period labels. select() projects a few tags for a few symbols
+without touching the rest. Non-numeric tags (document type, links, dates) are
+not stored.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from portfolio_analysis.cache import data_dir
+
+# Record keys that describe the filing rather than report a number
+META_FIELDS = {
+    "symbol", "date", "period", "calendarYear", "reportedCurrency", "cik",
+    "fillingDate", "acceptedDate", "link", "finalLink", "documenttype",
+}
+ARRAYS = ("symbol_offsets", "period_offsets", "tag_ids", "values")
+
+
+def default_sparse_path():
+    return data_dir("as_reported", "statements")
+
+
+def _number(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+class SparseWriter:
+    """
+    Builds the CSR arrays one company at a time.
+    args:
+        path: file prefix, path.<array>.npy and path.json are written on close()
+        base: SparseStatements to extend, its tag ids are kept so keep() can
+            copy its companies without re-encoding them
+    """
+
+    def __init__(self, path=None, base=None):
+        self.path = path or default_sparse_path()
+        self.base = base
+        self.tags = {tag: i for i, tag in enumerate(base.tags)} if base is not None else {}
+        self.symbols = []
+        self.dates = []
+        self.periods = []
+        self._symbol_offsets = [0]
+        self._period_offsets = [0]
+        self._tag_ids = []
+        self._values = []
+        self._entries = 0
+
+    def add(self, symbol, records):
+        """
+        Add one company.
+        args:
+            records: as-reported records, one dict per period, e.g. streaming.iter_records
+        returns:
+            number of periods added, a company without any isn't added
+        """
+        # Kept aside until the records run out, a payload failing half way adds nothing
+        tag_ids, values, dates, periods = [], [], [], []
+        new_tags = {}
+        for record in records:
+            ids, numbers = [], []
+            for tag, value in record.items():
+                if tag in META_FIELDS:
+                    continue
+                value = _number(value)
+                if value is None:
+                    continue
+                tag_id = self.tags.get(tag)
+                if tag_id is None:
+                    tag_id = new_tags.setdefault(tag, len(self.tags) + len(new_tags))
+                ids.append(tag_id)
+                numbers.append(value)
+            ids = np.array(ids, dtype=np.int32)
+            order = np.argsort(ids, kind="stable")
+            tag_ids.append(ids[order])
+            values.append(np.array(numbers, dtype=np.float64)[order])
+            dates.append(record.get("date"))
+            periods.append(record.get("period"))
+        if not dates:
+            return 0
+        self.tags.update(new_tags)
+        self._append(symbol, tag_ids, values, dates, periods)
+        return len(dates)
+
+    def keep(self, symbol):
+        """Copy a company unchanged from the base arrays."""
+        base = self.base
+        row = base.symbol_index[symbol]
+        first, last = base.symbol_offsets[row], base.symbol_offsets[row + 1]
+        tag_ids, values = [], []
+        for period in range(first, last):
+            start, end = base.period_offsets[period], base.period_offsets[period + 1]
+            # Copies, the base files are replaced on close()
+            tag_ids.append(np.array(base.tag_ids[start:end], dtype=np.int32))
+            values.append(np.array(base.values[start:end], dtype=np.float64))
+        self._append(symbol, tag_ids, values, list(base.dates[first:last]), list(base.periods[first:last]))
+
+    def _append(self, symbol, tag_ids, values, dates, periods):
+        for ids in tag_ids:
+            self._entries += len(ids)
+            self._period_offsets.append(self._entries)
+        self._tag_ids += tag_ids
+        self._values += values
+        self.dates += dates
+        self.periods += periods
+        self.symbols.append(symbol)
+        self._symbol_offsets.append(len(self.dates))
+
+    def close(self):
+        """Write the arrays and return them opened as SparseStatements."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        arrays = {
+            "symbol_offsets": np.array(self._symbol_offsets, dtype=np.int64),
+            "period_offsets": np.array(self._period_offsets, dtype=np.int64),
+            "tag_ids": np.concatenate(self._tag_ids) if self._tag_ids else np.zeros(0, dtype=np.int32),
+            "values": np.concatenate(self._values) if self._values else np.zeros(0, dtype=np.float64),
+        }
+        for name, array in arrays.items():
+            with open(f"{self.path}.{name}.npy.tmp", "wb") as f:
+                np.save(f, array)
+        meta = {"tags": list(self.tags), "symbols": self.symbols, "dates": self.dates, "periods": self.periods}
+        with open(self.path + ".json.tmp", "w") as f:
+            json.dump(meta, f)
+        for name in ARRAYS:
+            os.replace(f"{self.path}.{name}.npy.tmp", f"{self.path}.{name}.npy")
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+        return SparseStatements.open(self.path)
+
+
+class SparseStatements:
+    """
+    args:
+        symbol_offsets, period_offsets, tag_ids, values: the CSR arrays
+        tags: tag per id
+        symbols: symbol per row of symbol_offsets
+        dates, periods: filing date and period label per period
+    """
+
+    def __init__(self, symbol_offsets, period_offsets, tag_ids, values, tags, symbols, dates, periods):
+        self.symbol_offsets = symbol_offsets
+        self.period_offsets = period_offsets
+        self.tag_ids = tag_ids
+        self.values = values
+        self.tags = list(tags)
+        self.symbols = list(symbols)
+        self.dates = np.array(dates, dtype=object)
+        self.periods = np.array(periods, dtype=object)
+        self.tag_index = {tag: i for i, tag in enumerate(self.tags)}
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    @classmethod
+    def open(cls, path=None, mmap=True):
+        """Load arrays written by SparseWriter, memory-mapped read only by default."""
+        path = path or default_sparse_path()
+        if not os.path.exists(path + ".json"):
+            return None
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        arrays = [np.load(f"{path}.{name}.npy", mmap_mode=mode) for name in ARRAYS]
+        return cls(*arrays, meta["tags"], meta["symbols"], meta["dates"], meta["periods"])
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    @property
+    def density(self):
+        """Share of the dense periods x tags matrix that holds a value."""
+        cells = len(self.dates) * len(self.tags)
+        return len(self.values) / cells if cells else 0.0
+
+    def _period_rows(self, symbols):
+        if symbols is None:
+            return np.arange(len(self.dates))
+        rows = [self.symbol_index[symbol] for symbol in symbols if symbol in self.symbol_index]
+        starts, ends = self.symbol_offsets[rows], self.symbol_offsets[np.array(rows, dtype=np.int64) + 1]
+        return _ranges(starts, ends)
+
+    def select(self, tags, symbols=None):
+        """
+        Reported values of some tags for some symbols, a row per period.
+        args:
+            tags: tags to project, unknown tags come back as NaN columns
+            symbols: symbols to read, all of them if None
+        returns:
+            DataFrame of symbol, date, period and one column per tag
+        """
+        tags = list(tags)
+        period_rows = self._period_rows(symbols)
+        starts, ends = self.period_offsets[period_rows], self.period_offsets[period_rows + 1]
+        entries = _ranges(starts, ends)
+        # output row of every entry, tag column of the ones asked for
+        entry_row = np.repeat(np.arange(len(period_rows)), ends - starts)
+        lookup = np.full(len(self.tags) + 1, -1, dtype=np.int64)
+        for column, tag in enumerate(tags):
+            if tag in self.tag_index:
+                lookup[self.tag_index[tag]] = column
+        entry_column = lookup[np.asarray(self.tag_ids[entries], dtype=np.int64)]
+        keep = entry_column >= 0
+        out = np.full((len(period_rows), len(tags)), np.nan)
+        out[entry_row[keep], entry_column[keep]] = self.values[entries[keep]]
+
+        owner = np.searchsorted(self.symbol_offsets, period_rows, side="right") - 1
+        df = pd.DataFrame(out, columns=tags)
+        df.insert(0, "period", self.periods[period_rows])
+        df.insert(0, "date", self.dates[period_rows])
+        df.insert(0, "symbol", np.array(self.symbols, dtype=object)[owner] if len(owner) else [])
+        return df
+
+    def triplets(self, symbols=None):
+        """The stored values in long form: symbol, date, period, tag, value."""
+        period_rows = self._period_rows(symbols)
+        starts, ends = self.period_offsets[period_rows], self.period_offsets[period_rows + 1]
+        entries = _ranges(starts, ends)
+        rows = np.repeat(period_rows, ends - starts)
+        owner = np.searchsorted(self.symbol_offsets, rows, side="right") - 1
+        return pd.DataFrame({
+            "symbol": np.array(self.symbols, dtype=object)[owner] if len(owner) else [],
+            "date": self.dates[rows],
+            "period": self.periods[rows],
+            "tag": np.array(self.tags, dtype=object)[np.asarray(self.tag_ids[entries], dtype=np.int64)] if len(entries) else [],
+            "value": self.values[entries],
+        })
+
+    def coverage(self):
+        """How many periods report each tag, most common first."""
+        counts = np.bincount(np.asarray(self.tag_ids, dtype=np.int64), minlength=len(self.tags))
+        return pd.Series(counts, index=self.tags, name="periods").sort_values(ascending=False, kind="mergesort")
+
+
+def _ranges(starts, ends):
+    """Concatenation of arange(start, end) for each pair, without a python loop."""
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(ends, dtype=np.int64) - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    # position within the output minus position within each range gives the shift per range
+    shifts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return np.arange(total, dtype=np.int64) + shifts
@@ -0,0 +1,466 @@
+"""
+Local stand-in for financialmodelingprep.com.
+
+Serves the same /api/v3/... and /api/v4/... url shapes data.py builds, from a
+fixture corpus on disk, falling back to deterministic synthetic payloads. It
+can inject latency, 5xx errors and 429s, and in record mode it fetches misses
+from the real API and saves them into the corpus.
+
+    python -m portfolio_analysis.standin --port 8765 --latency 0.05 --throttle-rate 0.01
+    FMP_BASE_URL=http://127.0.0.1:8765 streamlit run dashboard.py
+
+Record real responses (needs a key):
+    python -m portfolio_analysis.standin --record --apikey $FMP_APIKEY
+"""
+
+import argparse
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, urlsplit
+from urllib.request import urlopen
+
+from portfolio_analysis.endpoints import BULK_FAMILIES, endpoint_family, request_key
+from portfolio_analysis.schemas import (
+    BALANCE_SHEET_FIELDS,
+    CASH_FLOW_FIELDS,
+    INCOME_STATEMENT_FIELDS,
+    RATIOS_TTM_FIELDS,
+)
+
+DEFAULT_CORPUS = os.path.join("fixtures", "fmp")
+UPSTREAM = "https://financialmodelingprep.com"
+EXCHANGES = [
+    "New York Stock Exchange",
+    "Nasdaq Global Select",
+    "Toronto",
+    "London Stock Exchange",
+]
+SECTORS = ["Technology", "Industrials", "Consumer Cyclical", "Healthcare", "Energy"]
+
+
+class FixtureCorpus:
+    """
+    Recorded responses, one json file per request key under root.
+    A key with a query string falls back to the same path without one, so a
+    fixture recorded with limit=400 also answers limit=5.
+    """
+
+    def __init__(self, root=DEFAULT_CORPUS):
+        self.root = root
+
+    def path_for(self, key):
+        return os.path.join(self.root, quote(key, safe="") + ".json")
+
+    def load(self, key):
+        for candidate in (key, key.split("?")[0]):
+            path = self.path_for(candidate)
+            if os.path.exists(path):
+                with open(path) as f:
+                    return json.load(f)
+        return None
+
+    def save(self, key, payload):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.path_for(key), "w") as f:
+            json.dump(payload, f)
+
+
+def _rng(*parts):
+    return random.Random(zlib.crc32("|".join(str(p) for p in parts).encode()))
+
+
+def _company(symbol):
+    rng = _rng(symbol)
+    return {
+        "symbol": symbol,
+        "revenue": rng.uniform(5e7, 5e10),
+        "growth": rng.uniform(-0.05, 0.2),
+        "gross_margin": rng.uniform(0.2, 0.7),
+        "opex_ratio": rng.uniform(0.05, 0.3),
+        "shares": rng.uniform(1e7, 2e9),
+        "pe": rng.uniform(5, 40),
+        "payout": rng.choice([0.0, 0.0, rng.uniform(0.1, 0.6)]),
+        "sector": rng.choice(SECTORS),
+        "exchange": rng.choice(EXCHANGES),
+    }
+
+
+def _period_ends(period, count):
+    year = datetime.date.today().year - 1
+    if period == "quarter":
+        ends = []
+        for i in range(count):
+            q_year, q = divmod(year * 4 + 3 - i, 4)
+            month = 3 * (q + 1)
+            day = 31 if month in (3, 12) else 30
+            ends.append((datetime.date(q_year, month, day), f"Q{q + 1}"))
+        return ends
+    return [(datetime.date(year - i, 12, 31), "FY") for i in range(count)]
+
+
+def _statement(family, symbol, query):
+    company = _company(symbol)
+    period = query.get("period", "annual")
+    count = int(query.get("limit", 10 if period == "annual" else 40))
+    count = min(count, 10 if period == "annual" else 40)
+    scale = 1.0 if period == "annual" else 0.25
+    rng = _rng(symbol, family, period)
+    records = []
+    for i, (end, label) in enumerate(_period_ends(period, count)):
+        revenue = company["revenue"] * scale / (1 + company["growth"]) ** i
+        cost = revenue * (1 - company["gross_margin"])
+        opex = revenue * company["opex_ratio"]
+        net_income = (revenue - cost - opex) * 0.75
+        record = {
+            "date": end.isoformat(),
+            "symbol": symbol,
+            "reportedCurrency": "USD",
+            "cik": f"{zlib.crc32(symbol.encode()):010d}",
+            "fillingDate": (end + datetime.timedelta(days=60)).isoformat(),
+            "acceptedDate": (end + datetime.timedelta(days=60)).isoformat() + " 16:05:00",
+            "calendarYear": str(end.year),
+            "period": label,
+            "link": "",
+            "finalLink": "",
+        }
+        if family == "income-statement":
+            for field in INCOME_STATEMENT_FIELDS:
+                record[field] = revenue * rng.uniform(0.01, 0.1)
+            record.update(
+                revenue=revenue,
+                costOfRevenue=cost,
+                grossProfit=revenue - cost,
+                operatingExpenses=opex,
+                operatingIncome=revenue - cost - opex,
+                netIncome=net_income,
+                weightedAverageShsOut=company["shares"],
+                weightedAverageShsOutDil=company["shares"],
+                eps=net_income / company["shares"],
+                epsdiluted=net_income / company["shares"],
+            )
+        elif family == "balance-sheet-statement":
+            for field in BALANCE_SHEET_FIELDS:
+                record[field] = revenue * rng.uniform(0.01, 0.5)
+            record.update(
+                totalCurrentAssets=revenue * 0.6,
+                totalCurrentLiabilities=revenue * 0.4,
+                totalAssets=revenue * 2.0,
+                totalLiabilities=revenue * 1.1,
+            )
+        else:
+            for field in CASH_FLOW_FIELDS:
+                record[field] = revenue * rng.uniform(-0.1, 0.1)
+            record.update(
+                netIncome=net_income,
+                dividendsPaid=-net_income * company["payout"],
+                commonStockRepurchased=-abs(net_income) * rng.uniform(0, 0.2),
+            )
+        records.append(record)
+    return records
+
+
+def _price(symbol):
+    company = _company(symbol)
+    net_income = company["revenue"] * (company["gross_margin"] - company["opex_ratio"]) * 0.75
+    return round(max(1.0, abs(net_income / company["shares"]) * company["pe"]), 2)
+
+
+def _historical(symbol, query):
+    end = datetime.date.fromisoformat(query["to"]) if "to" in query else datetime.date.today()
+    if "from" in query:
+        start = datetime.date.fromisoformat(query["from"])
+    else:
+        start = end - datetime.timedelta(days=int(query.get("timeseries", 5 * 365)) * 7 // 5)
+    rng = _rng(symbol, "prices")
+    price = _price(symbol)
+    bars = []
+    day = end
+    while day >= start:
+        if day.weekday() < 5:
+            close = round(price * (1 + 0.3 * ((zlib.crc32(f"{symbol}{day}".encode()) % 1000) / 1000 - 0.5)), 2)
+            bars.append({"date": day.isoformat(), "open": close, "high": close, "low": close, "close": close, "volume": rng.randint(10_000, 10_000_000)})
+        day -= datetime.timedelta(days=1)
+    if "timeseries" in query:
+        bars = bars[: int(query["timeseries"])]
+    return {"symbol": symbol, "historical": bars}
+
+
+def _as_reported(symbol):
+    rng = _rng(symbol, "as-reported")
+    tags = [f"tag{i:04d}" for i in range(600)]
+    periods = []
+    for end, label in _period_ends("annual", 10):
+        record = {"date": end.isoformat(), "symbol": symbol, "period": label, "documenttype": "10-K"}
+        for tag in tags:
+            if rng.random() < 0.15:
+                record[tag] = rng.uniform(-1e9, 1e9)
+        periods.append(record)
+    return periods
+
+
+def _csv(records):
+    fields = list(dict.fromkeys(field for record in records for field in record))
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=fields, restval="")
+    writer.writeheader()
+    writer.writerows(records)
+    return out.getvalue()
+
+
+def _bulk(family, query, universe_size):
+    """The universe's rows of a bulk endpoint, as the CSV text FMP serves."""
+    symbols = [f"SYN{i:04d}" for i in range(universe_size)]
+    if family == "profile/all":
+        return _csv(synthetic_payload(f"/api/v3/profile/{','.join(symbols)}"))
+    if family == "ratios-ttm-bulk":
+        return _csv([dict(symbol=symbol, **synthetic_payload(f"/api/v3/ratios-ttm/{symbol}")[0]) for symbol in symbols])
+    statement = family[: -len("-bulk")]
+    year = query.get("year", str(datetime.date.today().year - 1))
+    period = query.get("period", "annual")
+    records = [
+        record
+        for symbol in symbols
+        for record in _statement(statement, symbol, {"period": period})
+        if record["date"][:4] == year
+    ]
+    return _csv(records)
+
+
+def synthetic_payload(path, universe_size=200):
+    """
+    A deterministic payload shaped like FMP's answer to path.
+    returns:
+        parsed json, CSV text for the bulk endpoints, None for endpoints it can't fake
+    """
+    parts = urlsplit(path)
+    query = dict(parse_qsl(parts.query))
+    family = endpoint_family(path)
+    symbol = query.get("symbol") or parts.path.rstrip("/").rsplit("/", 1)[-1]
+
+    if family in BULK_FAMILIES:
+        return _bulk(family, query, universe_size)
+    if family == "stock/list":
+        return [
+            {
+                "symbol": f"SYN{i:04d}",
+                "name": f"Synthetic Company {i}",
+                "price": _price(f"SYN{i:04d}"),
+                "exchange": _company(f"SYN{i:04d}")["exchange"],
+                "exchangeShortName": "SYN",
+                "type": "stock",
+            }
+            for i in range(universe_size)
+        ]
+    if family in ("income-statement", "balance-sheet-statement", "cash-flow-statement"):
+        return _statement(family, symbol, query)
+    if family in ("quote", "profile"):
+        records = []
+        for ticker in symbol.split(","):
+            company = _company(ticker)
+            price = _price(ticker)
+            record = {
+                "symbol": ticker,
+                "price": price,
+                "mktCap": int(price * company["shares"]),
+                "marketCap": int(price * company["shares"]),
+                "companyName": f"Synthetic {ticker}",
+                "name": f"Synthetic {ticker}",
+                "currency": "USD",
+                "exchange": company["exchange"],
+                "sector": company["sector"],
+                "industry": company["sector"] + " Services",
+                "pe": company["pe"],
+            }
+            records.append(record)
+        return records
+    if family == "market-capitalization":
+        company = _company(symbol)
+        return [{"symbol": symbol, "date": datetime.date.today().isoformat(), "marketCap": int(_price(symbol) * company["shares"])}]
+    if family == "ratios-ttm":
+        rng = _rng(symbol, "ratios")
+        record = {field: rng.uniform(0, 2) for field in RATIOS_TTM_FIELDS}
+        record["peRatioTTM"] = record["priceEarningsRatioTTM"] = _company(symbol)["pe"]
+        return [record]
+    if family == "historical-price-full":
+        return _historical(symbol, query)
+    if family == "financial-statement-full-as-reported":
+        return _as_reported(symbol)
+    if family == "stock_peers":
+        return [{"symbol": symbol, "peersList": [f"SYN{i:04d}" for i in range(5)]}]
+    if family in ("insider-trading", "social-sentiment", "stock_news", "sp500_constituent"):
+        return []
+    return None
+
+
+class StandinConfig:
+    def __init__(
+        self,
+        corpus=DEFAULT_CORPUS,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        retry_after=1,
+        synthetic=True,
+        record=False,
+        upstream=UPSTREAM,
+        apikey="",
+        universe_size=200,
+        seed=0,
+    ):
+        self.corpus = FixtureCorpus(corpus)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.synthetic = synthetic
+        self.record = record
+        self.upstream = upstream.rstrip("/")
+        self.apikey = apikey
+        self.universe_size = universe_size
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "fixtures": 0, "recorded": 0, "synthetic": 0, "missing": 0, "errors": 0, "throttled": 0}
+
+    def roll(self):
+        with self.lock:
+            return self.rng.random()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=(), content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _record(self, config, key):
+        query = [(k, v) for k, v in parse_qsl(urlsplit(self.path).query) if k != "apikey"]
+        query.append(("apikey", config.apikey))
+        url = config.upstream + urlsplit(self.path).path + "?" + "&".join(f"{k}={v}" for k, v in query)
+        with urlopen(url, timeout=60) as response:
+            body = response.read()
+            # Bulk CSVs are kept as one json string
+            if "csv" in response.headers.get("Content-Type", ""):
+                payload = body.decode()
+            else:
+                payload = json.loads(body)
+        config.corpus.save(key, payload)
+        config.count("recorded")
+        return payload
+
+    def do_GET(self):
+        config = self.server.config
+        config.count("requests")
+        if config.latency or config.jitter:
+            time.sleep(max(0.0, config.latency + config.jitter * (2 * config.roll() - 1)))
+        if config.roll() < config.throttle_rate:
+            config.count("throttled")
+            body = b'{"Error Message": "Limit Reach"}'
+            return self._send(429, body, [("Retry-After", str(config.retry_after))])
+        if config.roll() < config.error_rate:
+            config.count("errors")
+            return self._send(500, b'{"Error Message": "injected error"}')
+
+        key = request_key(self.path)
+        payload = config.corpus.load(key)
+        if payload is not None:
+            config.count("fixtures")
+        elif config.record:
+            payload = self._record(config, key)
+        elif config.synthetic:
+            payload = synthetic_payload(self.path, universe_size=config.universe_size)
+            if payload is not None:
+                config.count("synthetic")
+        if payload is None:
+            # FMP answers unknown tickers with an empty list
+            config.count("missing")
+            payload = []
+        if isinstance(payload, str):
+            return self._send(200, payload.encode(), content_type="text/csv")
+        self._send(200, json.dumps(payload).encode())
+
+
+def make_server(host="127.0.0.1", port=8765, **config):
+    """Build a stand-in server, see StandinConfig for the options."""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.config = StandinConfig(**config)
+    return server
+
+
+def start_in_thread(host="127.0.0.1", port=0, **config):
+    """
+    Start a stand-in on a background thread, e.g. for a benchmark.
+    returns:
+        (server, base_url); call server.shutdown() when done
+    """
+    server = make_server(host, port, **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for financialmodelingprep.com")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="fixture directory")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--no-synthetic", action="store_true", help="only serve recorded fixtures")
+    parser.add_argument("--record", action="store_true", help="fetch misses from the real API into the corpus")
+    parser.add_argument("--upstream", default=UPSTREAM)
+    parser.add_argument("--apikey", default=os.environ.get("FMP_APIKEY", ""))
+    parser.add_argument("--universe-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        corpus=args.corpus,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        synthetic=not args.no_synthetic,
+        record=args.record,
+        upstream=args.upstream,
+        apikey=args.apikey,
+        universe_size=args.universe_size,
+        seed=args.seed,
+    )
+    print(f"Serving FMP stand-in on http://{args.host}:{args.port} from {args.corpus}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.config.counters)
@@ -0,0 +1,301 @@
+"""
+Local columnar store for raw fundamentals and screen outputs.
+
+Everything is parquet under hive style directories so pyarrow can prune whole
+partitions from the path and only read the columns asked for:
+
+    raw/statement=IS/exchange=NASDAQ/fiscal_year=2022/part-0.parquet
+    screens/screen=irr/exchange=NASDAQ/part-0.parquet
+
+Each statement type and each screen is its own dataset, since their columns
+have nothing in common.
+
+Each partition is a single file rewritten on update, deduplicated on its key,
+so reruns replace rows instead of appending copies. Loading the ROC and PE
+columns of one exchange's screen touches one small file.
+"""
+
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from portfolio_analysis.cache import data_dir
+from portfolio_analysis.ragged import RaggedArray, parse_cell
+
+# company data key -> rows that identify a record within a partition
+RAW_KEYS = {
+    "IS": ["symbol", "date", "period"],
+    "BS": ["symbol", "date", "period"],
+    "CFS": ["symbol", "date", "period"],
+    "profile": ["symbol"],
+    "MC": ["symbol", "date"],
+}
+PART_FILE = "part-0.parquet"
+
+
+def default_store_dir():
+    return data_dir("store")
+
+
+def _partition_value(value):
+    # "/" would nest directories, everything else is a valid path segment
+    return str(value).replace("/", "_")
+
+
+def fiscal_year(frame):
+    """Fiscal year per row: calendarYear when reported, else the year of date."""
+    today = datetime.date.today().year
+    if "calendarYear" in frame.columns:
+        years = pd.to_numeric(frame["calendarYear"], errors="coerce")
+    else:
+        years = pd.Series(float("nan"), index=frame.index)
+    if "date" in frame.columns:
+        years = years.fillna(pd.to_numeric(frame["date"].astype(str).str[:4], errors="coerce"))
+    return years.fillna(today).astype(int)
+
+
+def uniform_types(frame):
+    """
+    Types that stay the same from one partition file to the next, so the
+    dataset schema unifies: ints as float64, list cells as list<double>,
+    other python objects as strings. All-null columns stay null and take the
+    type of the other files on read.
+    """
+    frame = frame.copy()
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_integer_dtype(values.dtype):
+            frame[column] = values.astype("float64")
+        elif values.dtype == object and _holds_lists(values):
+            frame[column] = [parse_cell(cell) or None for cell in values]
+        elif values.dtype == object:
+            frame[column] = values.where(values.isna(), values.astype(str))
+    return frame
+
+
+def _holds_lists(values):
+    first = next((cell for cell in values if cell is not None and not isinstance(cell, float)), None)
+    return isinstance(first, (list, tuple, np.ndarray))
+
+
+def _unified_schema(dataset):
+    """
+    Schema covering every partition file, not just the first one, so columns
+    added by a later run are readable. Only the parquet footers are read.
+    """
+    fields = {}
+    for fragment in dataset.get_fragments():
+        for field in fragment.physical_schema:
+            if field.name not in fields or pa.types.is_null(fields[field.name].type):
+                fields[field.name] = field
+    partition_fields = [field for field in dataset.schema if field.name not in fields]
+    return pa.schema(list(fields.values()) + partition_fields)
+
+
+class FundamentalsStore:
+    """
+    args:
+        root: store directory, defaults to store/ under the data dir
+    """
+
+    def __init__(self, root=None):
+        self.root = root or default_store_dir()
+
+    def _write_partition(self, directory, frame, key):
+        path = os.path.join(directory, PART_FILE)
+        if os.path.exists(path):
+            existing = pq.read_table(path).to_pandas()
+            frame = pd.concat([existing, frame], ignore_index=True)
+        if key:
+            frame = frame.drop_duplicates(key, keep="last")
+        frame = uniform_types(frame)
+        os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pandas(frame.reset_index(drop=True), preserve_index=False)
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def _read(self, directory, columns=None, filter=None):
+        if not os.path.exists(directory):
+            return pd.DataFrame(columns=columns)
+        dataset = ds.dataset(directory, format="parquet", partitioning="hive")
+        dataset = ds.dataset(directory, schema=_unified_schema(dataset), format="parquet", partitioning="hive")
+        if columns is not None:
+            columns = [column for column in columns if column in dataset.schema.names]
+        return dataset.to_table(columns=columns, filter=filter).to_pandas()
+
+    def write_raw(self, statement, frame, exchange):
+        """
+        Store raw rows of one statement type for one exchange.
+        args:
+            statement: IS, BS, CFS, profile or MC
+            frame: rows for any number of symbols
+        """
+        if len(frame) == 0:
+            return
+        years = fiscal_year(frame)
+        # The partition path carries these, a file column of the same name would clash
+        frame = frame.drop(columns=["exchange", "statement", "fiscal_year"], errors="ignore")
+        for year, rows in frame.groupby(years):
+            directory = os.path.join(
+                self.root,
+                "raw",
+                f"statement={statement}",
+                f"exchange={_partition_value(exchange)}",
+                f"fiscal_year={year}",
+            )
+            key = [column for column in RAW_KEYS.get(statement, []) if column in rows.columns]
+            self._write_partition(directory, rows, key)
+
+    def write_company_data(self, company_data, exchanges):
+        """
+        Store a batch of company data dicts, one partition rewrite per
+        (exchange, statement, year) rather than per symbol.
+        args:
+            company_data: {symbol: company data dict}
+            exchanges: {symbol: exchange}
+        """
+        batches = {}
+        for symbol, cd in company_data.items():
+            exchange = exchanges.get(symbol, "unknown")
+            for statement in RAW_KEYS:
+                frame = cd.get(statement)
+                if frame is None or len(frame) == 0 or "Error Message" in frame.columns:
+                    continue
+                if "symbol" not in frame.columns:
+                    frame = frame.assign(symbol=symbol)
+                batches.setdefault((exchange, statement), []).append(frame)
+        for (exchange, statement), frames in batches.items():
+            self.write_raw(statement, pd.concat(frames, ignore_index=True), exchange)
+
+    def read_raw(self, statement, exchanges=None, years=None, symbols=None, columns=None):
+        """
+        Raw rows, reading only the partitions and columns needed.
+        args:
+            statement: IS, BS, CFS, profile or MC
+            exchanges: list of exchanges, None for all
+            years: list of fiscal years, None for all
+            symbols: list of symbols, None for all
+            columns: columns to load, None for all
+        """
+        filter = None
+        conditions = []
+        if exchanges is not None:
+            conditions.append(ds.field("exchange").isin([_partition_value(e) for e in exchanges]))
+        if years is not None:
+            conditions.append(ds.field("fiscal_year").isin([int(year) for year in years]))
+        if symbols is not None:
+            conditions.append(ds.field("symbol").isin(list(symbols)))
+        for condition in conditions:
+            filter = condition if filter is None else filter & condition
+        directory = os.path.join(self.root, "raw", f"statement={statement}")
+        return self._read(directory, columns=columns, filter=filter)
+
+    def write_screen(self, screen, frame, exchange_column="exchange", drop=None):
+        """
+        Store a screen output (one row per symbol), replacing the rows of the
+        same symbols. Rows without an exchange go under exchange=unknown.
+        args:
+            drop: symbols to remove from the stored screen, e.g. delisted ones
+        """
+        if drop is not None:
+            self.drop_from_screen(screen, drop)
+        if len(frame) == 0:
+            return
+        frame = frame.loc[:, ~frame.columns.str.startswith("Unnamed")]
+        if exchange_column in frame.columns:
+            exchanges = frame[exchange_column].fillna("unknown")
+        else:
+            exchanges = pd.Series("unknown", index=frame.index)
+        for exchange, rows in frame.groupby(exchanges):
+            directory = os.path.join(
+                self.root, "screens", f"screen={screen}", f"exchange={_partition_value(exchange)}"
+            )
+            # The exchange comes back from the partition path on read
+            rows = rows.drop(columns=[exchange_column], errors="ignore")
+            self._write_partition(directory, rows, ["symbol"] if "symbol" in rows.columns else None)
+
+    def drop_from_screen(self, screen, symbols):
+        """Remove the rows of symbols from every exchange partition of a screen."""
+        symbols = set(symbols)
+        directory = os.path.join(self.root, "screens", f"screen={screen}")
+        if not symbols or not os.path.exists(directory):
+            return
+        for partition in os.listdir(directory):
+            path = os.path.join(directory, partition, PART_FILE)
+            if not os.path.exists(path):
+                continue
+            table = pq.read_table(path)
+            if "symbol" not in table.column_names:
+                continue
+            keep = pc.invert(pc.is_in(table.column("symbol"), value_set=pa.array(list(symbols), type=table.schema.field("symbol").type)))
+            kept = table.filter(keep)
+            if kept.num_rows == table.num_rows:
+                continue
+            if kept.num_rows == 0:
+                os.remove(path)
+                os.rmdir(os.path.join(directory, partition))
+                continue
+            pq.write_table(kept, path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def read_screen(self, screen, exchanges=None, columns=None, filter=None):
+        """
+        A stored screen, e.g. read_screen("irr", ["NASDAQ"], ["symbol", "ROC", "PE"]).
+        args:
+            filter: extra pyarrow.dataset expression, e.g. ds.field("ROC") > 0.1
+        returns:
+            DataFrame, empty if the screen was never written
+        """
+        condition = filter
+        if exchanges is not None:
+            in_exchanges = ds.field("exchange").isin([_partition_value(e) for e in exchanges])
+            condition = in_exchanges if condition is None else in_exchanges & condition
+        directory = os.path.join(self.root, "screens", f"screen={screen}")
+        return self._read(directory, columns=columns, filter=condition)
+
+    def read_screen_arrays(self, screen, columns, exchanges=None):
+        """
+        List-valued screen columns as ragged arrays over the arrow buffers.
+        returns:
+            (symbols, {column: RaggedArray}) in the same row order
+        """
+        directory = os.path.join(self.root, "screens", f"screen={screen}")
+        if not os.path.exists(directory):
+            return [], {}
+        dataset = ds.dataset(directory, format="parquet", partitioning="hive")
+        dataset = ds.dataset(directory, schema=_unified_schema(dataset), format="parquet", partitioning="hive")
+        filter = None
+        if exchanges is not None:
+            filter = ds.field("exchange").isin([_partition_value(e) for e in exchanges])
+        table = dataset.to_table(columns=["symbol"] + list(columns), filter=filter)
+        arrays = {}
+        for column in columns:
+            array = table.column(column)
+            if pa.types.is_list(array.type) or pa.types.is_large_list(array.type):
+                arrays[column] = RaggedArray.from_arrow(array)
+            else:
+                # Screens written before list columns were stored natively
+                arrays[column] = RaggedArray.from_cells(array.to_pylist())
+        return table.column("symbol").to_pylist(), arrays
+
+
+_store = None
+
+
+def get_store():
+    """The process wide store, under $PORTFOLIO_ANALYSIS_DATA/store."""
+    global _store
+    if _store is None:
+        _store = FundamentalsStore()
+    return _store
+
+
+def set_store(store):
+    global _store
+    _store = store
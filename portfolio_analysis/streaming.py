@@ -0,0 +1,128 @@
+"""
+Streaming decode for the very large FMP payloads (the stock list, as-reported
+statements, decades of daily prices).
+
+Records are parsed incrementally off the socket with ijson when it is
+installed, only the requested fields are kept, and they are packed into numpy
+column chunks every `chunk_size` rows, so peak memory stays close to the size
+of the final DataFrame instead of the whole json object tree. Without ijson
+the body is parsed in one go and then packed the same way.
+"""
+
+import numpy as np
+import pandas as pd
+
+from portfolio_analysis import jsonlib
+from portfolio_analysis.client import get_client
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+CHUNK_SIZE = 10000
+
+
+def _pack(values):
+    """Turn a list of python values into a compact numpy array."""
+    first = next((value for value in values if value is not None), None)
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        try:
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            pass
+    return np.array(values, dtype=object)
+
+
+class ColumnBuilder:
+    """
+    Accumulates records into per-column numpy chunks.
+    args:
+        fields: fields to keep, None keeps every field seen
+        chunk_size: rows buffered as python objects before packing
+    """
+
+    def __init__(self, fields=None, chunk_size=CHUNK_SIZE):
+        self.fields = list(fields) if fields is not None else None
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._chunks = {field: [] for field in self.fields or []}
+        self._buffer = {field: [] for field in self.fields or []}
+        self._buffered = 0
+
+    def _add_field(self, field):
+        # A field first seen mid-stream is missing for every earlier row
+        packed_rows = self.rows - self._buffered
+        self._chunks[field] = [np.full(packed_rows, np.nan)] if packed_rows else []
+        self._buffer[field] = [None] * self._buffered
+
+    def append(self, record):
+        if self.fields is None:
+            for field in record:
+                if field not in self._buffer:
+                    self._add_field(field)
+        for field, values in self._buffer.items():
+            values.append(record.get(field))
+        self.rows += 1
+        self._buffered += 1
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        for field, values in self._buffer.items():
+            if values:
+                self._chunks[field].append(_pack(values))
+                self._buffer[field] = []
+        self._buffered = 0
+
+    def to_frame(self):
+        self.flush()
+        columns = {
+            field: np.concatenate(chunks) if chunks else np.array([], dtype=object)
+            for field, chunks in self._chunks.items()
+        }
+        return pd.DataFrame(columns, index=pd.RangeIndex(self.rows))
+
+
+def iter_records(url, prefix="item"):
+    """
+    Yield the records under `prefix` of a json response as they are parsed.
+    args:
+        prefix: ijson prefix, "item" for a top level list or
+            "historical.item" for a list inside a "historical" key
+    """
+    response = get_client().get(url, stream=True)
+    try:
+        response.raise_for_status()
+        if ijson is not None:
+            response.raw.decode_content = True
+            records = ijson.items(response.raw, prefix, use_float=True)
+        else:
+            payload = jsonlib.loads(response.content)
+            for key in prefix.split(".")[:-1]:
+                payload = payload.get(key, []) if isinstance(payload, dict) else []
+            records = payload if isinstance(payload, list) else []
+        for record in records:
+            # FMP can answer 200 with {"Error Message": ...}, that is not a record
+            if isinstance(record, dict) and "Error Message" in record:
+                continue
+            yield record
+    finally:
+        response.close()
+
+
+def stream_frame(url, prefix="item", fields=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream a large json response straight into a DataFrame.
+    args:
+        url: the url to fetch.
+        prefix: where the records are, see iter_records
+        fields: fields to keep, None keeps everything
+    returns:
+        DataFrame with one column per field
+    """
+    builder = ColumnBuilder(fields=fields, chunk_size=chunk_size)
+    for record in iter_records(url, prefix):
+        if isinstance(record, dict):
+            builder.append(record)
+    return builder.to_frame()
@@ -0,0 +1,217 @@
+"""
+In-process metrics for the data layer.
+
+The client, cache and quota scheduler record into one process wide Telemetry:
+request latency and parse time histograms per endpoint family, bytes received,
+status codes, retries, hedges, cache results and quota tokens per lane.
+snapshot() returns everything as plain dicts, to_json()/to_prometheus() dump
+it, and by_family() ranks the endpoint families by time spent, e.g. to see
+which endpoints dominate a crawl.
+"""
+
+import json
+import math
+import threading
+
+import pandas as pd
+
+# Histogram upper bounds, seconds
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+PREFIX = "portfolio_analysis_"
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile, None if empty."""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.bounds[-1]
+
+    def to_dict(self):
+        """Buckets cumulative like Prometheus; the last bound and quantiles in it read "+Inf"."""
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            buckets[_bound_label(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": _quantile_label(self.quantile(0.5)),
+            "p95": _quantile_label(self.quantile(0.95)),
+            "buckets": buckets,
+        }
+
+
+def _bound_label(bound):
+    return "+Inf" if bound == math.inf else str(bound)
+
+
+def _quantile_label(value):
+    # json has no infinity, keep finite quantiles as numbers
+    return "+Inf" if value == math.inf else value
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Telemetry:
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1, **labels):
+        """Add to a counter, e.g. count("requests", family="quote", status=200)."""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a sample in a histogram, e.g. observe("latency_seconds", 0.3, family="quote")."""
+        key = (name, _labels(labels))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """
+        returns:
+            {"counters": [{name, labels, value}], "histograms": [{name, labels, count, sum, p50, p95, buckets}]}
+        """
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                dict({"name": name, "labels": dict(labels)}, **histogram.to_dict())
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {"counters": counters, "histograms": histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, allow_nan=False)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format."""
+        lines = []
+        snapshot = self.snapshot()
+        for name in sorted({counter["name"] for counter in snapshot["counters"]}):
+            lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            for counter in snapshot["counters"]:
+                if counter["name"] == name:
+                    lines.append(f"{PREFIX}{name}_total{_format_labels(counter['labels'])} {counter['value']}")
+        for name in sorted({histogram["name"] for histogram in snapshot["histograms"]}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for histogram in snapshot["histograms"]:
+                if histogram["name"] != name:
+                    continue
+                labels = histogram["labels"]
+                for bound, n in histogram["buckets"].items():
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(dict(labels, le=bound))} {n}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Dump to path, Prometheus text for .prom/.txt files, json otherwise."""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w") as f:
+            f.write(text)
+
+    def by_family(self):
+        """
+        One row per endpoint family, the most time spent first.
+        returns:
+            DataFrame of family, requests, seconds, p50, p95, bytes, parse_seconds,
+            retries, cache_hits, cache_misses
+        """
+        snapshot = self.snapshot()
+        rows = {}
+
+        def row(family):
+            return rows.setdefault(family, {
+                "family": family, "requests": 0, "seconds": 0.0, "p50": None, "p95": None,
+                "bytes": 0, "parse_seconds": 0.0, "retries": 0, "cache_hits": 0, "cache_misses": 0,
+            })
+
+        for counter in snapshot["counters"]:
+            family = counter["labels"].get("family")
+            if family is None:
+                continue
+            name = counter["name"]
+            if name == "requests":
+                row(family)["requests"] += counter["value"]
+            elif name == "response_bytes":
+                row(family)["bytes"] += counter["value"]
+            elif name == "retries":
+                row(family)["retries"] += counter["value"]
+            elif name == "cache":
+                key = "cache_misses" if counter["labels"].get("result") == "miss" else "cache_hits"
+                row(family)[key] += counter["value"]
+        for histogram in snapshot["histograms"]:
+            family = histogram["labels"].get("family")
+            if family is None:
+                continue
+            if histogram["name"] == "latency_seconds":
+                p50, p95 = (None if histogram[q] is None else float(histogram[q]) for q in ("p50", "p95"))
+                row(family).update(seconds=histogram["sum"], p50=p50, p95=p95)
+            elif histogram["name"] == "parse_seconds":
+                row(family)["parse_seconds"] += histogram["sum"]
+        columns = ["family", "requests", "seconds", "p50", "p95", "bytes", "parse_seconds",
+                   "retries", "cache_hits", "cache_misses"]
+        df = pd.DataFrame(list(rows.values()), columns=columns)
+        return df.sort_values("seconds", ascending=False).reset_index(drop=True)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_telemetry = Telemetry()
+
+
+def get_telemetry():
+    """The process wide Telemetry the data layer records into."""
+    return _telemetry
+
+
+def set_telemetry(telemetry):
+    global _telemetry
+    _telemetry = telemetry
@@ -0,0 +1,246 @@
+"""
+Published screen artifacts and a local mirror of them.
+
+Screens are published as Arrow IPC files with zstd compressed buffers, a
+fraction of the CSV size and no parsing on load. Mirror keeps a copy of
+each object on local disk next to a sidecar with the object's generation
+(GCS) or mtime and size (local files), so a download only happens when the
+object changed. Downloaded .arrow files are rewritten uncompressed once, so
+every read after that is a zero-copy memory map shared by all processes.
+
+Backends only need stat, download and upload; GCSBackend talks to a bucket,
+LocalBackend to a directory, e.g. for testing without GCS.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pyarrow as pa
+
+from portfolio_analysis.cache import cache_dir
+from portfolio_analysis.store import uniform_types
+
+ARROW_SUFFIX = ".arrow"
+COMPRESSION = "zstd"
+
+
+class Backend:
+    """Where published objects live."""
+
+    def stat(self, name):
+        """Version token of an object, generation or ETag like; None if it doesn't exist."""
+        raise NotImplementedError
+
+    def download(self, name, path):
+        """Copy an object to a local path, returns the version token of what was copied."""
+        raise NotImplementedError
+
+    def upload(self, path, name):
+        raise NotImplementedError
+
+
+class GCSBackend(Backend):
+    """
+    args:
+        bucket: bucket name, e.g. "robostock"
+        client: google.cloud.storage.Client, default credentials if None
+    """
+
+    def __init__(self, bucket, client=None):
+        if client is None:
+            from google.cloud import storage
+
+            client = storage.Client()
+        self.bucket = client.bucket(bucket)
+
+    def stat(self, name):
+        blob = self.bucket.get_blob(name)
+        return None if blob is None else str(blob.generation)
+
+    def download(self, name, path):
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(name)
+        # Pinned to the generation we looked at, a concurrent publish can't mix two versions
+        blob.download_to_filename(path, if_generation_match=blob.generation)
+        return str(blob.generation)
+
+    def upload(self, path, name):
+        self.bucket.blob(name).upload_from_filename(path)
+
+
+class LocalBackend(Backend):
+    """
+    args:
+        root: directory holding the objects
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def stat(self, name):
+        try:
+            info = os.stat(self._path(name))
+        except FileNotFoundError:
+            return None
+        return f"{info.st_mtime_ns}-{info.st_size}"
+
+    def download(self, name, path):
+        version = self.stat(name)
+        if version is None:
+            raise FileNotFoundError(name)
+        shutil.copyfile(self._path(name), path)
+        return version
+
+    def upload(self, path, name):
+        target = self._path(name)
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        tmp = _temp_path(target)
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+
+
+def backend_from_url(url):
+    """gs://bucket for GCS, anything else is a local directory."""
+    if url.startswith("gs://"):
+        return GCSBackend(url[len("gs://"):].strip("/"))
+    if url.startswith("file://"):
+        url = url[len("file://"):]
+    return LocalBackend(url)
+
+
+def _temp_path(path):
+    """
+    A new empty file next to path to write and then os.replace onto it.
+    Unique per call, so processes updating the same path don't share one temp file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    return tmp
+
+
+def write_arrow(frame, path, compression=COMPRESSION):
+    """Write a DataFrame as an Arrow IPC file, buffers compressed unless compression is None."""
+    table = pa.Table.from_pandas(uniform_types(frame).reset_index(drop=True), preserve_index=False)
+    _write_table(table, path, compression)
+
+
+def _write_table(table, path, compression):
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    tmp = _temp_path(path)
+    try:
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def read_arrow(path):
+    """Memory-map an Arrow IPC file, no copy for uncompressed files."""
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def publish(frame, name, backend):
+    """Upload a screen as a compressed .arrow object for Mirror.read_frame."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, os.path.basename(name))
+        write_arrow(frame, path)
+        backend.upload(path, name)
+
+
+def default_mirror_dir():
+    return cache_dir("mirror")
+
+
+class Mirror:
+    """
+    args:
+        backend: Backend to mirror
+        root: local directory, defaults to mirror/ in the cache dir
+        max_age: seconds a local copy is trusted without asking the backend
+    """
+
+    def __init__(self, backend, root=None, max_age=0):
+        self.backend = backend
+        self.root = root or default_mirror_dir()
+        self.max_age = max_age
+        os.makedirs(self.root, exist_ok=True)
+
+    def _local(self, name):
+        return os.path.join(self.root, name.replace("/", "_"))
+
+    def _meta(self, name):
+        path = self._local(name) + ".meta.json"
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_meta(self, name, version):
+        path = self._local(name) + ".meta.json"
+        tmp = _temp_path(path)
+        with open(tmp, "w") as f:
+            json.dump({"version": version, "checked": time.time()}, f)
+        os.replace(tmp, path)
+
+    def path(self, name):
+        """
+        Local path of an up to date copy of name, downloading it if it changed.
+        If the backend can't be reached an existing copy is used as it is.
+        """
+        return self._sync(name)[0]
+
+    def version(self, name):
+        """Version token of the local copy after bringing it up to date, see path()."""
+        return self._sync(name)[1]
+
+    def _sync(self, name):
+        local = self._local(name)
+        meta = self._meta(name)
+        have = os.path.exists(local) and "version" in meta
+        if have and time.time() - meta.get("checked", 0) < self.max_age:
+            return local, meta["version"]
+        try:
+            version = self.backend.stat(name)
+        except Exception as e:
+            if have:
+                print(f"Could not check {name}, using the local copy: {e}")
+                return local, meta["version"]
+            raise
+        if version is None:
+            raise FileNotFoundError(name)
+        if have and meta["version"] == version:
+            self._save_meta(name, version)
+            return local, version
+        tmp = _temp_path(local)
+        try:
+            version = self.backend.download(name, tmp)
+            if name.endswith(ARROW_SUFFIX):
+                # Decompress once here, so reads can map the file instead of inflating it each time
+                _write_table(read_arrow(tmp), local, compression=None)
+                os.remove(tmp)
+            else:
+                os.replace(tmp, local)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._save_meta(name, version)
+        return local, version
+
+    def read_table(self, name):
+        """A mirrored .arrow object as a memory-mapped arrow Table."""
+        return read_arrow(self.path(name))
+
+    def read_frame(self, name):
+        return self.read_table(name).to_pandas(split_blocks=True)
@@ -0,0 +1,156 @@
+"""
+The FMP ticker universe as a compact, indexed snapshot.
+
+The stock list is tens of thousands of rows, so it is downloaded at most once
+a day and kept as parquet with `exchange` and `type` as categoricals, sorted by
+(exchange, symbol). Each exchange is then a contiguous row range and every
+symbol has a known row, so exchange filters and symbol lookups are slices
+rather than scans. The previous day's snapshot is kept next to it so new
+listings and delistings can be diffed.
+"""
+
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from portfolio_analysis.cache import data_dir
+
+SNAPSHOT = "stock_list.parquet"
+PREVIOUS_SNAPSHOT = "stock_list.prev.parquet"
+META = "stock_list.json"
+PREVIOUS_META = "stock_list.prev.json"
+# Fields kept from the FMP stock list
+STOCK_LIST_FIELDS = ["symbol", "name", "price", "exchange", "exchangeShortName", "type"]
+
+
+class TickerUniverse:
+    """
+    args:
+        frame: stock list as returned by FMP
+        fetched_on: date the list was downloaded
+    """
+
+    def __init__(self, frame, fetched_on=None):
+        frame = frame.copy()
+        for column in ("exchange", "type", "exchangeShortName"):
+            if column in frame.columns:
+                frame[column] = frame[column].astype("category")
+        sort_by = ["exchange", "symbol"] if "exchange" in frame.columns else ["symbol"]
+        self.frame = frame.sort_values(sort_by, kind="mergesort").reset_index(drop=True)
+        self.fetched_on = fetched_on or datetime.date.today()
+        self._build_indexes()
+
+    def _build_indexes(self):
+        self.symbol_rows = {symbol: row for row, symbol in enumerate(self.frame["symbol"])}
+        self.exchange_ranges = {}
+        if "exchange" not in self.frame.columns:
+            return
+        codes = self.frame["exchange"].cat.codes.to_numpy()
+        categories = self.frame["exchange"].cat.categories
+        if len(codes) == 0:
+            return
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+        stops = np.concatenate([starts[1:], [len(codes)]])
+        for start, stop in zip(starts, stops):
+            if codes[start] >= 0:
+                self.exchange_ranges[categories[codes[start]]] = (int(start), int(stop))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def for_exchange(self, exchange):
+        """Rows listed on one exchange, an empty frame if it is unknown."""
+        start, stop = self.exchange_ranges.get(exchange, (0, 0))
+        return self.frame.iloc[start:stop]
+
+    def for_exchanges(self, exchanges):
+        return pd.concat([self.for_exchange(exchange) for exchange in exchanges])
+
+    def lookup(self, symbol):
+        """Row for a symbol, None if it isn't listed."""
+        row = self.symbol_rows.get(symbol)
+        return None if row is None else self.frame.iloc[row]
+
+    def rows(self, symbols):
+        """Frame of the listed rows for a list of symbols, in the order given."""
+        positions = [self.symbol_rows[symbol] for symbol in symbols if symbol in self.symbol_rows]
+        return self.frame.iloc[positions]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, SNAPSHOT)
+        meta_path = os.path.join(directory, META)
+        if os.path.exists(path) and os.path.exists(meta_path):
+            os.replace(path, os.path.join(directory, PREVIOUS_SNAPSHOT))
+            os.replace(meta_path, os.path.join(directory, PREVIOUS_META))
+        self.frame.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        with open(meta_path, "w") as f:
+            json.dump({"fetched_on": self.fetched_on.isoformat()}, f)
+
+    @classmethod
+    def load(cls, directory, previous=False):
+        """Read a saved snapshot, None if there isn't one."""
+        path = os.path.join(directory, PREVIOUS_SNAPSHOT if previous else SNAPSHOT)
+        meta_path = os.path.join(directory, PREVIOUS_META if previous else META)
+        if not os.path.exists(path) or not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            fetched_on = datetime.date.fromisoformat(json.load(f)["fetched_on"])
+        universe = cls.__new__(cls)
+        # Saved snapshots are already sorted and typed
+        universe.frame = pd.read_parquet(path)
+        universe.fetched_on = fetched_on
+        universe._build_indexes()
+        return universe
+
+
+def universe_dir(source):
+    """Snapshot directory for a data source, e.g. the FMP host or a stand-in."""
+    return data_dir("universe", source.replace(":", "_"))
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def load_universe(fetch, source, refresh=False):
+    """
+    The ticker universe, downloaded at most once per day per source.
+    args:
+        fetch: callable returning the FMP stock list, as records or a DataFrame
+        source: name of the data source, used to keep snapshots apart
+        refresh: download even if today's snapshot exists
+    returns:
+        TickerUniverse
+    """
+    today = datetime.date.today()
+    with _lock:
+        universe = _loaded.get(source)
+        if universe is None and not refresh:
+            universe = TickerUniverse.load(universe_dir(source))
+        if universe is None or refresh or universe.fetched_on < today:
+            fetched = fetch()
+            if not isinstance(fetched, pd.DataFrame):
+                fetched = pd.DataFrame.from_records(fetched)
+            if len(fetched) == 0 or "symbol" not in fetched.columns:
+                # An error payload or a cut off download, don't let it replace a good snapshot
+                if universe is None:
+                    universe = TickerUniverse.load(universe_dir(source))
+                if universe is None:
+                    raise ValueError(f"The stock list from {source} is empty")
+                print(f"The stock list from {source} is empty, keeping the snapshot of {universe.fetched_on}")
+            else:
+                universe = TickerUniverse(fetched, fetched_on=today)
+                universe.save(universe_dir(source))
+        _loaded[source] = universe
+    return universe
+
+
+def previous_universe(source):
+    """The snapshot replaced by the latest refresh, None if there isn't one."""
+    return TickerUniverse.load(universe_dir(source), previous=True)
@@ -0,0 +1,44 @@
+import pytest
+
+from portfolio_analysis import data
+from portfolio_analysis.cache import ResponseCache, set_cache
+from portfolio_analysis.client import FMPClient, set_client
+from portfolio_analysis.scheduler import QuotaScheduler, set_scheduler
+from portfolio_analysis.standin import start_in_thread
+
+
+@pytest.fixture(autouse=True)
+def data_dirs(tmp_path, monkeypatch):
+    """Durable state and the cache of every test go to its own tmp dir."""
+    monkeypatch.setenv("PORTFOLIO_ANALYSIS_DATA", str(tmp_path / "data"))
+    monkeypatch.setenv("PORTFOLIO_ANALYSIS_CACHE", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def standin(tmp_path):
+    """
+    Start a synthetic stand-in and point data.py at it, e.g. standin(error_rate=1.0).
+    Each call replaces the previous server, all are shut down after the test.
+    """
+    servers = []
+
+    def start(**config):
+        config.setdefault("universe_size", 20)
+        config.setdefault("corpus", str(tmp_path / "no-corpus"))
+        server, url = start_in_thread(**config)
+        servers.append(server)
+        data.set_base_url(url)
+        # Fresh process wide state, so nothing is served from another server's cache
+        set_cache(ResponseCache())
+        set_client(FMPClient(retries=1, backoff=0.01, hedge=False))
+        set_scheduler(QuotaScheduler(per_minute=100000))
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    data.set_base_url()
+    set_cache(None)
+    set_client(None)
+    set_scheduler(None)
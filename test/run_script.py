@@ -1,9 +1,20 @@
+import os
 import pickle
 import pandas as pd
-from portfolio_analysis.data import get_single_company_data, get_all_company_tickers, save_company_metrics, get_company_profile
-from portfolio_analysis.dcf import get_irr, get_dividend_ratio, analyse_single_company_data
+from portfolio_analysis.data import get_bulk_company_data, get_all_company_tickers, get_ticker_universe, get_previous_ticker_universe, save_company_metrics, get_company_profile
+from portfolio_analysis.dcf import get_irr, get_dividend_ratio, analyse_single_company_data, get_roc_earnings_panel
 from portfolio_analysis.api import apikey
-import json
+from portfolio_analysis.history import StatementHistory
+from portfolio_analysis.ledger import JobLedger
+from portfolio_analysis.metrics_db import get_metrics_db, long_metrics
+from portfolio_analysis.planner import plan_refresh
+from portfolio_analysis.sink import ResultSink, run_dir
+from portfolio_analysis.snapshots import SnapshotLog, default_snapshot_dir
+from portfolio_analysis.store import get_store
+from portfolio_analysis.panel import Panel, default_panel_path, frame_from_store
+from portfolio_analysis.telemetry import get_telemetry
+from portfolio_analysis.transport import backend_from_url, publish
+from datetime import date
 
 company_names = get_all_company_tickers(apikey)
 
@@ -39,66 +50,113 @@ exchange_filter = ['New York Stock Exchange Arca', 'Nasdaq Global Select',
        'Nasdaq Capital Market', 'NASDAQ', 'Nasdaq',  'NYSE American', 'NASDAQ Capital Market', 'NSE','Canadian Sec','National Stock Exchange of India','BSE']
 
 exchange_filter = ['Other OTC']
-filename = 'jkt_asx_companies.csv'
-exception_file = 'test/exceptions.json'
+screen = 'jkt_asx_companies'
+# One ledger run per screen per month, rerunning the script resumes it
+ledger = JobLedger(f"{screen}-{date.today():%Y-%m}")
+# Failed symbols to try again: "none", "transient" (timeouts, 429s, 5xx) or "all"
+retry = "transient"
 
-df = pd.read_csv(filename).iloc[:,1:]
+store = get_store()
+# The exchange comes back from the store's partitioning, it is merged in again at the end
+df = store.read_screen(screen).drop(columns=["exchange"], errors="ignore")
 # df = pd.DataFrame()
 filtered_company_list = company_names[company_names.exchange.isin(exchange_filter)]
 # filtered_company_list.query("symbol == 'KEL.DE'")
 # 
 irr_df = df
-change_df = pd.DataFrame()
-company_metrics_dict = {}
-with open(exception_file, 'r') as openfile:
- 
-    # Reading from json file
-    exceptions = json.load(openfile)
+# Rows go to disk in batches as they come, a crash keeps what was done
+irr_sink = ResultSink(run_dir(f"{screen}_irr"))
+yearly_sink = ResultSink(run_dir(f"{screen}_yearly"))
+metrics_sink = ResultSink(run_dir(f"{screen}_metrics"))
+exchanges = dict(zip(company_names.symbol, company_names.exchange))
+raw_batch = {}
 # cutoff= int(input("number of companies:"))
 cutoff = 10000000000
 breakpoint()
-for index, company in filtered_company_list.iterrows():
-    symbol = company.loc['symbol']
-    if symbol in irr_df.symbol.unique():
-        continue
+history = StatementHistory()
+# Only rerun symbols with a likely new filing, a new listing or a moved price
+done_prices = irr_df.drop_duplicates("symbol", keep="last").set_index("symbol")["price"] if len(irr_df) > 0 else None
+work = plan_refresh(
+    get_ticker_universe(apikey),
+    history,
+    symbols=filtered_company_list.symbol,
+    previous=get_previous_ticker_universe(),
+    done_prices=done_prices,
+)
+print(work.reason.value_counts())
+delisted = work.symbol[work.reason == "delisted"]
+if len(irr_df) > 0:
+    irr_df = irr_df[~irr_df.symbol.isin(delisted)]
+# Done symbols whose results were lost with an unflushed sink batch are run again
+saved = irr_sink.symbols()
+candidates = work.symbol[work.reason != "delisted"]
+symbols = [
+    symbol for symbol in candidates
+    if ledger.should_run(symbol, retry=retry) or (ledger.is_done(symbol) and symbol not in saved)
+]
+print(ledger.stats())
+# Bulk files cover most of the universe in a few dozen requests, gaps go per symbol
+for symbol, cd in get_bulk_company_data(symbols, apikey, concurrency=8, history=history, on_error=ledger.fail):
     print(f"running analysis for symbol :{symbol}")
-    cd = get_single_company_data(symbol, apikey)
+    if cd is None:
+        continue
+    ledger.start(symbol)
+    raw_batch[symbol] = cd
+    if len(raw_batch) >= 500:
+        store.write_company_data(raw_batch, exchanges)
+        raw_batch = {}
     # if len(irr_df) > cutoff:
     #     break
     try:
         irr = get_irr(cd, symbol, discount_rate=0.05)
-        irr_df = irr_df.append(irr, ignore_index=True)
+        irr_sink.append(irr)
         analysis = analyse_single_company_data(cd, money_only=False)
-        analysis = analysis.sort_values('year')
-        analysis.loc[:, "revenue_change"] = analysis.loc[:, "revenue"].pct_change()
-        change_dict = {}
-        change_dict["symbol"] = symbol
-        for year in [2022, 2021, 2020, 2019, 2018, 2017]:
-            if len(analysis.query(f'year == {year}')) == 1:
-                year_df = analysis.query(f'year == {year}')
-                change_dict[f"revenue_{year}"] = year_df.iloc[0].loc["revenue"]
-                change_dict[f"revenue_change_{year}"] = year_df.iloc[0].loc["revenue_change"]
-                change_dict[f"roc_{year}"] = year_df.iloc[0].loc["ROC"]
-                change_dict[f"dividendsPaid_{year}"] = year_df.iloc[0].loc["dividendsPaid"]
-                change_dict[f"dividend_ratio_{year}"] = year_df.iloc[0].loc["dividend_payout_ratio"]
-                change_dict[f"gross_margin_{year}"] = (year_df.iloc[0].loc["revenue"] - year_df.iloc[0].loc["costOfRevenue"]) /  year_df.iloc[0].loc["revenue"]
-        change_df = change_df.append(pd.Series(change_dict), ignore_index=True)
-        print("% Complete", round((len(irr_df)/len(filtered_company_list))*100,4), "%")
-    except Exception:
+        # Every reported year in long format, queried later through the metrics db
+        yearly_sink.append_frame(long_metrics(analysis), symbol=symbol)
+        ledger.succeed(symbol)
+        print("% Complete", round(((len(irr_df) + len(irr_sink))/len(filtered_company_list))*100,4), "%")
+    except Exception as e:
         print("Exception", {symbol})
-        exceptions["exceptions"] += [symbol]
+        ledger.fail(symbol, e)
     try:
         combined_metrics = save_company_metrics(cd)
-        company_metrics_dict[symbol] = combined_metrics
+        metrics_sink.append_frame(combined_metrics, symbol=symbol)
         print("Done", symbol)
     except:
         pass
+store.write_company_data(raw_batch, exchanges)
+# Memory-mapped symbols x periods x fields panel for vectorised screens
+panel = Panel.build(default_panel_path(), frame_from_store(store, exchanges=exchange_filter))
 breakpoint()
 
+# Old rows are replaced only by a new result, symbols skipped or failed this run keep theirs
+new_irr = irr_sink.to_frame()
+if len(irr_df) > 0 and len(new_irr) > 0:
+    irr_df = irr_df[~irr_df.symbol.isin(new_irr.symbol)]
+irr_df = pd.concat([irr_df, new_irr], ignore_index=True)
+metrics_db = get_metrics_db()
+metrics_db.write(yearly_sink.to_frame())
+yearly_sink.clear()
+# e.g. metrics_db.consistent("ROC", 0.15, years=5), or metrics_db.wide() for the old change_df
+metrics_sink.close()
 irr_merged = irr_df.merge(company_names[["symbol","exchange"]], on="symbol")
-# irr_merged = irr_merged.merge(change_df, on='symbol')
+# ROC averaged over the trend years, for every stored symbol at once from the panel
+roc_trend = get_roc_earnings_panel(panel)[["ROC_mean"]]
+irr_merged = irr_merged.drop(columns=["ROC_mean"], errors="ignore").merge(roc_trend, left_on="symbol", right_index=True, how="left")
+# irr_merged = irr_merged.merge(metrics_db.wide(years=range(2017, 2023)), on='symbol')
+
+# Delisted symbols leave the stored screen, otherwise they'd come back every run
+store.write_screen(screen, irr_merged, drop=delisted)
+irr_sink.clear()
+# Monthly versions of the screen as a base plus deltas, see what moved since last run
+snapshots = SnapshotLog(default_snapshot_dir(screen))
+print(snapshots.commit(irr_merged, label=f"{date.today():%Y-%m}"))
+print(snapshots.changes().change.value_counts())
+# Compressed arrow copy for the dashboard's mirror, e.g. PORTFOLIO_ANALYSIS_PUBLISH=/tmp/published
+publish(irr_merged, f"{screen}.arrow", backend_from_url(os.environ.get("PORTFOLIO_ANALYSIS_PUBLISH", "gs://robostock")))
 
-irr_merged.to_csv(filename)
+print(ledger.stats())
 
-with open(exception_file, "w") as outfile:
-    json.dump(exceptions, outfile)
\ No newline at end of file
+# Where the crawl time went, per endpoint family
+print(get_telemetry().by_family())
+get_telemetry().write("test/telemetry.json")
\ No newline at end of file
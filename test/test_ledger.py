@@ -0,0 +1,75 @@
+import requests
+
+from portfolio_analysis.data import get_many_company_data
+from portfolio_analysis.ledger import MAX_ATTEMPTS, JobLedger
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+
+def test_resume_after_crash(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    ledger = JobLedger("nyse-2024-05", path)
+    ledger.start("DONE")
+    ledger.succeed("DONE")
+    ledger.start("CRASHED")  # never finished, as if the process died here
+    ledger.start("BROKEN")
+    ledger.fail("BROKEN", KeyError("revenue"))
+    ledger.fail("FLAKY", http_error(503))
+
+    resumed = JobLedger("nyse-2024-05", path)
+    assert resumed.is_done("DONE")
+    assert resumed.pending(["DONE", "CRASHED", "BROKEN", "FLAKY", "NEW"]) == ["CRASHED", "FLAKY", "NEW"]
+    assert resumed.pending(["BROKEN", "FLAKY"], retry="all") == ["BROKEN", "FLAKY"]
+    assert resumed.pending(["BROKEN", "FLAKY"], retry="none") == []
+    # Runs are tracked apart
+    assert JobLedger("nyse-2024-06", path).pending(["DONE"]) == ["DONE"]
+
+
+def test_transient_failures_stop_after_max_attempts(tmp_path):
+    ledger = JobLedger("run", str(tmp_path / "ledger.sqlite"))
+    for _ in range(MAX_ATTEMPTS + 2):
+        if ledger.should_run("FLAKY"):
+            ledger.fail("FLAKY", http_error(429))
+    jobs = ledger.jobs().set_index("symbol")
+    assert jobs.loc["FLAKY", "attempts"] == MAX_ATTEMPTS
+    assert not ledger.should_run("FLAKY")
+    assert ledger.stats() == {"status": {"failed": 1}, "errors": {"HTTPError": 1}}
+
+
+def test_succeed_clears_failure(tmp_path):
+    ledger = JobLedger("run", str(tmp_path / "ledger.sqlite"))
+    ledger.start("A")
+    ledger.fail("A", http_error(500))
+    ledger.start("A")
+    ledger.succeed("A")
+    assert ledger.is_done("A")
+    assert not ledger.should_run("A", retry="all")
+    assert ledger.jobs().set_index("symbol").loc["A", "attempts"] == 2
+
+
+def test_crawl_records_failures(tmp_path, standin):
+    symbols = ["SYN0000", "SYN0001", "SYN0002"]
+    ledger = JobLedger("run", str(tmp_path / "ledger.sqlite"))
+
+    standin(error_rate=1.0)
+    for _ in range(MAX_ATTEMPTS):
+        results = dict(get_many_company_data(ledger.pending(symbols), "key", on_error=ledger.fail))
+        assert all(cd is None for cd in results.values())
+    jobs = ledger.jobs().set_index("symbol")
+    assert (jobs.loc[symbols, "error_class"] == "HTTPError").all()
+    assert (jobs.loc[symbols, "transient"] == 1).all()
+    assert (jobs.loc[symbols, "attempts"] == MAX_ATTEMPTS).all()
+    assert ledger.pending(symbols) == []
+
+    # The errors are gone, only retry="all" with more attempts picks them up again
+    standin()
+    todo = ledger.pending(symbols, retry="all", max_attempts=MAX_ATTEMPTS + 1)
+    for symbol, cd in get_many_company_data(todo, "key", on_error=ledger.fail):
+        assert cd is not None and len(cd["IS"]) > 0
+        ledger.start(symbol)
+        ledger.succeed(symbol)
+    assert all(ledger.is_done(symbol) for symbol in symbols)
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from portfolio_analysis.data import get_cash_flow_statement, get_income_statement
+from portfolio_analysis.metrics_db import MetricsDB, long_metrics
+
+YEARS = [2022, 2021, 2020, 2019, 2018, 2017]
+
+
+def analysis_for(symbol):
+    """The columns of dcf.analyse_single_company_data that the screens use, from the stand-in."""
+    IS = get_income_statement(symbol, apikey="key")
+    CFS = get_cash_flow_statement(symbol, apikey="key")
+    df = IS.merge(CFS[["date", "dividendsPaid"]], on="date")
+    df["year"] = pd.to_datetime(df["date"]).dt.year
+    df["ROC"] = df["operatingIncome"] / df["revenue"]
+    df["dividend_payout_ratio"] = abs(df["dividendsPaid"]) / df["netIncome"]
+    return df[["year", "revenue", "costOfRevenue", "ROC", "dividendsPaid", "dividend_payout_ratio"]]
+
+
+def change_dict(symbol, analysis):
+    """One row of the old change_df, as test/run_script.py built it before the metrics db."""
+    analysis = analysis.sort_values("year")
+    analysis.loc[:, "revenue_change"] = analysis.loc[:, "revenue"].pct_change()
+    row = {"symbol": symbol}
+    for year in YEARS:
+        if len(analysis.query(f"year == {year}")) == 1:
+            year_df = analysis.query(f"year == {year}")
+            row[f"revenue_{year}"] = year_df.iloc[0].loc["revenue"]
+            row[f"revenue_change_{year}"] = year_df.iloc[0].loc["revenue_change"]
+            row[f"roc_{year}"] = year_df.iloc[0].loc["ROC"]
+            row[f"dividendsPaid_{year}"] = year_df.iloc[0].loc["dividendsPaid"]
+            row[f"dividend_ratio_{year}"] = year_df.iloc[0].loc["dividend_payout_ratio"]
+            row[f"gross_margin_{year}"] = (year_df.iloc[0].loc["revenue"] - year_df.iloc[0].loc["costOfRevenue"]) / year_df.iloc[0].loc["revenue"]
+    return row
+
+
+def test_wide_matches_change_df(standin):
+    standin()
+    db = MetricsDB(":memory:")
+    symbols = ["SYN0000", "SYN0001", "SYN0002"]
+    rows = []
+    for symbol in symbols:
+        analysis = analysis_for(symbol)
+        db.write(long_metrics(analysis).assign(symbol=symbol))
+        rows.append(change_dict(symbol, analysis))
+    change_df = pd.DataFrame(rows)
+
+    wide = db.wide(years=YEARS)
+    assert list(wide.columns) == list(change_df.columns)
+    wide = wide.set_index("symbol").loc[symbols]
+    expected = change_df.set_index("symbol")
+    for column in expected.columns:
+        assert wide[column].tolist() == pytest.approx(expected[column].tolist(), nan_ok=True)
+
+
+def test_consistent():
+    db = MetricsDB(":memory:")
+    db.write(pd.DataFrame({
+        "symbol": ["A"] * 3 + ["B"] * 3,
+        "year": [2020, 2021, 2022] * 2,
+        "metric": "ROC",
+        "value": [0.2, 0.3, 0.25, 0.2, 0.1, 0.4],
+    }))
+    assert db.consistent("ROC", 0.15, years=3)["symbol"].tolist() == ["A"]
+    assert db.consistent("ROC", 0.15, years=1)["symbol"].tolist() == ["B", "A"]
+    # Writing a symbol again replaces its rows
+    db.write(pd.DataFrame({"symbol": ["B"], "year": [2022], "metric": ["ROC"], "value": [0.05]}))
+    assert db.history("B")["ROC"].tolist() == [0.05]
+    with pytest.raises(ValueError):
+        db.consistent("ROC", 0.15, comparison="; DROP TABLE metrics")
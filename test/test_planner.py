@@ -0,0 +1,66 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from portfolio_analysis.data import get_previous_ticker_universe, get_ticker_universe, refresh_statement
+from portfolio_analysis.history import StatementHistory
+from portfolio_analysis.planner import plan_refresh
+from portfolio_analysis.universe import TickerUniverse, load_universe
+
+
+def test_plan_refresh(tmp_path, standin):
+    standin()
+    universe = get_ticker_universe("key", refresh=True)
+    assert len(universe) == 20
+    frame = universe.frame.astype({"exchange": str, "type": str, "exchangeShortName": str})
+    previous = TickerUniverse(pd.concat([
+        frame[frame.symbol != "SYN0019"],
+        pd.DataFrame([{"symbol": "OLD", "exchange": "Toronto", "price": 1.0}]),
+    ]))
+
+    history = StatementHistory(str(tmp_path / "statements"))
+    for symbol in ("SYN0000", "SYN0001"):
+        refresh_statement(symbol, "income-statement", history, apikey="key")
+    latest = datetime.date.fromisoformat(history.load("SYN0000", "income-statement")[0]["date"][:10])
+    prices = dict(zip(frame.symbol, frame.price))
+    done_prices = pd.Series({
+        "SYN0000": prices["SYN0000"],
+        "SYN0001": prices["SYN0001"] * 2,
+        "SYN0002": prices["SYN0002"],
+        "OLD": 1.0,
+    })
+
+    work = plan_refresh(
+        universe,
+        history,
+        symbols=["SYN0000", "SYN0001", "SYN0002", "SYN0003", "SYN0019"],
+        previous=previous,
+        done_prices=done_prices,
+        # A month after the latest period end, the next filing isn't due
+        today=latest + datetime.timedelta(days=30),
+    )
+    assert dict(zip(work.symbol, work.reason.astype(str))) == {
+        "SYN0001": "price_moved",
+        "SYN0002": "no_history",
+        "SYN0003": "not_analysed",
+        "SYN0019": "new_listing",
+        "OLD": "delisted",
+    }
+
+    # Half a year past the next period end the filing is due
+    today = latest + datetime.timedelta(days=365 + 180)
+    work = plan_refresh(universe, history, symbols=["SYN0000"], done_prices=done_prices, today=today)
+    assert work.set_index("symbol").reason.astype(str).to_dict() == {"SYN0000": "filing_due", "OLD": "delisted"}
+
+
+def test_empty_stock_list_keeps_snapshot(standin):
+    server = standin()
+    source = f"127.0.0.1:{server.server_address[1]}"
+    universe = get_ticker_universe("key", refresh=True)
+    error = pd.DataFrame({"Error Message": ["Limit Reach"]})
+    kept = load_universe(lambda: error, source, refresh=True)
+    assert kept.frame["symbol"].tolist() == universe.frame["symbol"].tolist()
+    assert get_previous_ticker_universe() is None
+    with pytest.raises(ValueError):
+        load_universe(lambda: [], "nothing-saved:0", refresh=True)
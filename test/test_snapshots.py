@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from portfolio_analysis.data import get_all_company_tickers
+from portfolio_analysis.snapshots import CHECKPOINT_EVERY, SnapshotLog
+
+
+def screen_frame():
+    """A small screen built from the stand-in's stock list."""
+    tickers = get_all_company_tickers("key")
+    df = pd.DataFrame({
+        "symbol": tickers["symbol"].astype(str).to_numpy(),
+        "price": tickers["price"].astype(float).to_numpy(),
+        "exchange": tickers["exchange"].astype(str).to_numpy(),
+    })
+    df["ROC"] = np.linspace(-0.1, 0.4, len(df))
+    df["revenue_trend"] = [[float(i), float(i) - 1.0] for i in range(len(df))]
+    return df.sort_values("symbol").reset_index(drop=True)
+
+
+def assert_same(left, right):
+    left = left.sort_values("symbol").reset_index(drop=True)
+    right = right.sort_values("symbol").reset_index(drop=True)
+    assert list(left.columns) == list(right.columns)
+    for column in left.columns:
+        for a, b in zip(left[column], right[column]):
+            if isinstance(a, (list, np.ndarray)):
+                assert list(a) == list(b)
+            elif pd.isna(a):
+                assert pd.isna(b)
+            else:
+                assert a == b
+
+
+def test_base_and_delta_round_trip(tmp_path, standin):
+    standin()
+    log = SnapshotLog(str(tmp_path / "screen"))
+    first = screen_frame()
+    assert log.commit(first, label="2024-04")["kind"] == "base"
+
+    second = first.copy()
+    second.loc[0, "price"] += 1.0
+    second.loc[1, "ROC"] = np.nan  # a change to missing is kept apart from "unchanged"
+    second.at[2, "revenue_trend"] = [9.0]
+    second = second.drop(index=3)
+    second = pd.concat([second, pd.DataFrame([{
+        "symbol": "NEW", "price": 1.5, "exchange": "Toronto", "ROC": 0.2, "revenue_trend": [1.0],
+    }])], ignore_index=True)
+    entry = log.commit(second, label="2024-05")
+    assert entry["kind"] == "delta"
+    assert (entry["inserted"], entry["updated"], entry["removed"]) == (1, 3, 1)
+
+    # A fresh log reads everything back from disk, base plus delta
+    reopened = SnapshotLog(str(tmp_path / "screen"))
+    assert_same(reopened.read("2024-04"), first)
+    assert_same(reopened.read(), second)
+    changes = reopened.changes()
+    assert set(changes.loc[changes.change == "updated", "column"]) == {"price", "ROC", "revenue_trend"}
+    assert list(changes.loc[changes.change == "removed", "symbol"]) == [first.symbol[3]]
+
+
+def test_checkpoints(tmp_path, standin):
+    standin()
+    log = SnapshotLog(str(tmp_path / "screen"))
+    frames = [screen_frame()]
+    log.commit(frames[0])
+    for i in range(CHECKPOINT_EVERY):
+        frame = frames[-1].copy()
+        frame.loc[i, "price"] += 1.0
+        frames.append(frame)
+        log.commit(frame)
+    assert [entry["kind"] for entry in log.versions] == ["base"] + ["delta"] * (CHECKPOINT_EVERY - 1) + ["base"]
+
+    # Touching most rows writes a base straight away
+    frames.append(frames[-1].assign(price=frames[-1].price * 2))
+    assert log.commit(frames[-1])["kind"] == "base"
+
+    reopened = SnapshotLog(str(tmp_path / "screen"))
+    for version, frame in enumerate(frames):
+        assert_same(reopened.read(version), frame)
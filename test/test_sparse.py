@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from portfolio_analysis import data
+from portfolio_analysis.data import save_as_reported_statements
+from portfolio_analysis.sparse import META_FIELDS, SparseStatements, SparseWriter
+from portfolio_analysis.streaming import iter_records
+
+
+def reported(symbol):
+    """The stand-in's as-reported payload for symbol, straight from the endpoint."""
+    url = f"{data.BASE_URL}/api/v3/financial-statement-full-as-reported/{symbol}?apikey=key"
+    return list(iter_records(url, "item"))
+
+
+def check_against_payload(statements, symbol, records):
+    tags = sorted({tag for record in records for tag in record if tag not in META_FIELDS})
+    df = statements.select(tags, symbols=[symbol])
+    assert list(df["date"]) == [record["date"] for record in records]
+    for row, record in zip(df.itertuples(index=False), records):
+        for tag in tags:
+            value = getattr(row, tag)
+            if tag in record:
+                assert value == pytest.approx(record[tag])
+            else:
+                assert np.isnan(value)
+
+
+def test_save_and_merge(tmp_path, standin):
+    standin()
+    path = str(tmp_path / "as_reported")
+    first = save_as_reported_statements(["SYN0000", "SYN0001"], "key", path=path)
+    assert first.symbols == ["SYN0000", "SYN0001"]
+    check_against_payload(first, "SYN0000", reported("SYN0000"))
+    assert 0 < first.density < 0.5
+
+    # A later save adds to the file, the companies already there stay
+    merged = save_as_reported_statements(["SYN0002"], "key", path=path)
+    assert sorted(merged.symbols) == ["SYN0000", "SYN0001", "SYN0002"]
+    for symbol in merged.symbols:
+        check_against_payload(merged, symbol, reported(symbol))
+
+    # Failed fetches keep what was stored
+    failing = standin(error_rate=1.0)
+    kept = save_as_reported_statements(["SYN0000"], "key", path=path)
+    assert failing.config.counters["errors"] > 0
+    assert sorted(kept.symbols) == ["SYN0000", "SYN0001", "SYN0002"]
+    standin()
+    check_against_payload(SparseStatements.open(path), "SYN0000", reported("SYN0000"))
+
+
+def test_failed_payload_adds_nothing(tmp_path):
+    writer = SparseWriter(str(tmp_path / "s"))
+    writer.add("A", [{"date": "2023-12-31", "period": "FY", "Revenues": 10, "Assets": 5}])
+
+    def cut_off():
+        yield {"date": "2023-12-31", "period": "FY", "Revenues": 1, "OnlyInB": 2}
+        raise ConnectionError("connection dropped")
+
+    with pytest.raises(ConnectionError):
+        writer.add("B", cut_off())
+    assert writer.add("C", []) == 0
+    statements = writer.close()
+    assert statements.symbols == ["A"]
+    assert statements.tags == ["Revenues", "Assets"]
+    assert statements.select(["Assets"])["Assets"].tolist() == [5.0]
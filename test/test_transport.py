@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+import pytest
+
+from portfolio_analysis.data import get_all_company_tickers
+from portfolio_analysis.transport import Backend, LocalBackend, Mirror, publish, read_arrow
+
+
+class GenerationBackend(Backend):
+    """Wraps a LocalBackend with GCS style generation numbers and counts downloads."""
+
+    def __init__(self, root):
+        self.local = LocalBackend(root)
+        self.generations = {}
+        self.downloads = 0
+        self.reachable = True
+
+    def stat(self, name):
+        if not self.reachable:
+            raise ConnectionError("bucket unreachable")
+        return self.generations.get(name)
+
+    def download(self, name, path):
+        self.downloads += 1
+        self.local.download(name, path)
+        return self.generations[name]
+
+    def upload(self, path, name):
+        self.local.upload(path, name)
+        self.generations[name] = str(int(self.generations.get(name, "0")) + 1)
+
+
+def screen(tickers):
+    return pd.DataFrame({
+        "symbol": tickers["symbol"].astype(str).to_numpy(),
+        "price": tickers["price"].astype(float).to_numpy(),
+    })
+
+
+def test_mirror_downloads_only_new_generations(tmp_path, standin):
+    standin()
+    tickers = get_all_company_tickers("key")
+    backend = GenerationBackend(str(tmp_path / "bucket"))
+    mirror = Mirror(backend, root=str(tmp_path / "mirror"))
+
+    publish(screen(tickers.head(5)), "screens/mf.arrow", backend)
+    assert len(mirror.read_frame("screens/mf.arrow")) == 5
+    assert mirror.version("screens/mf.arrow") == "1"
+    assert backend.downloads == 1
+    # Same generation, the local copy is used as it is
+    assert read_arrow(mirror.path("screens/mf.arrow")).num_rows == 5
+    assert backend.downloads == 1
+
+    publish(screen(tickers.head(8)), "screens/mf.arrow", backend)
+    assert len(mirror.read_frame("screens/mf.arrow")) == 8
+    assert mirror.version("screens/mf.arrow") == "2"
+    assert backend.downloads == 2
+
+    # An unreachable bucket falls back to the local copy
+    backend.reachable = False
+    assert len(mirror.read_frame("screens/mf.arrow")) == 8
+    # Only the mirrored files are left, no temp files
+    assert sorted(os.listdir(tmp_path / "mirror")) == ["screens_mf.arrow", "screens_mf.arrow.meta.json"]
+
+
+def test_mirror_max_age(tmp_path, standin):
+    standin()
+    backend = GenerationBackend(str(tmp_path / "bucket"))
+    publish(screen(get_all_company_tickers("key")), "mf.arrow", backend)
+    mirror = Mirror(backend, root=str(tmp_path / "mirror"), max_age=3600)
+    assert mirror.version("mf.arrow") == "1"
+    publish(screen(get_all_company_tickers("key").head(1)), "mf.arrow", backend)
+    # Trusted without asking the bucket until max_age passes
+    assert mirror.version("mf.arrow") == "1"
+    assert Mirror(backend, root=str(tmp_path / "mirror")).version("mf.arrow") == "2"
+
+
+def test_missing_object(tmp_path):
+    mirror = Mirror(GenerationBackend(str(tmp_path / "bucket")), root=str(tmp_path / "mirror"))
+    with pytest.raises(FileNotFoundError):
+        mirror.path("nothing.arrow")